@@ -0,0 +1,255 @@
+"""
+JSON API แบบ stateless สำหรับระบบ HIS/EHR เรียกใช้ logic คำนวณขนาดยาเดียวกับ LINE bot (ไม่ต้องผ่าน LINE)
+
+- ทุก endpoint อยู่ใต้ /api/v1 และต้องส่ง Authorization: Bearer <API_TOKEN> (ไม่กำหนด API_TOKEN → 404)
+- catalog (รายชื่อยา / ข้อบ่งใช้) สร้าง JSON ครั้งเดียวต่อ formulary version เก็บใน snapshot.cache
+  ตอบพร้อม ETag = version ของ formulary และ Cache-Control → client ส่ง If-None-Match ได้ 304
+- การคำนวณเรียก compute_dose / warfarin_plan ตัวเดียวกับ handle_message (audit, tracing, cache เดียวกัน)
+- batch รับ JSON array หรือ NDJSON (ทีละบรรทัด) แล้วตอบเป็น NDJSON แบบ stream ทีละผลลัพธ์
+  ทั้ง batch pin formulary version เดียว และอ่าน body ทีละบรรทัดจึงใช้หน่วยความจำคงที่
+    GET  /api/v1/drugs
+    GET  /api/v1/drugs/<drug>/indications
+    POST /api/v1/doses              {"drug", "indication", "weight", "age", "locale"}
+    POST /api/v1/doses/batch        NDJSON หรือ [{...}, ...]
+    POST /api/v1/warfarin           {"inr", "twd", "bleeding", "supplement", "locale"}
+    POST /api/v1/warfarin/batch     NDJSON หรือ [{...}, ...]
+"""
+import hmac
+import json
+import logging
+import math
+
+from flask import Blueprint, Response, abort, request, stream_with_context
+
+API_USER = "api"
+NDJSON = "application/x-ndjson"
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json(payload, status=200, headers=None):
+    return Response(_dumps(payload), status=status, mimetype="application/json", headers=headers)
+
+
+def _number(body, name, required=True, minimum=0.0, maximum=math.inf):
+    value = body.get(name)
+    if value is None:
+        if required:
+            raise ApiError(400, f"ต้องระบุ {name}")
+        return None
+    if isinstance(value, bool):
+        raise ApiError(400, f"{name} ต้องเป็นตัวเลข")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{name} ต้องเป็นตัวเลข")
+    if not math.isfinite(number) or number < minimum:
+        raise ApiError(400, f"{name} ต้องไม่น้อยกว่า {minimum:g}")
+    if number > maximum:
+        raise ApiError(400, f"{name} ต้องไม่เกิน {maximum:g}")
+    return number
+
+
+def _locale(body, locales):
+    locale = body.get("locale") or locales[0]
+    if locale not in locales:
+        raise ApiError(400, f"locale ต้องเป็นหนึ่งใน {', '.join(locales)}")
+    return locale
+
+
+def _result_status(text):
+    # calculator ตอบข้อความปฏิเสธ (อายุไม่ถึง, ยังไม่รองรับ ฯลฯ) ขึ้นต้นด้วย ❌
+    return "rejected" if text.startswith("❌") else "ok"
+
+
+def create_api(store, resolve_drug, compute_dose, warfarin_plan, token=None, batch_limit=10000, max_twd=150.0,
+               max_weight=250.0, locales=("th",)):
+    """
+    store: FormularyStore, resolve_drug(name) → (ชื่อจริง, kind) หรือ None
+    compute_dose(user_id, drug, indication, weight, age, locale) → ข้อความ
+    warfarin_plan(user_id, inr, twd, bleeding, supplement, locale) → dict
+    max_twd: TWD สูงสุดที่รับ (mg/สัปดาห์), max_weight: น้ำหนักสูงสุดที่รับ (kg)
+    locales: ภาษาของข้อความผลลัพธ์ที่รองรับ (ตัวแรกเป็นค่าเริ่มต้น)
+    """
+    api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+    @api.before_request
+    def authorize():
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(401)
+
+    @api.errorhandler(ApiError)
+    def api_error(e):
+        return _json({"error": e.message}, e.status)
+
+    # ---------- catalog ----------
+
+    def catalog(name, build):
+        """ตอบ JSON ที่สร้างครั้งเดียวต่อ formulary version พร้อม ETag"""
+        snapshot = store.snapshot()
+        etag = f"{snapshot.version}-{name}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            body = snapshot.cache(f"api:{name}", lambda: _dumps(build(snapshot)).encode("utf-8"))
+            response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "public, max-age=300, must-revalidate"
+        return response
+
+    @api.get("/drugs")
+    def list_drugs():
+        def build(snapshot):
+            drugs = []
+            for kind, table in (("dose", snapshot.drugs), ("special", snapshot.special_drugs)):
+                for drug, info in table.items():
+                    drugs.append({
+                        "name": drug,
+                        "kind": kind,
+                        "concentration_mg_per_ml": info.get("concentration_mg_per_ml"),
+                        "pack_sizes_ml": info.get("pack_sizes_ml"),
+                        "indications": list(info["indications"]),
+                    })
+            return {"formulary": snapshot.version, "drugs": drugs}
+        return catalog("drugs", build)
+
+    @api.get("/drugs/<path:drug>/indications")
+    def list_indications(drug):
+        found = resolve_drug(drug)
+        if found is None:
+            raise ApiError(404, f"ไม่พบยา {drug}")
+        drug, kind = found
+
+        def build(snapshot):
+            table = snapshot.drugs if kind == "dose" else snapshot.special_drugs
+            return {
+                "formulary": snapshot.version,
+                "drug": drug,
+                "kind": kind,
+                "indications": [
+                    {"name": name, "regimens": data}  # FrozenDict/FrozenList เป็น dict/list จึง serialize ได้ตรง ๆ
+                    for name, data in table[drug]["indications"].items()
+                ],
+            }
+        return catalog(f"indications:{drug}", build)
+
+    # ---------- การคำนวณ ----------
+
+    def dose(body):
+        if not isinstance(body, dict):
+            raise ApiError(400, "request ต้องเป็น JSON object")
+        found = resolve_drug(str(body.get("drug") or ""))
+        if found is None:
+            raise ApiError(404, f"ไม่พบยา {body.get('drug')}")
+        drug, kind = found
+        indication = body.get("indication")
+        if not isinstance(indication, str) or not indication:
+            raise ApiError(400, "ต้องระบุ indication")
+        weight = _number(body, "weight", minimum=0.1, maximum=max_weight)
+        age = _number(body, "age", required=kind == "special")
+        table = store.snapshot().drugs if kind == "dose" else store.snapshot().special_drugs
+        # ตรวจทั้งสองชนิด: ยา special ที่ไม่มี indication จะ fallback ไปใช้ user_drug_selection ที่แชร์กันใน API_USER
+        if indication not in table[drug]["indications"]:
+            raise ApiError(404, f"ไม่พบข้อบ่งใช้ {indication} ของ {drug}")
+
+        text = compute_dose(API_USER, drug, indication, weight, age, _locale(body, locales))
+        return {
+            "drug": drug,
+            "indication": indication,
+            "weight": weight,
+            "age": age,
+            "formulary": store.version(),
+            "status": _result_status(text),
+            "text": text,
+        }
+
+    def warfarin(body):
+        if not isinstance(body, dict):
+            raise ApiError(400, "request ต้องเป็น JSON object")
+        inr = _number(body, "inr")
+        twd = _number(body, "twd", maximum=max_twd)
+        if twd <= 0:
+            raise ApiError(400, "twd ต้องมากกว่า 0")
+        bleeding = body.get("bleeding", False)
+        if not isinstance(bleeding, bool):
+            raise ApiError(400, "bleeding ต้องเป็น true/false")
+        supplement = body.get("supplement") or None
+        if supplement is not None and not isinstance(supplement, str):
+            raise ApiError(400, "supplement ต้องเป็นข้อความ")
+        return warfarin_plan(API_USER, inr, twd, bleeding, supplement, _locale(body, locales))
+
+    def single(compute):
+        body = request.get_json(silent=True)
+        if body is None:
+            raise ApiError(400, "request ต้องเป็น JSON")
+        with store.pin():
+            return _json(compute(body))
+
+    def batch(compute):
+        items = _batch_items()
+
+        def generate():
+            with store.pin():
+                for index, item in enumerate(items):
+                    if index >= batch_limit:
+                        yield _dumps({"index": index, "error": f"batch เกิน {batch_limit} รายการ"}) + "\n"
+                        return
+                    try:
+                        result = compute(item)
+                    except ApiError as e:
+                        result = {"error": e.message, "status_code": e.status}
+                    except Exception as e:
+                        # รายการเดียวพังต้องไม่ตัด stream ที่ส่ง 200 ไปแล้ว → ตอบ error ของรายการนั้นแล้วทำต่อ
+                        logging.info(f"❌ API batch รายการที่ {index} ผิดพลาด: {type(e).__name__}: {e}")
+                        result = {"error": "เกิดข้อผิดพลาดในการคำนวณ", "status_code": 500}
+                    yield _dumps({"index": index, **result}) + "\n"
+        return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+    @api.post("/doses")
+    def calculate_one():
+        return single(dose)
+
+    @api.post("/doses/batch")
+    def calculate_batch():
+        return batch(dose)
+
+    @api.post("/warfarin")
+    def warfarin_one():
+        return single(warfarin)
+
+    @api.post("/warfarin/batch")
+    def warfarin_batch():
+        return batch(warfarin)
+
+    return api
+
+
+def _batch_items():
+    """JSON array (โหลดทั้งก้อน) หรือ NDJSON (อ่านทีละบรรทัดจาก request.stream)"""
+    if request.mimetype != NDJSON:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ApiError(400, f"batch ต้องเป็น JSON array หรือ {NDJSON}")
+        return items
+
+    def lines():
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None  # dose()/warfarin() ตอบ error ของรายการนี้ แล้วทำรายการถัดไปต่อ
+    return lines()
@@ -1,24 +1,54 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort, jsonify
 from linebot.v3.messaging import (
     MessagingApi, Configuration, ApiClient,
-    TextMessage, MessageAction, CarouselColumn, CarouselTemplate, TemplateMessage, ReplyMessageRequest, FlexMessage
+    TextMessage, MessageAction, CarouselColumn, CarouselTemplate, TemplateMessage, ReplyMessageRequest, FlexMessage,
+    QuickReply, QuickReplyItem
 )
-from linebot.v3.webhook import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.webhooks import MessageEvent, TextMessageContent
 from linebot.models import QuickReplyButton, PostbackAction
 from linebot.v3.messaging.models import FlexContainer
-from datetime import datetime, timedelta
+from reminders import ReminderScheduler
+from audit import AuditLog
+from ratelimit import WebhookAdmission, ALLOW, REJECT_NOTIFY
+from traffic import TrafficRecorder
+from tracing import Tracer, FileExporter, TracedParser, TracedApi
+from profiling import SORT_KEYS, CallbackProfiler, MemoryTracker
+from dispatch import ConcurrentWebhookHandler, split_body, parse_event
+from eventqueue import EventQueue, EventQueueConsumer, EnqueueError
+from outbox import CircuitBreaker, Outbox, GuardedApi, OutboxSender
+from sessionstore import RespClient, SessionStore, ReplyCache
+from formulary import FormularyStore, check_structure
+from schema import check_schema, find_unreachable, unsupported_indications as find_unsupported
+from api import create_api
+from warmup import Warmup, CaptureApi
+from shutdown import ShutdownCoordinator, SessionSnapshot
+from drugsearch import DrugSearch
+from indications import IndicationIndex
+from messages import catalog as message_catalog, DEFAULT_LOCALE
+from cards import DoseCards
+from datetime import datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+from types import SimpleNamespace
+from bisect import bisect_right
+from functools import lru_cache, wraps
+from itertools import combinations, product
 import os
+import json
 import re
+import time
+import atexit
+import hmac
+import threading
 import math
 import random
 import logging
+import sys
 
 DRUG_DATABASE = {
     "Amoxicillin": {
         "concentration_mg_per_ml": 250 / 5,
-        "bottle_size_ml": 60,
+        "pack_sizes_ml": [60, 120],
         "indications": {
             "Pharyngitis/Tonsillitis": [
                 {
@@ -245,7 +275,7 @@ DRUG_DATABASE = {
     },
     "Cephalexin": {
         "concentration_mg_per_ml": 125 / 5,
-        "bottle_size_ml": 60,
+        "pack_sizes_ml": [60],
         "indications": {
             "Acute Otitis Media (AOM)": [
             {
@@ -314,7 +344,7 @@ DRUG_DATABASE = {
     },
     "Cefdinir": {
     "concentration_mg_per_ml": 125 / 5,
-    "bottle_size_ml": 30,
+    "pack_sizes_ml": [30],
     "indications": {
         "Chronic bronchitis, acute bacterial exacerbation": [
         {
@@ -396,7 +426,7 @@ DRUG_DATABASE = {
     },
     "Cefixime": {
     "concentration_mg_per_ml": 100 / 5,
-    "bottle_size_ml": 30,
+    "pack_sizes_ml": [30],
     "indications": {
         "Gonococcal infection": [
         {
@@ -469,7 +499,7 @@ DRUG_DATABASE = {
     },
     "Augmentin": {
     "concentration_mg_per_ml": 600 / 5,  # ตัวอย่าง: 600 mg amoxicillin + 57 mg clavulanate per 5 mL
-    "bottle_size_ml": 70,
+    "pack_sizes_ml": [70],
     "indications": {
         "Impetigo": [
         {
@@ -550,7 +580,7 @@ DRUG_DATABASE = {
     },
     "Azithromycin": {
         "concentration_mg_per_ml": 200 / 5,
-        "bottle_size_ml": 15,
+        "pack_sizes_ml": [15],
         "indications": {
             "Pertussis": [
                 {
@@ -558,7 +588,6 @@ DRUG_DATABASE = {
                     "dose_mg_per_kg_per_day": 10,
                     "frequency": 1,
                     "duration_days": 5,
-                    "max_mg_per_day": None,
                     "note": "ใช้วันละครั้ง เป็นเวลา 5 วัน"
                 },
                 {
@@ -581,10 +610,18 @@ DRUG_DATABASE = {
             "Pneumonia (community acquired)": [
                 {
                     "sub_indication": "5-day regimen (mild infection / step-down therapy)",
-                    "dose_mg_per_kg_per_day": [10, 5],
+                    "dose_by_day": {
+                        "Day 1": {
+                            "dose_mg_per_kg_per_day": 10,
+                            "max_mg_per_day": 500
+                        },
+                        "Day 2-5": {
+                            "dose_mg_per_kg_per_day": 5,
+                            "max_mg_per_day": 250
+                        }
+                    },
                     "frequency": 1,
                     "duration_days": 5,
-                    "max_mg_per_day": [500, 250],
                     "note": "Day 1: 10 mg/kg (max 500 mg), Day 2–5: 5 mg/kg (max 250 mg)"
                 },
                 {
@@ -627,7 +664,7 @@ DRUG_DATABASE = {
                     "sub_indication": "5–7-day regimen (20 mg/kg/day)",
                     "dose_mg_per_kg_per_day": 20,
                     "frequency": 1,
-                    "duration_days": [5, 7],
+                    "duration_days_range": [5, 7],
                     "max_mg_per_day": 1000,
                     "note": "💊 ขนาดสูง: 20 mg/kg/day นาน 5–7 วัน; พิจารณาในกรณีรุนแรงหรือตอบสนองไม่ดี"
                 }
@@ -668,7 +705,6 @@ DRUG_DATABASE = {
                     "dose_mg_per_kg_per_day": 20,
                     "frequency": 1,
                     "duration_days": 3,
-                    "max_mg_per_day": None,
                     "note": "📌 ใช้ขนาด 20 mg/kg/day วันละครั้ง เป็นเวลา 3 วัน"
                 }
             ],
@@ -693,7 +729,7 @@ DRUG_DATABASE = {
                     "sub_indication": "Immunocompromised or complicated infection",
                     "dose_mg_per_kg_per_day": 10,
                     "frequency": 1,
-                    "duration_days": [7,14],
+                    "duration_days_range": [7, 14],
                     "max_mg_per_day": 500,
                     "note": "📌 ระยะเวลาอาจขยายถึง 7–14 วันตามภาวะแทรกซ้อนและระดับภูมิคุ้มกัน"
                 }
@@ -940,26 +976,141 @@ logging.basicConfig(
 
 app = Flask(__name__)
 
+# ✅ SIGTERM (deploy / scale down): หยุดรับ event → รอ event ที่ค้าง → flush log/audit/outbox → เก็บ session ลงไฟล์
+# ส่วนที่ต้องปิดตอนจบ process ลงทะเบียนกับ shutdown_coordinator.register (ลำดับแบบ atexit) แทน atexit
+shutdown_coordinator = ShutdownCoordinator(drain_sec=float(os.environ.get("SHUTDOWN_DRAIN_SEC", 8)))
+
 LINE_CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_CHANNEL_SECRET = os.environ.get("LINE_CHANNEL_SECRET")
 
-if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_CHANNEL_SECRET:
-    raise ValueError("Missing LINE_CHANNEL_ACCESS_TOKEN or LINE_CHANNEL_SECRET")
+# ✅ import ได้โดยไม่มี token (เช่น dosesheet.py / golden.py ใช้ calculator แบบ offline) แต่ /callback จะปิดไว้
+LINE_CONFIGURED = bool(LINE_CHANNEL_ACCESS_TOKEN and LINE_CHANNEL_SECRET)
+if not LINE_CONFIGURED:
+    logging.info("⚠️ Missing LINE_CHANNEL_ACCESS_TOKEN or LINE_CHANNEL_SECRET → ปิด /callback")
 
-configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
+configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN or "")
 api_client = ApiClient(configuration)
 messaging_api = MessagingApi(api_client)
-handler = WebhookHandler(LINE_CHANNEL_SECRET)
+# ✅ body ที่มีหลาย event จากหลายผู้ใช้: ทำแต่ละผู้ใช้พร้อมกัน (ลำดับภายในผู้ใช้เดียวกันคงเดิม)
+handler = ConcurrentWebhookHandler(
+    LINE_CHANNEL_SECRET or "",
+    max_workers=int(os.environ.get("WEBHOOK_WORKERS", 8)),
+    deadline_sec=float(os.environ.get("WEBHOOK_DEADLINE_SEC", 1.0)),
+)
 
-user_drug_selection = {}
-user_sessions = {}
-user_ages = {}
+# ✅ tracing ต่อ webhook: parse → handle_message → compute → build → LINE API (เปิดใช้เมื่อกำหนด TRACE_FILE)
+TRACE_FILE = os.environ.get("TRACE_FILE")
+TRACE_TAIL_MS = os.environ.get("TRACE_TAIL_MS")
+trace_exporter = None
+if TRACE_FILE:
+    trace_exporter = FileExporter(TRACE_FILE, fmt=os.environ.get("TRACE_FORMAT", "jsonl"))
+    shutdown_coordinator.register("traces", trace_exporter.close)
+tracer = Tracer(
+    trace_exporter,
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", 1.0)),
+    tail_threshold_ms=float(TRACE_TAIL_MS) if TRACE_TAIL_MS else None,
+)
+if trace_exporter is not None:
+    handler.parser = TracedParser(handler.parser, tracer)
+    messaging_api = TracedApi(messaging_api, tracer)
+
+# ✅ circuit breaker หน้า LINE API + outbox (เปิดใช้เมื่อกำหนด OUTBOX_DB): reply ที่ล้มเหลวไม่หาย
+# แต่ถูกเก็บลง SQLite แล้วส่งซ้ำแบบ push message เมื่อ API กลับมาปกติ
+OUTBOX_DB = os.environ.get("OUTBOX_DB")
+guarded_api = None
+outbox_sender = None
+if OUTBOX_DB:
+    line_breaker = CircuitBreaker(
+        failure_rate=float(os.environ.get("BREAKER_FAILURE_RATE", 0.5)),
+        window=int(os.environ.get("BREAKER_WINDOW", 20)),
+        open_sec=float(os.environ.get("BREAKER_OPEN_SEC", 30)),
+        slow_call_sec=float(os.environ.get("BREAKER_SLOW_MS", 3000)) / 1000,
+    )
+    line_outbox = Outbox(OUTBOX_DB)
+    outbox_sender = OutboxSender(
+        line_outbox, messaging_api, line_breaker,
+        concurrency=int(os.environ.get("OUTBOX_CONCURRENCY", 4)),
+        max_age_sec=float(os.environ.get("OUTBOX_MAX_AGE_SEC", 3600)),
+    ).start()
+    guarded_api = messaging_api = GuardedApi(messaging_api, line_breaker, line_outbox)
+    shutdown_coordinator.register("outbox_db", line_outbox.close)
+    shutdown_coordinator.register(
+        "outbox", outbox_sender.stop, flush_sec=float(os.environ.get("OUTBOX_FLUSH_SEC", 2))
+    )
+
+# ✅ session ใช้ร่วมกันหลาย node ผ่าน server ที่พูด Redis protocol (เปิดใช้เมื่อกำหนด SESSION_REDIS_URL)
+# โหลด session ของผู้ส่งครั้งเดียวตอนเริ่ม event และเขียนกลับตอนจบ (session_scope) โค้ดเดิมใช้เหมือน dict
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL")
+session_store = None
+reply_cache = None
+if SESSION_REDIS_URL:
+    session_client = RespClient.from_url(SESSION_REDIS_URL, timeout=float(os.environ.get("SESSION_REDIS_TIMEOUT", 2)))
+    session_store = SessionStore(
+        session_client, ("sessions", "drug_selection", "ages", "inr_followups", "locales"),
+        ttl_sec=float(os.environ.get("SESSION_TTL_SEC", 86400)),
+        ttls={"inr_followups": 90 * 86400},  # ต้องอยู่ถึงวันนัดตรวจ INR
+    )
+    user_drug_selection = session_store.view("drug_selection")
+    user_sessions = session_store.view("sessions")
+    user_ages = session_store.view("ages")
+    user_inr_followups = session_store.view("inr_followups")
+    user_locales = session_store.view("locales")
+    reply_cache = ReplyCache(
+        session_client,
+        ttl_sec=float(os.environ.get("REPLY_CACHE_TTL_SEC", 86400)),
+        near_size=int(os.environ.get("REPLY_NEAR_CACHE_SIZE", 4096)),
+    )
+    shutdown_coordinator.register("session_client", session_client.close)
+else:
+    user_drug_selection = {}
+    user_sessions = {}
+    user_ages = {}
+    user_inr_followups = {}
+    user_locales = {}
+session_scope = session_store.scope if session_store is not None else (lambda func: func)
+
+# ✅ session ในหน่วยความจำ: เขียนลงไฟล์ตอนปิดและโหลดกลับตอนเริ่ม (เปิดใช้เมื่อกำหนด SESSION_SNAPSHOT_PATH)
+# ไม่ใช้เมื่อมี SESSION_REDIS_URL เพราะ session อยู่ที่ server อยู่แล้ว
+# แต่ละ worker เขียน <path>.<pid> ของตัวเอง ไฟล์ที่โหลดแล้วถูกลบทิ้งทันที
+SESSION_SNAPSHOT_PATH = os.environ.get("SESSION_SNAPSHOT_PATH")
+if SESSION_SNAPSHOT_PATH and session_store is None:
+    shutdown_coordinator.snapshot = SessionSnapshot(
+        SESSION_SNAPSHOT_PATH, max_age_sec=float(os.environ.get("SESSION_TTL_SEC", 86400))
+    )
+    shutdown_coordinator.sessions = {
+        "sessions": user_sessions,
+        "drug_selection": user_drug_selection,
+        "ages": user_ages,
+        "inr_followups": user_inr_followups,
+        "locales": user_locales,
+    }
+    for name, restored in shutdown_coordinator.snapshot.load().items():
+        shutdown_coordinator.sessions.get(name, {}).update(restored)
+
+# ✅ warm-up ก่อนรับ traffic (เปิดใช้เมื่อ WARMUP=1) /ready ตอบ 200 เมื่อ warm-up ผ่านแล้วเท่านั้น
+# ระหว่าง warm-up เมนูที่สร้างจะถูกเก็บไว้ใน CaptureApi แทนการส่งไป LINE
+WARMUP = os.environ.get("WARMUP", "").lower() in ("1", "true", "yes")
+warmup = None
+if WARMUP:
+    warmup = Warmup()
+    warmup_api = messaging_api = CaptureApi(messaging_api)
+
+# ✅ แจ้งเตือนวันนัดตรวจ INR ทาง LINE (เปิดใช้เมื่อกำหนด INR_REMINDER_DB เป็น path ของไฟล์ SQLite)
+INR_REMINDER_DB = os.environ.get("INR_REMINDER_DB")
+INR_REMINDER_HOUR = int(os.environ.get("INR_REMINDER_HOUR", 9))
+# วันนัดและเวลาแจ้งเตือนเป็นเวลาของคลินิก ไม่ใช่ของ server (host ส่วนใหญ่ตั้งเป็น UTC)
+CLINIC_TZ = ZoneInfo(os.environ.get("CLINIC_TZ", "Asia/Bangkok"))
+reminder_scheduler = None
+if INR_REMINDER_DB:
+    reminder_scheduler = ReminderScheduler(INR_REMINDER_DB, messaging_api)
+    reminder_scheduler.start()
+    shutdown_coordinator.register("reminders", reminder_scheduler.stop)
 
 
 SPECIAL_DRUGS = {
     "Paracetamol": {
     "concentration_mg_per_ml": 120 / 5,
-    "bottle_size_ml": 60,
+    "pack_sizes_ml": [60],
     "indications": {
         "Fever / Pain": {
             "label": "10–15 mg/kg/dose",
@@ -974,7 +1125,7 @@ SPECIAL_DRUGS = {
 
     "Paracetamol drop": {
     "concentration_mg_per_ml": 60 / 0.6,
-    "bottle_size_ml": 15,
+    "pack_sizes_ml": [15],
     "indications": {
         "Fever / Pain": {
             "label": "10–15 mg/kg/dose",
@@ -989,7 +1140,7 @@ SPECIAL_DRUGS = {
 
     "Chlorpheniramine": {
         "concentration_mg_per_ml": 2 / 5,  # 2 mg per 5 mL
-        "bottle_size_ml": 60,
+        "pack_sizes_ml": [60],
         "requires_age": True,
         "indications": {
             "Upper respiratory allergy symptoms (hay fever)": [
@@ -1023,7 +1174,7 @@ SPECIAL_DRUGS = {
     },
     "Salbutamol": {
         "concentration_mg_per_ml": 2 / 5,  # ตัวอย่าง: 2 mg per 5 mL syrup
-        "bottle_size_ml": 60,
+        "pack_sizes_ml": [60],
         "requires_age": True,
         "indications": {
             "Bronchospasm (if inhaled not tolerated)": [
@@ -1060,7 +1211,7 @@ SPECIAL_DRUGS = {
 
     "Domperidone": {
         "concentration_mg_per_ml": 1,  # 1 mg/ml
-        "bottle_size_ml": 30,
+        "pack_sizes_ml": [30],
         "requires_age": True,
         "indications": {
             "GI Motility Disorders / Nausea, Vomiting": [
@@ -1087,7 +1238,7 @@ SPECIAL_DRUGS = {
     },
     "Ibuprofen": {
         "concentration_mg_per_ml": 100 / 5,
-        "bottle_size_ml": 60,
+        "pack_sizes_ml": [60],
         "indications": {
             "Analgesic": [
                 {
@@ -1128,7 +1279,7 @@ SPECIAL_DRUGS = {
 
     "Cetirizine": {
     "concentration_mg_per_ml": 5 / 5,
-    "bottle_size_ml": 60,
+    "pack_sizes_ml": [60],
     "indications": {
       "Allergic rhinitis, perennial": {
         "6_to_11_months": {
@@ -1166,12 +1317,12 @@ SPECIAL_DRUGS = {
           "max_mg_per_day": 2.5
         },
         "2_to_5_years": {
-          "dose_range_mg": [2.5, 5],
+          "dose_mg_range": [2.5, 5],
           "frequency": 1,
           "max_mg_per_day": 5
         },
         "above_5": {
-          "dose_range_mg": [5, 10],
+          "dose_mg_range": [5, 10],
           "frequency": 1,
           "max_mg_per_day": 10
         }
@@ -1188,17 +1339,17 @@ SPECIAL_DRUGS = {
         "max_mg_per_day": 5
         },
         "2_to_5_years": {
-        "dose_range_mg": [2.5, 5],
+        "dose_mg_range": [2.5, 5],
         "frequency": 1,
         "max_mg_per_day": 5
         },
         "6_to_11_years": {
-        "dose_range_mg": [5, 10],
+        "dose_mg_range": [5, 10],
         "frequency": 1,
         "max_mg_per_day": 10
         },
         "above_or_equal_12": {
-        "dose_range_mg": [5, 10],
+        "dose_mg_range": [5, 10],
         "frequency": 1,
         "max_mg_per_day": 10
         }
@@ -1225,12 +1376,12 @@ SPECIAL_DRUGS = {
           "max_mg_per_day": 5
         },
         "6_to_11_years": {
-        "dose_range_mg": [5, 10],
+        "dose_mg_range": [5, 10],
         "frequency": 1,
         "max_mg_per_day": 10
         },
         "above_or_equal_12": {
-        "dose_range_mg": [5, 10],
+        "dose_mg_range": [5, 10],
         "frequency": 1,
         "max_mg_per_day": 10
         }
@@ -1246,7 +1397,7 @@ SPECIAL_DRUGS = {
     },
     "Carbocysteine": {
     "concentration_mg_per_ml": 450 / 5,
-    "bottle_size_ml": 120,
+    "pack_sizes_ml": [120],
     "indications": {
         "mucolytic (age-based)": [
             {
@@ -1291,7 +1442,7 @@ SPECIAL_DRUGS = {
     },
     "Hydroxyzine": {
         "concentration_mg_per_ml": 10 / 5 ,
-        "bottle_size_ml": 60,
+        "pack_sizes_ml": [60],
         "indications": {
             "Anxiety": {
                 "under_6": {
@@ -1346,7 +1497,7 @@ SPECIAL_DRUGS = {
     },
     "Ferrous drop": {
         "concentration_mg_per_ml": 15 / 0.6,
-        "bottle_size_ml": 15,
+        "pack_sizes_ml": [15],
         "indications": {
             "Iron deficiency, treatment": {
                 "label": "3 mg/kg/day",
@@ -1366,22 +1517,405 @@ SPECIAL_DRUGS = {
     }
     }
 
+# ✅ ชื่ออื่น/ชื่อการค้า/ชื่อภาษาไทย สำหรับค้นหาชื่อยาที่ผู้ใช้พิมพ์เอง (drug_search)
+DRUG_ALIASES = {
+    "Amoxicillin": ["amox", "amoxil", "อะม็อกซีซิลลิน", "อะมอกซีซิลลิน", "อะม็อกซี่"],
+    "Cephalexin": ["cefalexin", "keflex", "เซฟาเลกซิน", "เซฟาเล็กซิน"],
+    "Cefdinir": ["omnicef", "เซฟดินีร์", "เซฟดิเนียร์"],
+    "Cefixime": ["suprax", "เซฟิกซิม", "เซฟิซีม"],
+    "Augmentin": ["amoxicillin clavulanate", "co-amoxiclav", "amoxiclav", "ออกเมนติน", "ออคเมนติน"],
+    "Azithromycin": ["azithro", "zithromax", "อะซิโธรมัยซิน", "อะซิโทรมัยซิน"],
+    "Paracetamol": ["acetaminophen", "tylenol", "tempra", "พาราเซตามอล", "พารา"],
+    "Paracetamol drop": ["paracetamol drops", "พาราหยด", "พาราเซตามอลหยด"],
+    "Chlorpheniramine": ["cpm", "chlorphenamine", "คลอเฟนิรามีน", "คลอร์เฟนิรามีน"],
+    "Salbutamol": ["albuterol", "ventolin", "ซัลบูทามอล"],
+    "Domperidone": ["motilium", "ดอมเพอริโดน"],
+    "Ibuprofen": ["brufen", "nurofen", "ไอบูโพรเฟน", "ไอบูโปรเฟน"],
+    "Cetirizine": ["zyrtec", "เซทิริซีน", "เซทิริซิน"],
+    "Carbocysteine": ["carbocisteine", "คาร์โบซิสเทอีน"],
+    "Hydroxyzine": ["atarax", "ไฮดรอกซีซีน", "ไฮดรอกซิซีน"],
+    "Ferrous drop": ["ferrous sulfate drop", "iron drop", "ธาตุเหล็กหยด", "เฟอรัสหยด"],
+}
+
+# ✅ ข้อบ่งใช้ที่สะกดต่างกันในแต่ละยาแต่เป็นโรคเดียวกัน + คำพ้องภาษาไทย (ใช้กับ "เทียบยา: ...")
+INDICATION_SYNONYMS = {
+    "Pharyngitis/Tonsillitis": ["pharyngitis", "tonsillitis", "strep throat", "คออักเสบ", "ทอนซิลอักเสบ", "เจ็บคอ"],
+    "Acute Otitis Media (AOM)": ["Otitis Media", "acute otitis media", "AOM", "หูชั้นกลางอักเสบ", "หูอักเสบ", "หูน้ำหนวก"],
+    "Pneumonia (community acquired)": ["pneumonia", "community acquired pneumonia", "CAP", "ปอดอักเสบ", "ปอดบวม"],
+    "Rhinosinusitis": ["sinusitis", "ไซนัสอักเสบ", "โพรงจมูกอักเสบ"],
+    "Urinary tract infection": ["UTI", "ติดเชื้อทางเดินปัสสาวะ", "กระเพาะปัสสาวะอักเสบ", "กรวยไตอักเสบ"],
+    "SSTI": ["skin and soft tissue infection", "ติดเชื้อผิวหนัง", "ผิวหนังอักเสบ"],
+    "Typhoid fever": ["typhoid", "ไข้ไทฟอยด์", "ไทฟอยด์"],
+    "Gonococcal infection": ["gonorrhea", "หนองใน"],
+    "Fever / Pain": ["Fever", "Analgesic", "pain", "ไข้", "ลดไข้", "ปวด", "แก้ปวด"],
+    "Allergic rhinitis / hay fever": [
+        "Allergic rhinitis, perennial", "Allergic symptoms, hay fever", "Upper respiratory allergy symptoms (hay fever)",
+        "allergic rhinitis", "hay fever", "แพ้อากาศ", "ภูมิแพ้", "น้ำมูกไหล",
+    ],
+    "Urticaria": ["Urticaria, acute", "Urticaria, chronic spontaneous", "ลมพิษ"],
+    "Pruritus": ["Pruritus (age-based)", "Pruritus (weight_based)", "คัน", "ผื่นคัน"],
+}
+
+# ✅ formulary แบบ compact ที่โหลดใหม่ได้ระหว่างรัน (FORMULARY_FILE) ตารางข้างบนเป็นค่าเริ่มต้น
+# DRUG_DATABASE / SPECIAL_DRUGS กลายเป็น view ที่ชี้ไปยัง version ที่ request ปัจจุบัน pin ไว้
+# ✅ schema ถูกตรวจแบบเข้มงวดครั้งเดียวตอนโหลด/reload (schema.py) calculator จึงไม่ต้องดัก error เอง
+formulary_store = FormularyStore(validators=[check_structure, check_schema], linters=[find_unreachable])
+formulary_store.load(DRUG_DATABASE, SPECIAL_DRUGS)
+DRUG_DATABASE = formulary_store.view("drugs")
+SPECIAL_DRUGS = formulary_store.view("special_drugs")
+
+
+def drug_name_index():
+    snapshot = formulary_store.snapshot()
+    return snapshot.cache("drug_names", lambda: {name.lower(): name for name in snapshot.drugs})
+
+
+def unsupported_indications():
+    snapshot = formulary_store.snapshot()
+    return snapshot.cache("unsupported_indications", lambda: find_unsupported(snapshot.drugs))
+
+
+def _drug_kinds(snapshot):
+    kinds = {name.lower(): (name, "dose") for name in snapshot.drugs}
+    kinds.update({name.lower(): (name, "special") for name in snapshot.special_drugs})
+    return kinds
+
+
+def resolve_drug(name):
+    """ชื่อยา (ไม่สนตัวพิมพ์) → (ชื่อใน formulary, "dose" | "special") หรือ None"""
+    snapshot = formulary_store.snapshot()
+    return snapshot.cache("drug_kinds", lambda: _drug_kinds(snapshot)).get(name.strip().lower())
+
+
+def _drug_search(snapshot):
+    names = list(snapshot.drugs) + [name for name in snapshot.special_drugs if name not in snapshot.drugs]
+    return DrugSearch({name: DRUG_ALIASES.get(name, ()) for name in names})
+
+
+def drug_search():
+    snapshot = formulary_store.snapshot()
+    return snapshot.cache("drug_search", lambda: _drug_search(snapshot))
+
+
+def _indication_index(snapshot):
+    return IndicationIndex([("dose", snapshot.drugs), ("special", snapshot.special_drugs)], INDICATION_SYNONYMS)
+
+
+def indication_index():
+    snapshot = formulary_store.snapshot()
+    return snapshot.cache("indication_index", lambda: _indication_index(snapshot))
+
+
+# ✅ ผลคำนวณขนาดยาเป็นการ์ด Flex แทนข้อความยาว (เปิดใช้เมื่อ DOSE_CARDS=1)
+# โครงการ์ด validate ครั้งเดียวต่อยา/ข้อบ่งใช้ต่อ formulary version ต่อ request เติมแค่ช่องตัวเลข
+DOSE_CARDS = os.environ.get("DOSE_CARDS", "").lower() in ("1", "true", "yes")
+
+
+def dose_cards():
+    return formulary_store.snapshot().cache("dose_cards", DoseCards)
+
+
+def dose_reply_message(drug, indication, reply):
+    """ข้อความตอบผลคำนวณ: การ์ด Flex ถ้าเปิดใช้ (ข้อความปฏิเสธ ❌ ยังเป็นข้อความธรรมดา)"""
+    if not DOSE_CARDS:
+        return TextMessage(text=reply)
+    with tracer.span("build.card"):
+        return dose_cards().message(drug, indication, reply)
+
+
+def send_drug_suggestions(event, query):
+    """ตอบ quick reply ชื่อยาที่ใกล้กับข้อความที่พิมพ์ คืน False ถ้าไม่พบยาที่ใกล้พอ"""
+    matches = drug_search().search(query)
+    if not matches:
+        return False
+    items = [
+        QuickReplyItem(action=MessageAction(label=drug[:20], text=f"เลือกยา: {drug}"))
+        for drug, _ in matches
+    ]
+    messaging_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=event.reply_token,
+            messages=[TextMessage(text="🔎 หมายถึงยาตัวไหน? เลือกจากรายการด้านล่าง", quick_reply=QuickReply(items=items))]
+        )
+    )
+    return True
+
+# ✅ audit log ของผลการคำนวณทุกครั้ง (เปิดใช้เมื่อกำหนด AUDIT_LOG_DIR)
+AUDIT_LOG_DIR = os.environ.get("AUDIT_LOG_DIR")
+audit_log = None
+if AUDIT_LOG_DIR:
+    audit_log = AuditLog(AUDIT_LOG_DIR, salt=os.environ.get("AUDIT_SALT", ""))
+    shutdown_coordinator.register("audit", audit_log.close)
+
+
+def audited(kind, user_id, drug, indication, inputs, func, *args):
+    """เรียกฟังก์ชันคำนวณแล้วส่งผลเข้า audit log (enqueue อย่างเดียว ไม่ block request)"""
+    if audit_log is None:
+        with tracer.span("compute", kind=kind, drug=drug, indication=indication):
+            return func(*args)
+
+    started = time.perf_counter()
+    output = None
+    error = None
+    try:
+        with tracer.span("compute", kind=kind, drug=drug, indication=indication):
+            output = func(*args)
+        return output
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        audit_log.record({
+            "kind": kind,
+            "user_id": user_id,
+            "drug": drug,
+            "indication": indication,
+            "inputs": inputs,
+            "output": output,
+            "error": error,
+            "formulary": formulary_store.version(),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        })
+
+# ✅ rate limit ต่อผู้ใช้และทั้งระบบ + load shedding ตาม latency ก่อนเข้า handle_message (เปิดใช้เมื่อ RATE_LIMIT_ENABLED=1)
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "").lower() in ("1", "true", "yes")
+RATE_LIMIT_MODE = os.environ.get("RATE_LIMIT_MODE", "reply")  # reply = ตอบ busy, drop = เงียบ
+BUSY_MESSAGE = TextMessage(text="⏳ ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่")
+webhook_admission = None
+if RATE_LIMIT_ENABLED:
+    webhook_admission = WebhookAdmission(
+        user_rate_per_sec=float(os.environ.get("RATE_LIMIT_USER_PER_MIN", 30)) / 60,
+        user_burst=int(os.environ.get("RATE_LIMIT_USER_BURST", 10)),
+        global_rate_per_sec=float(os.environ.get("RATE_LIMIT_GLOBAL_PER_SEC", 50)),
+        global_burst=int(os.environ.get("RATE_LIMIT_GLOBAL_BURST", 100)),
+        shed_latency_sec=float(os.environ.get("SHED_LATENCY_MS", 0)) / 1000 or None,
+    )
+_dispatch_local = threading.local()
+
+
+def carry_request_context(func):
+    # เรียกใน request thread: พาเวลาที่รับ webhook และ trace ไปยัง worker ที่จะรันกลุ่ม event
+    received_at = getattr(_dispatch_local, "received_at", None)
+    func = tracer.attach(tracer.current(), func)
+
+    def run(*args):
+        _dispatch_local.received_at = received_at
+        return func(*args)
+    return run
+
+
+handler.task_wrapper = carry_request_context
+
+# ✅ บันทึก webhook traffic (ปิดตัวตนแล้ว) สำหรับ replay วางแผน capacity (เปิดใช้เมื่อกำหนด TRAFFIC_RECORD_DIR)
+TRAFFIC_RECORD_DIR = os.environ.get("TRAFFIC_RECORD_DIR")
+traffic_recorder = None
+if TRAFFIC_RECORD_DIR:
+    traffic_recorder = TrafficRecorder(
+        TRAFFIC_RECORD_DIR, salt=os.environ.get("TRAFFIC_SALT", os.environ.get("AUDIT_SALT", ""))
+    )
+    shutdown_coordinator.register("traffic", traffic_recorder.close)
+
+
+# ✅ คิว event แบบ durable (SQLite WAL) ระหว่าง /callback กับ handle_message (เปิดใช้เมื่อกำหนด EVENT_QUEUE_PATH)
+# /callback ตอบ LINE หลัง event ถูก commit ลงคิวแล้ว worker ตาย/ถูก recycle ระหว่างทาง event ก็ไม่หาย
+EVENT_QUEUE_PATH = os.environ.get("EVENT_QUEUE_PATH")
+event_queue = None
+event_consumer = None
+if EVENT_QUEUE_PATH:
+    event_queue = EventQueue(EVENT_QUEUE_PATH, max_attempts=int(os.environ.get("EVENT_QUEUE_MAX_ATTEMPTS", 5)))
+
+
+def process_queued_event(item):
+    # เวลารอในคิวนับรวมใน latency ของ load shedding เหมือนรับตรงจาก /callback
+    _dispatch_local.received_at = time.monotonic() - max(0.0, time.time() - item.enqueued_at)
+    with tracer.trace("event queue", attempts=item.attempts):
+        handler.dispatch(parse_event(json.loads(item.body)), item.destination)
+
+
+def admit_event(event):
+    if guarded_api is not None:
+        guarded_api.bind(event.reply_token, getattr(event.source, "user_id", None))
+    if webhook_admission is None:
+        return True
+
+    received_at = getattr(_dispatch_local, "received_at", None)
+    if received_at is not None:
+        webhook_admission.observe_latency(time.monotonic() - received_at)
+
+    verdict = webhook_admission.check(getattr(event.source, "user_id", None))
+    if verdict == ALLOW:
+        return True
+
+    if verdict == REJECT_NOTIFY and RATE_LIMIT_MODE == "reply":
+        try:
+            messaging_api.reply_message(
+                ReplyMessageRequest(reply_token=event.reply_token, messages=[BUSY_MESSAGE])
+            )
+        except Exception as e:
+            logging.info(f"❌ ส่งข้อความ busy ไม่สำเร็จ: {e}")
+    return False
+
 @app.route('/')
 def home():
     return 'LINE Bot is running!'
 
+# ✅ admin endpoint สำหรับ profiling ตอนรันจริง (ใช้ได้เมื่อกำหนด ADMIN_TOKEN, ส่งเป็น Authorization: Bearer <token>)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+callback_profiler = CallbackProfiler()
+memory_tracker = MemoryTracker()
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+            abort(401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def session_sizes():
+    return {
+        "user_sessions": len(user_sessions),
+        "user_drug_selection": len(user_drug_selection),
+        "user_ages": len(user_ages),
+        "user_inr_followups": len(user_inr_followups),
+        "user_locales": len(user_locales),
+    }
+
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def admin_profile():
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        callback_profiler.start(
+            sample_rate=float(options.get("sample_rate", 0.1)),
+            max_requests=int(options.get("max_requests", 1000)),
+            stack_interval_ms=float(options.get("stack_interval_ms", 5)),
+        )
+        logging.info(f"🔬 เริ่ม profile handle_message: {callback_profiler.status()}")
+        return jsonify(callback_profiler.status())
+    if request.method == 'DELETE':
+        callback_profiler.stop()
+        return jsonify(callback_profiler.status())
+
+    fmt = request.args.get("format")
+    if fmt is None:
+        return jsonify(callback_profiler.status())
+    sort = request.args.get("sort", "cumulative")
+    if fmt not in ("pstats", "prof", "collapsed") or sort not in SORT_KEYS:
+        abort(400)
+    report = callback_profiler.report(
+        fmt,
+        limit=int(request.args.get("limit", 30)),
+        sort=sort,
+    )
+    if fmt == "prof":
+        return Response(report, mimetype="application/octet-stream",
+                        headers={"Content-Disposition": "attachment; filename=callback.prof"})
+    return Response(report, mimetype="text/plain")
+
+
+@app.route('/admin/tracemalloc', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def admin_tracemalloc():
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        memory_tracker.start(nframes=int(options.get("nframes", 10)))
+    elif request.method == 'DELETE':
+        memory_tracker.stop()
+    return jsonify({"tracing": memory_tracker.tracing, "snapshots": memory_tracker.list()})
+
+
+@app.route('/admin/tracemalloc/snapshots', methods=['POST'])
+@admin_required
+def admin_tracemalloc_snapshot():
+    if not memory_tracker.tracing:
+        abort(409)
+    snapshot_id = memory_tracker.snapshot(extra=session_sizes())
+    limit = int(request.args.get("limit", 20))
+    return jsonify(memory_tracker.top(snapshot_id, limit, request.args.get("key", "lineno")))
+
+
+@app.route('/admin/tracemalloc/diff')
+@admin_required
+def admin_tracemalloc_diff():
+    try:
+        result = memory_tracker.diff(
+            int(request.args["base"]),
+            int(request.args["to"]),
+            limit=int(request.args.get("limit", 20)),
+            key_type=request.args.get("key", "lineno"),
+        )
+    except (KeyError, ValueError):
+        abort(404)
+    return jsonify(result)
+
+
+@app.route('/admin/formulary', methods=['GET', 'POST'])
+@admin_required
+def admin_formulary():
+    if request.method == 'POST':
+        if not FORMULARY_FILE:
+            abort(409)
+        ok, detail = formulary_store.reload(FORMULARY_FILE)
+        if not ok:
+            return jsonify({"ok": False, "error": detail, "version": formulary_store.current.version}), 422
+    current = formulary_store.current
+    return jsonify({
+        "ok": True,
+        "version": current.version,
+        "source": current.source,
+        "loaded_at": current.loaded_at,
+        "reloads": formulary_store.reloads,
+        "last_error": formulary_store.last_error,
+        "warnings": current.warnings,
+    })
+
+
+
+@app.route('/admin/outbox')
+@admin_required
+def admin_outbox():
+    if outbox_sender is None:
+        abort(404)
+    return jsonify(outbox_sender.status())
+
+
 @app.route("/callback", methods=['POST'])
 def callback():
+    if not LINE_CONFIGURED or shutdown_coordinator.draining:
+        abort(503)
     signature = request.headers.get('X-Line-Signature')
     body = request.get_data(as_text=True)
 
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        abort(400)
-    except Exception as e:
-        logging.info(f"❌ Exception occurred: {e}")
-        abort(400)
+    _dispatch_local.received_at = time.monotonic()
+    received_ts = time.time()
+    with tracer.trace("POST /callback"):
+        try:
+            handler.verify(body, signature)
+            if traffic_recorder is not None:
+                # บันทึกก่อน dispatch: request ที่ handler ล้มก็ยังเก็บไว้ replay ได้
+                try:
+                    traffic_recorder.record(body, received_ts)
+                except Exception as e:
+                    logging.info(f"⚠️ บันทึก traffic ไม่สำเร็จ: {e}")
+            if event_queue is not None:
+                event_queue.put(split_body(body))
+            else:
+                handler.handle(body, signature)
+        except InvalidSignatureError:
+            abort(400)
+        except EnqueueError as e:
+            # ยังไม่ได้บันทึก → ตอบ 5xx ให้ LINE ส่ง webhook ซ้ำ (ถ้าเปิด redelivery)
+            logging.info(f"❌ บันทึก webhook ลงคิวไม่สำเร็จ: {e}")
+            abort(503)
+        except Exception as e:
+            logging.info(f"❌ Exception occurred: {e}")
+            abort(400)
     return 'OK'
 
 def send_drug_ATB_selection(event):
@@ -1474,7 +2008,7 @@ def send_drug_OT_selection(event):
 
 def send_indication_carousel(event, drug_name, show_all=False):
     # ✅ แก้ไขให้หา drug_name แบบ case-insensitive
-    matched_drug = next((k for k in DRUG_DATABASE if k.lower() == drug_name.lower()), None)
+    matched_drug = drug_name_index().get(drug_name.lower())
     drug_info = DRUG_DATABASE.get(matched_drug)
     
     logging.info(f"🧪 ตรวจสอบ drug_name: {drug_name}")
@@ -1577,16 +2111,17 @@ def send_indication_carousel(event, drug_name, show_all=False):
     carousel_chunks = [columns[i:i + 5] for i in range(0, len(columns), 5)]
     messages = []
 
-    for chunk in carousel_chunks:
-        try:
-            messages.append(
-                TemplateMessage(
-                    alt_text=f"ข้อบ่งใช้ {drug_name}",
-                    template=CarouselTemplate(columns=chunk)
+    with tracer.span("build.carousel", columns=len(columns)):
+        for chunk in carousel_chunks:
+            try:
+                messages.append(
+                    TemplateMessage(
+                        alt_text=f"ข้อบ่งใช้ {drug_name}",
+                        template=CarouselTemplate(columns=chunk)
+                    )
                 )
-            )
-        except Exception as e:
-            logging.info(f"⚠️ ผิดพลาดตอนสร้าง TemplateMessage: {e}")
+            except Exception as e:
+                logging.info(f"⚠️ ผิดพลาดตอนสร้าง TemplateMessage: {e}")
 
     logging.info(f"📤 ส่ง carousel ทั้งหมด: {len(messages)} ชุด")
     logging.info(f"📋 จำนวน indication ที่จะแสดง: {len(names_to_show)}")
@@ -1602,9 +2137,73 @@ def send_indication_carousel(event, drug_name, show_all=False):
 
 
 
-def calculate_warfarin(inr, twd, bleeding, supplement=None):
+# ✅ ตาราง INR band เรียงตามขอบล่าง ใช้ร่วมกันระหว่าง calculate_warfarin, warfarin_plan และ get_inr_followup
+# ค่า INR ที่อยู่ระหว่างขอบ (เช่น 1.95, 3.05) จะถูกนับรวมกับ band ที่ต่ำกว่า
+# ข้อความของแต่ละ band อยู่ใน messages.py (message_id) ได้ค่า low/high เป็นขนาดยาใหม่ต่อสัปดาห์
+INR_BANDS = [
+    {
+        "min_inr": float("-inf"),
+        "factors": (1.1, 1.2),
+        "message_id": "warfarin_increase_major",
+        "followup_days": 7,
+    },
+    {
+        "min_inr": 1.5,
+        "factors": (1.05, 1.10),
+        "message_id": "warfarin_increase_minor",
+        "followup_days": 14,
+    },
+    {
+        "min_inr": 2.0,
+        "factors": (1.0, 1.0),
+        "message_id": "warfarin_keep",
+        "followup_days": 56,
+    },
+    {
+        "min_inr": 3.1,
+        "factors": (0.9, 0.95),
+        "message_id": "warfarin_decrease",
+        "followup_days": 14,
+    },
+    {
+        "min_inr": 4.0,
+        "factors": (0.9, 0.9),
+        "message_id": "warfarin_hold_decrease",
+        "followup_days": 7,
+        # ตารางยาของ band นี้เริ่มหลังวันที่หยุดยา (ไม่นับวันหยุดยาในตาราง)
+        "hold_days": 1,
+    },
+    {
+        "min_inr": 5.0,
+        "factors": None,
+        "message_id": "warfarin_hold_vitamin_k",
+        "followup_days": 7,
+    },
+    {
+        # ช่วงเดียวกับด้านบน แต่ INR > 6.0 นัดตรวจเร็วขึ้น
+        "min_inr": 6.1,
+        "factors": None,
+        "message_id": "warfarin_hold_vitamin_k",
+        "followup_days": 5,
+    },
+    {
+        "min_inr": 9.0,
+        "factors": None,
+        "message_id": "warfarin_stop",
+        "followup_days": 2,
+    },
+]
+INR_BAND_BOUNDS = [band["min_inr"] for band in INR_BANDS]
+
+
+def get_inr_band(inr):
+    return INR_BANDS[bisect_right(INR_BAND_BOUNDS, inr) - 1]
+
+
+def calculate_warfarin(inr, twd, bleeding, supplement=None, locale=DEFAULT_LOCALE):
+    msg = message_catalog.table(locale)
     if bleeding == "yes":
-        return "\U0001f6a8 มี major bleeding → หยุด Warfarin, ให้ Vitamin K1 10 mg IV"
+        return msg["warfarin_bleeding"]()
 
     warning = ""
     if supplement:
@@ -1618,49 +2217,251 @@ def calculate_warfarin(inr, twd, bleeding, supplement=None):
         high_risk = list(herb_map.keys())
         matched = [name for name in high_risk if name in supplement]
         if matched:
-            herbs = ", ".join(matched)
-            warning = f"\n\u26a0\ufe0f พบว่าสมุนไพร/อาหารเสริมที่อาจมีผลต่อ INR ได้แก่: {herbs}\nโปรดพิจารณาความเสี่ยงต่อการเปลี่ยนแปลง INR อย่างใกล้ชิด"
+            # herb_map เก็บชื่อภาษาอังกฤษไว้แล้ว → ผลภาษาอื่นใช้ชื่อนั้นแทนคำที่ผู้ใช้พิมพ์
+            herbs = ", ".join(matched if locale == DEFAULT_LOCALE else dict.fromkeys(herb_map[name] for name in matched))
+            warning = "\n" + msg["warfarin_herb_warning"](herbs=herbs)
+        else:
+            warning = "\n" + msg["warfarin_supplement_warning"]()
+
+    followup_text = get_followup_text(inr, locale)
+
+    band = get_inr_band(inr)
+    render = msg[band["message_id"]]
+    if band["factors"] == (1.0, 1.0):
+        result = render()
+    elif band["factors"]:
+        low_factor, high_factor = band["factors"]
+        if band["factors"][0] == band["factors"][1]:
+            result = render(low=twd * low_factor)
         else:
-            warning = "\n\u26a0\ufe0f มีการใช้อาหารเสริมหรือสมุนไพร → พิจารณาความเสี่ยงต่อการเปลี่ยนแปลง INR"
-
-    followup_text = get_followup_text(inr)
-
-    if inr < 1.5:
-        result = f"\U0001f539 INR < 1.5 → เพิ่มขนาดยา 10–20%\nขนาดยาใหม่: {twd * 1.1:.1f} – {twd * 1.2:.1f} mg/สัปดาห์"
-    elif 1.5 <= inr <= 1.9:
-        result = f"\U0001f539 INR 1.5–1.9 → เพิ่มขนาดยา 5–10%\nขนาดยาใหม่: {twd * 1.05:.1f} – {twd * 1.10:.1f} mg/สัปดาห์"
-    elif 2.0 <= inr <= 3.0:
-        result = "✅ INR 2.0–3.0 → คงขนาดยาเดิม"
-    elif 3.1 <= inr <= 3.9:
-        result = f"\U0001f539 INR 3.1–3.9 → ลดขนาดยา 5–10%\nขนาดยาใหม่: {twd * 0.9:.1f} – {twd * 0.95:.1f} mg/สัปดาห์"
-    elif 4.0 <= inr <= 4.9:
-        result = f"⚠\ufe0f INR 4.0–4.9 → หยุดยา 1 วัน และลดขนาดยา 10%\nขนาดยาใหม่: {twd * 0.9:.1f} mg/สัปดาห์"
-    elif 5.0 <= inr <= 8.9:
-        result = "⚠\ufe0f INR 5.0–8.9 → หยุดยา 1–2 วัน และพิจารณาให้ Vitamin K1 1 mg"
+            result = render(low=twd * low_factor, high=twd * high_factor)
+        schedule = solve_warfarin_schedule(twd * low_factor, twd * high_factor)
+        if schedule:
+            result += "\n" + format_warfarin_schedule(schedule, locale, hold_days=band.get("hold_days", 0))
     else:
-        result = "\U0001f6a8 INR ≥ 9.0 → หยุดยา และพิจารณาให้ Vitamin K1 5–10 mg"
+        result = render()
 
     return f"{result}{warning}\n\n{followup_text}"
 
+
+def warfarin_plan(user_id, inr, twd, bleeding, supplement=None, locale=DEFAULT_LOCALE):
+    """ผลการปรับขนาด warfarin แบบมีโครงสร้าง (JSON API) พร้อมข้อความเดียวกับที่ตอบใน LINE"""
+    text = audited(
+        "warfarin", user_id, "Warfarin", None,
+        {"inr": inr, "twd": twd, "bleeding": "yes" if bleeding else "no", "supplement": supplement},
+        calculate_warfarin, inr, twd, "yes" if bleeding else "no", supplement, locale
+    )
+    plan = {
+        "inr": inr, "twd": twd, "bleeding": bleeding, "supplement": supplement,
+        "action": "stop", "new_twd": None, "schedule": None, "followup_days": None, "text": text,
+    }
+    if bleeding:
+        return plan
+
+    band = get_inr_band(inr)
+    plan["followup_days"] = band["followup_days"]
+    if not band["factors"]:
+        plan["action"] = "hold"
+        return plan
+
+    low_factor, high_factor = band["factors"]
+    plan["action"] = "keep" if band["factors"] == (1.0, 1.0) else "increase" if low_factor > 1 else "decrease"
+    plan["new_twd"] = {"min": round(twd * low_factor, 2), "max": round(twd * high_factor, 2)}
+    if plan["action"] != "keep":
+        schedule = solve_warfarin_schedule(twd * low_factor, twd * high_factor)
+        if schedule:
+            plan["schedule"] = {
+                "weekly_mg": schedule["weekly_mg"],
+                "starts_after_hold_days": band.get("hold_days", 0),
+                "days": [
+                    {"day": label, "mg": dose, "tablets": [{"strength_mg": s, "count": h / 2} for s, h in parts]}
+                    for label, (dose, parts) in zip(WARFARIN_DAY_LABELS, schedule["days"])
+                ],
+            }
+    return plan
+
+# ✅ ขนาดเม็ดยา Warfarin ที่มีในคลัง (mg) และจำนวนเม็ดสูงสุดต่อ strength ต่อวัน
+WARFARIN_TABLET_STRENGTHS = (1, 2, 3, 5)
+WARFARIN_MAX_TABLETS_PER_STRENGTH = 2
+# ✅ TWD ที่รับจากผู้ใช้/API (mg/สัปดาห์) นอกช่วงนี้ไม่ใช่ค่าจริงทางคลินิก และทำให้ solver ใช้เวลานานตาม TWD
+WARFARIN_MAX_TWD = 150.0
+WARFARIN_MAX_SCHEDULE_TWD = WARFARIN_MAX_TWD * max(band["factors"][1] for band in INR_BANDS if band["factors"])
+WARFARIN_DAY_LABELS = ("จ.", "อ.", "พ.", "พฤ.", "ศ.", "ส.", "อา.")
+
+
+@lru_cache(maxsize=None)
+def _warfarin_daily_options(strengths):
+    """
+    คืน dict ของขนาดยาต่อวัน (หน่วยครึ่ง mg) → จำนวนครึ่งเม็ดของแต่ละ strength
+    เลือกแบบที่ใช้จำนวนชิ้นน้อยที่สุดและหักครึ่งเม็ดน้อยที่สุด
+    """
+    options = {}
+    max_halves = WARFARIN_MAX_TABLETS_PER_STRENGTH * 2
+    for halves in product(range(max_halves + 1), repeat=len(strengths)):
+        dose = sum(h * s for h, s in zip(halves, strengths))
+        rank = (sum(h % 2 for h in halves), sum(h // 2 + h % 2 for h in halves))
+        if dose not in options or rank < options[dose][0]:
+            options[dose] = (rank, halves)
+    return {dose: halves for dose, (rank, halves) in options.items()}
+
+
+def _warfarin_week_split(weekly, options):
+    """
+    หาขนาดยาต่อวัน 2 ค่า (a ≤ b) ที่รวมกัน 7 วันได้ weekly พอดี โดยให้ b - a น้อยที่สุด
+    คืนค่า (spread, a, b, จำนวนวันที่ใช้ b) หรือ None
+    """
+    best = None
+    doses = sorted(options)
+    for a in doses:
+        if a * 7 > weekly:
+            break
+        if a * 7 == weekly:
+            return (0, a, a, 0)
+        for b in doses:
+            if b <= a:
+                continue
+            spread = b - a
+            if best is not None and spread >= best[0]:
+                break
+            high_days, rem = divmod(weekly - 7 * a, spread)
+            if rem == 0 and high_days <= 7:
+                best = (spread, a, b, high_days)
+                break
+    return best
+
+
+@lru_cache(maxsize=4096)
+def _solve_warfarin_schedule(min_halves, max_halves):
+    best = None
+    for n_strengths in range(1, len(WARFARIN_TABLET_STRENGTHS) + 1):
+        for strengths in combinations(WARFARIN_TABLET_STRENGTHS, n_strengths):
+            options = _warfarin_daily_options(strengths)
+            for weekly in range(min_halves, max_halves + 1):
+                split = _warfarin_week_split(weekly, options)
+                if split is None:
+                    continue
+                spread, low, high, high_days = split
+                used = {
+                    s for dose in (low, high) if dose
+                    for s, h in zip(strengths, options[dose]) if h
+                }
+                splits = (7 - high_days) * sum(h % 2 for h in options[low]) + high_days * sum(h % 2 for h in options[high])
+                score = (len(used), spread, splits, abs(2 * weekly - min_halves - max_halves))
+                if best is None or score < best[0]:
+                    best = (score, strengths, weekly, low, high, high_days)
+        if best is not None:
+            break
+
+    if best is None:
+        return None
+
+    _, strengths, weekly, low, high, high_days = best
+    options = _warfarin_daily_options(strengths)
+    days = []
+    for i in range(7):
+        # กระจายวันที่ใช้ขนาดสูงให้ห่างกันเท่า ๆ กันตลอดสัปดาห์
+        is_high = (i + 1) * high_days // 7 > i * high_days // 7
+        dose = high if is_high else low
+        days.append((dose / 2, tuple((s, h) for s, h in zip(strengths, options[dose]) if h)))
+    return {"weekly_mg": weekly / 2, "days": tuple(days)}
+
+
+def solve_warfarin_schedule(min_twd, max_twd):
+    """
+    แบ่ง TWD ใหม่ (mg/สัปดาห์) เป็นขนาดยารายวันจากเม็ด 1/2/3/5 mg
+    ใช้ strength ให้น้อยชนิดที่สุด หักได้แค่ครึ่งเม็ด และกระจายขนาดยาให้สม่ำเสมอทั้งสัปดาห์
+    """
+    if not (math.isfinite(min_twd) and math.isfinite(max_twd)) or not 0 < max_twd <= WARFARIN_MAX_SCHEDULE_TWD:
+        return None
+    min_halves = math.ceil(min_twd * 2 - 1e-9)
+    max_halves = math.floor(max_twd * 2 + 1e-9)
+    if min_halves > max_halves:
+        # ช่วงแคบกว่าครึ่ง mg (เช่น ลด 10% พอดี) → ใช้ค่าที่ใกล้ที่สุด
+        min_halves = max_halves = round(min_twd + max_twd)
+    return _solve_warfarin_schedule(min_halves, max_halves)
+
+
+def valid_twd(twd):
+    return math.isfinite(twd) and 0 < twd <= WARFARIN_MAX_TWD
+
+
+def precompute_warfarin_schedules(max_twd=105):
+    """เตรียม cache ของตารางยาสำหรับทุก TWD (ทีละ 0.5 mg) และทุก band ที่มีการปรับขนาดยา"""
+    factors = {band["factors"] for band in INR_BANDS if band["factors"] and band["factors"] != (1.0, 1.0)}
+    for i in range(1, int(max_twd * 2) + 1):
+        twd = i / 2
+        for low_factor, high_factor in factors:
+            solve_warfarin_schedule(twd * low_factor, twd * high_factor)
+
+
+def format_warfarin_schedule(schedule, locale=DEFAULT_LOCALE, hold_days=0):
+    msg = message_catalog.table(locale)
+
+    def tablets(halves):
+        whole, half = divmod(halves, 2)
+        if not whole:
+            return "½"
+        return f"{whole}½" if half else f"{whole}"
+
+    lines = [msg["warfarin_schedule_header"](weekly_mg=schedule["weekly_mg"])]
+    if hold_days:
+        lines.append(msg["warfarin_schedule_after_hold"](days=hold_days))
+    groups = {}
+    for label, day in zip(msg["weekday_labels"]().split(), schedule["days"]):
+        groups.setdefault(day, []).append(label)
+    for (dose, parts), labels in groups.items():
+        if parts:
+            detail = " + ".join(msg["warfarin_tablets"](strength=s, tablets=tablets(h)) for s, h in parts)
+        else:
+            detail = msg["warfarin_no_dose"]()
+        lines.append(f"• {' '.join(labels)} {dose:g} mg ({detail})")
+    return "\n".join(lines)
+
+
 def get_inr_followup(inr):
-    if inr < 1.5: return 7
-    elif inr <= 1.9: return 14
-    elif inr <= 3.0: return 56
-    elif inr <= 3.9: return 14
-    elif inr <= 6.0: return 7
-    elif inr <= 8.9: return 5
-    elif inr > 9.0: return 2
-    return None
+    return get_inr_band(inr)["followup_days"]
+
+def inr_followup_date(inr):
+    """วันนัดตรวจ INR ตามวันที่ของคลินิก (CLINIC_TZ)"""
+    return (datetime.now(CLINIC_TZ) + timedelta(days=get_inr_followup(inr))).date()
 
-def get_followup_text(inr):
+
+def get_followup_text(inr, locale=DEFAULT_LOCALE):
+    msg = message_catalog.table(locale)
     days = get_inr_followup(inr)
     if days:
-        date = (datetime.now() + timedelta(days=days)).strftime("%-d %B %Y")
-        return f"📅  คำแนะนำ: ควรตรวจ INR ภายใน {days} วัน\n📌 วันที่ควรตรวจ: {date}"
+        date = inr_followup_date(inr).strftime("%-d %B %Y")
+        text = msg["inr_followup"](days=days, date=date)
+        if reminder_scheduler:
+            text += "\n" + msg["inr_reminder_hint"]()
+        return text
     else:
         return ""
 
 
+def remember_inr_followup(user_id, inr):
+    if reminder_scheduler:
+        user_inr_followups[user_id] = inr_followup_date(inr)
+
+
+def handle_inr_reminder_command(user_id, command, locale=DEFAULT_LOCALE):
+    msg = message_catalog.table(locale)
+    if not reminder_scheduler:
+        return msg["inr_reminder_disabled"]()
+
+    if command.startswith("ยกเลิก"):
+        reminder_scheduler.cancel(user_id)
+        return msg["inr_reminder_cancelled"]()
+
+    due_date = user_inr_followups.pop(user_id, None)
+    if not due_date:
+        return msg["inr_reminder_need_warfarin"]()
+
+    date_text = due_date.strftime("%-d %B %Y")
+    due_at = datetime.combine(due_date, dt_time(INR_REMINDER_HOUR, tzinfo=CLINIC_TZ)).timestamp()
+    reminder_scheduler.schedule(user_id, due_at, msg["inr_reminder_message"](date=date_text))
+    return msg["inr_reminder_set"](date=date_text)
+
 
 def send_supplement_flex(reply_token):
     flex_content = {
@@ -1701,7 +2502,8 @@ def send_supplement_flex(reply_token):
         }
     }
 
-    flex_container = FlexContainer.from_dict(flex_content)
+    with tracer.span("build.flex"):
+        flex_container = FlexContainer.from_dict(flex_content)
 
     messaging_api.reply_message(
         ReplyMessageRequest(
@@ -1753,7 +2555,8 @@ def send_interaction_flex(reply_token):
             "body": {"backgroundColor": "#FFFFFF"}
         }
     }
-    flex_container = FlexContainer.from_dict(flex_content)
+    with tracer.span("build.flex"):
+        flex_container = FlexContainer.from_dict(flex_content)
     messaging_api.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
@@ -1761,8 +2564,139 @@ def send_interaction_flex(reply_token):
         )
     )
 
-def calculate_dose(drug, indication, weight, age=None):
-    
+# ✅ เลือกจำนวนขวดจากหลายขนาดบรรจุ (unbounded knapsack แบบ cover ≥ ml ที่ต้องใช้)
+# ตารางคำนวณครั้งเดียวต่อชุดขนาดขวด แล้วขยายเมื่อมีคอร์สที่ยาวกว่าเดิม → ต่อ request เป็นแค่ table lookup
+# (เก็บใน cache ของ formulary version ปัจจุบัน และสร้างไว้ล่วงหน้าตอนโหลด formulary)
+# ตารางยาวไม่เกิน PACK_TABLE_MAX_BUCKETS ml: ส่วนที่เกินใส่ขวดใหญ่สุดก่อน แล้วใช้ตารางกับเศษที่เหลือ
+PACK_TABLE_MAX_BUCKETS = 4096
+
+
+def _pack_table(pack_sizes, pack_prices, min_buckets, tables=None):
+    if tables is None:
+        tables = formulary_store.snapshot().cache("pack_tables")
+    key = (pack_sizes, pack_prices)
+    table = tables.get(key)
+    if table is not None and len(table[0]) > min_buckets:
+        return table
+
+    size = min(max(min_buckets + 1, 2 * len(table[0]) if table else 512), PACK_TABLE_MAX_BUCKETS + 1)
+    best = [(0, 0)] * size  # (cost หรือ ml รวม, จำนวนขวด) ที่น้อยที่สุดเพื่อให้ได้ ≥ b ml
+    choice = [0] * size
+    for b in range(1, size):
+        candidate = None
+        for i, pack in enumerate(pack_sizes):
+            cost = pack_prices[i] if pack_prices else pack
+            prev_cost, prev_count = best[max(0, b - pack)]
+            option = (prev_cost + cost, prev_count + 1)
+            if candidate is None or option < candidate:
+                candidate = option
+                choice[b] = pack
+        best[b] = candidate
+
+    table = (best, choice)
+    tables[key] = table
+    return table
+
+
+def optimize_packs(drug_info, ml_total):
+    """
+    คืน list ของขนาดขวดที่ต้องจ่ายเพื่อให้ครอบคลุม ml_total
+    ถ้ามี pack_prices จะเลือกแบบราคาต่ำสุด ไม่งั้นเลือกแบบเหลือทิ้งน้อยสุด (เสมอกันเลือกจำนวนขวดน้อยกว่า)
+    """
+    pack_sizes = tuple(drug_info["pack_sizes_ml"])
+    pack_prices = tuple(drug_info["pack_prices"]) if drug_info.get("pack_prices") else None
+    if not math.isfinite(ml_total):
+        raise ValueError(f"ml_total ต้องเป็นตัวเลขจำกัด: {ml_total}")
+    bucket = max(0, math.ceil(ml_total - 1e-9))
+
+    packs = []
+    if bucket > PACK_TABLE_MAX_BUCKETS:
+        largest = max(pack_sizes)
+        count = -(-(bucket - PACK_TABLE_MAX_BUCKETS) // largest)
+        packs = [largest] * count
+        bucket -= largest * count
+    _, choice = _pack_table(pack_sizes, pack_prices, bucket)
+
+    while bucket > 0:
+        pack = choice[bucket]
+        packs.append(pack)
+        bucket -= pack
+    return sorted(packs, reverse=True)
+
+
+def warm_formulary(snapshot):
+    # เรียกใน thread ที่โหลด formulary ก่อน publish → request แรกของ version ใหม่ไม่ต้องสร้างตารางเอง
+    tables = snapshot.cache("pack_tables")
+    for info in list(snapshot.drugs.values()) + list(snapshot.special_drugs.values()):
+        if info.get("pack_sizes_ml"):
+            prices = tuple(info["pack_prices"]) if info.get("pack_prices") else None
+            _pack_table(tuple(info["pack_sizes_ml"]), prices, 0, tables)
+    snapshot.cache("drug_names", lambda: {name.lower(): name for name in snapshot.drugs})
+    snapshot.cache("unsupported_indications", lambda: find_unsupported(snapshot.drugs))
+    snapshot.cache("drug_kinds", lambda: _drug_kinds(snapshot))
+    snapshot.cache("drug_search", lambda: _drug_search(snapshot))
+    snapshot.cache("indication_index", lambda: _indication_index(snapshot))
+
+
+formulary_store.warmers.append(warm_formulary)
+warm_formulary(formulary_store.current)
+
+FORMULARY_FILE = os.environ.get("FORMULARY_FILE")
+if FORMULARY_FILE:
+    if os.path.exists(FORMULARY_FILE):
+        formulary_store.reload(FORMULARY_FILE)
+    formulary_store.watch(FORMULARY_FILE, interval_sec=float(os.environ.get("FORMULARY_WATCH_SEC", 5)))
+
+
+def format_bottle_line(drug_info, ml_total, locale=DEFAULT_LOCALE):
+    msg = message_catalog.table(locale)
+    packs = optimize_packs(drug_info, ml_total)
+    sizes = sorted(set(packs), reverse=True)
+    if len(sizes) <= 1:
+        size = sizes[0] if sizes else drug_info["pack_sizes_ml"][0]
+        return msg["bottle_line"](ml=ml_total, count=len(packs), size=size)
+    detail = " + ".join(f"{size} ml × {packs.count(size)}" for size in sizes)
+    return msg["bottle_mix_line"](ml=ml_total, count=len(packs), detail=detail)
+
+
+def format_min_age(min_age, locale=DEFAULT_LOCALE):
+    """อายุขั้นต่ำ (ปี, ทศนิยม) → "1 ปี 6 เดือน" / "6 เดือน" ตามภาษา"""
+    msg = message_catalog.table(locale)
+    total_months = int(round(min_age * 12))
+    years, months = divmod(total_months, 12)
+    parts = []
+    if years > 0:
+        parts.append(msg["age_years"](years=years))
+    if months > 0 or not parts:
+        parts.append(msg["age_months"](months=months))
+    return " ".join(parts)
+
+
+def _dose_by_day_days(day_key, duration):
+    """แปลง key เช่น 'Day 1', 'Day 2-5', 'Day 2+' เป็นจำนวนวัน"""
+    match = re.match(r"Day\s*(\d+)\s*(?:-\s*(\d+)|(\+))?", day_key)
+    if not match:
+        return 0
+    start = int(match.group(1))
+    if match.group(2):
+        return int(match.group(2)) - start + 1
+    if match.group(3):
+        return max(duration - start + 1, 0)
+    return 1
+
+
+# น้ำหนักที่เกินนี้ถือว่าพิมพ์ผิด (ไม่คำนวณ และไม่ให้ค่ามหาศาลไปถึงตารางขวด)
+MAX_WEIGHT_KG = 250.0
+
+
+def valid_weight(weight):
+    return math.isfinite(weight) and 0 < weight <= MAX_WEIGHT_KG
+
+
+def calculate_dose(drug, indication, weight, age=None, locale=DEFAULT_LOCALE):
+    msg = message_catalog.table(locale)
+    if not valid_weight(weight):
+        return msg["weight_out_of_range"](max_weight=MAX_WEIGHT_KG)
     MIN_AGE_LIMITS = {
         "Cefixime": 0.5,          # 6 เดือน
         "Cefdinir": 0.5,          # 6 เดือน
@@ -1773,43 +2707,26 @@ def calculate_dose(drug, indication, weight, age=None):
     if age is not None:
         min_age = MIN_AGE_LIMITS.get(drug)
         if min_age is not None and age < min_age:
-            # 🔁 แปลง min_age (float) → ปี เดือน
-            total_months = int(round(min_age * 12))
-            display_years = total_months // 12
-            display_months = total_months % 12
-
-            parts = []
-            if display_years > 0:
-                parts.append(f"{display_years} ปี")
-            if display_months > 0:
-                parts.append(f"{display_months} เดือน")
-            if not parts:
-                parts.append("0 เดือน")
-
-            readable_min_age = " ".join(parts)
-
-            return f"❌ ไม่แนะนำให้ใช้ {drug} ในเด็กอายุน้อยกว่า {readable_min_age}"
+            return msg["age_gate"](drug=drug, min_age=format_min_age(min_age, locale))
     
     drug_info = DRUG_DATABASE.get(drug)
     if not drug_info:
-        return f"❌ ไม่พบข้อมูลยา {drug}"
+        return msg["drug_not_found"](drug=drug)
 
     indication_info = drug_info["indications"].get(indication)
     if not indication_info:
-        return f"❌ ไม่พบ indication {indication} ใน {drug}"
+        return msg["indication_not_found"](drug=drug, indication=indication)
+    if (drug, indication) in unsupported_indications():
+        return msg["indication_unsupported"](drug=drug, indication=indication)
 
     conc = drug_info["concentration_mg_per_ml"]
-    bottle_size = drug_info["bottle_size_ml"]
     total_ml = 0
-    reply_lines = [f"{drug} - {indication} (น้ำหนัก {weight} kg):"]
+    reply_lines = [msg["dose_header"](drug=drug, indication=indication, weight=weight)]
 
     # ✅ รองรับกรณี indication เป็น dict ซ้อน (sub-indications)
     if isinstance(indication_info, dict) and all(isinstance(v, dict) for v in indication_info.values()):
         for sub_ind, sub_info in indication_info.items():
-            dose_per_kg = sub_info.get("dose_mg_per_kg_per_day")
-            if dose_per_kg is None:
-                continue  # ✅ ข้ามถ้าไม่ใช่แบบ weight-based
-
+            dose_per_kg = sub_info["dose_mg_per_kg_per_day"]
             freqs = sub_info["frequency"] if isinstance(sub_info["frequency"], list) else [sub_info["frequency"]]
             days = sub_info["duration_days"]
             max_mg_day = sub_info.get("max_mg_per_day")
@@ -1835,14 +2752,14 @@ def calculate_dose(drug, indication, weight, age=None):
                 min_dose_per_time, max_dose_per_time = sorted([min_dose_per_time, max_dose_per_time])
 
                 
-                reply_lines.append(
-                    f"📌 {sub_ind}: {min_dose} – {max_dose} mg/kg/day → {min_total_mg_day:.0f} – {max_total_mg_day:.0f} mg/day ≈ "
-                    f"{ml_per_day_min:.1f} – {ml_per_day_max:.1f} ml/day, แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
-                    f"(ครั้งละ ~{min_dose_per_time:.1f} – {max_dose_per_time:.1f} ml)"
-                )
+                reply_lines.append(msg["perkg_range_line"](
+                    prefix=f"📌 {sub_ind}:", min_dose=min_dose, max_dose=max_dose,
+                    min_mg=min_total_mg_day, max_mg=max_total_mg_day, min_ml=ml_per_day_min, max_ml=ml_per_day_max,
+                    min_freq=min_freq, max_freq=max_freq, days=days,
+                    min_dose_ml=min_dose_per_time, max_dose_ml=max_dose_per_time,
+                ))
                  # ✅ เพิ่มส่วนนี้เพื่อคำนวณขวดของ sub นี้เท่านั้น
-                bottles_needed = math.ceil(ml_total / bottle_size)
-                reply_lines.append(f"→ รวม {ml_total:.1f} ml ≈ {bottles_needed} ขวด (ขวดละ {bottle_size} ml)")
+                reply_lines.append(format_bottle_line(drug_info, ml_total, locale))
             else:
                 total_mg_day = weight * dose_per_kg
                 if max_mg_day:
@@ -1855,31 +2772,28 @@ def calculate_dose(drug, indication, weight, age=None):
                     ml_per_dose = ml_per_day / freq
                     if max_mg_per_dose:
                         ml_per_dose = min(ml_per_dose, max_mg_per_dose / conc)
-                    reply_lines.append(
-                        f"📌 {sub_ind}: {dose_per_kg} mg/kg/day → {total_mg_day:.0f} mg/day ≈ {ml_per_day:.1f} ml/day, "
-                        f"ครั้งละ ~{ml_per_dose:.1f} ml × {freq} ครั้ง/วัน × {days} วัน"
-                    )
+                    reply_lines.append(msg["perkg_once_line"](
+                        prefix=f"📌 {sub_ind}:", dose_per_kg=dose_per_kg, mg=total_mg_day, ml=ml_per_day,
+                        dose_ml=ml_per_dose, freq=freq, days=days,
+                    ))
                 else:
                     min_freq = min(freqs)
                     max_freq = max(freqs)
-                    reply_lines.append(
-                        f"📌 {sub_ind}: {dose_per_kg} mg/kg/day → {total_mg_day:.0f} mg/day ≈ {ml_per_day:.1f} ml/day, "
-                        f"แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน (ครั้งละ ~{ml_per_day / max_freq:.1f} – {ml_per_day / min_freq:.1f} ml)"
-                    )
+                    reply_lines.append(msg["perkg_split_line"](
+                        prefix=f"📌 {sub_ind}:", dose_per_kg=dose_per_kg, mg=total_mg_day, ml=ml_per_day,
+                        min_freq=min_freq, max_freq=max_freq, days=days,
+                        min_dose_ml=ml_per_day / max_freq, max_dose_ml=ml_per_day / min_freq,
+                    ))
                 # ✅ เพิ่มตรงนี้เพื่อแสดงจำนวนขวดเฉพาะของ sub นี้
-                bottles_needed = math.ceil(ml_total / bottle_size)
-                reply_lines.append(f"→ รวม {ml_total:.1f} ml ≈ {bottles_needed} ขวด (ขวดละ {bottle_size} ml)")
+                reply_lines.append(format_bottle_line(drug_info, ml_total, locale))
 
 
             if note:
-                reply_lines.append(f"📝 หมายเหตุ: {note}")
+                reply_lines.append(msg["note_line"](note=note))
 
     # ✅ รองรับหลายช่วงวัน (list)
     elif isinstance(indication_info, list):
         for phase in indication_info:
-            if not isinstance(phase, dict):
-                continue
-
             total_mg_day = None
             dose_type = None
 
@@ -1904,10 +2818,43 @@ def calculate_dose(drug, indication, weight, age=None):
 
             elif "dose_mg" in phase:
                 total_mg_day = phase["dose_mg"]
+                if isinstance(total_mg_day, list):
+                    total_mg_day = tuple(total_mg_day)
                 dose_type = "fixed"
 
+            elif isinstance(phase.get("dose_by_day"), dict):
+                # ✅ regimen ที่ขนาดยาต่างกันตามวัน เช่น Day 1 / Day 2-5
+                title = get_indication_title(phase)
+                if title:
+                    reply_lines.append(f"\n🔹 {title}")
+
+                duration = phase.get("duration_days") or phase.get("duration_days_range", [0])[0]
+                if isinstance(duration, list):
+                    duration = max(duration)
+                freq = phase.get("frequency", 1)
+                freq = max(freq) if isinstance(freq, list) else freq
+
+                ml_phase = 0
+                for day_key, day_data in phase["dose_by_day"].items():
+                    n_days = _dose_by_day_days(day_key, duration)
+                    dose_per_kg = day_data.get("dose_mg_per_kg_per_day") or day_data.get("dose_mg_per_kg")
+                    day_mg = weight * dose_per_kg if dose_per_kg is not None else day_data.get("dose_mg", 0)
+                    if day_data.get("max_mg_per_day"):
+                        day_mg = min(day_mg, day_data["max_mg_per_day"])
+                    day_ml = day_mg / conc
+                    ml_phase += day_ml * n_days
+                    reply_lines.append(msg["fixed_line"](
+                        label=f"📆 {day_key}:", mg=day_mg, ml=day_ml, freq=freq, days=n_days, dose_ml=day_ml / freq,
+                    ))
+
+                reply_lines.append(format_bottle_line(drug_info, ml_phase, locale))
+                note = phase.get("note")
+                if note:
+                    reply_lines.append(msg["note_line"](note=note))
+                continue
+
             else:
-                continue  # ❌ ข้ามถ้าไม่มี dose
+                continue  # ❌ ช่วงที่ไม่มี dose (schema แจ้งเตือนไว้ตอนโหลด)
 
             # ✅ ชื่อ label/title
             title = get_indication_title(phase)
@@ -1932,20 +2879,18 @@ def calculate_dose(drug, indication, weight, age=None):
                 min_dose_per_time, max_dose_per_time = sorted([min_dose_per_time, max_dose_per_time])
                 
                 if min_freq == max_freq:
-                    reply_lines.append(
-                        f"{day_label} {min_mg:.0f} – {max_mg:.0f} mg/day ≈ {ml_per_day_min:.1f} – {ml_per_day_max:.1f} ml/day, "
-                        f"แบ่งวันละ {min_freq} ครั้ง × {days} วัน "
-                        f"(ครั้งละ ~{min_dose_per_time:.1f} – {max_dose_per_time:.1f} ml)"
-                    )
+                    reply_lines.append(msg["range_line"](
+                        label=day_label, min_mg=min_mg, max_mg=max_mg, min_ml=ml_per_day_min, max_ml=ml_per_day_max,
+                        freq=min_freq, days=days, min_dose_ml=min_dose_per_time, max_dose_ml=max_dose_per_time,
+                    ))
                 else:
-                    reply_lines.append(
-                        f"{day_label} {min_mg:.0f} – {max_mg:.0f} mg/day ≈ {ml_per_day_min:.1f} – {ml_per_day_max:.1f} ml/day, "
-                        f"แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
-                        f"(ครั้งละ ~{min_dose_per_time:.1f} – {max_dose_per_time:.1f} ml)"
-                    )
+                    reply_lines.append(msg["range_line_freqs"](
+                        label=day_label, min_mg=min_mg, max_mg=max_mg, min_ml=ml_per_day_min, max_ml=ml_per_day_max,
+                        min_freq=min_freq, max_freq=max_freq, days=days,
+                        min_dose_ml=min_dose_per_time, max_dose_ml=max_dose_per_time,
+                    ))
                 # ✅ คำนวณขวดเฉพาะของช่วงนี้
-                bottles_needed = math.ceil(ml_total / bottle_size)
-                reply_lines.append(f"→ รวม {ml_total:.1f} ml ≈ {bottles_needed} ขวด (ขวดละ {bottle_size} ml)")  
+                reply_lines.append(format_bottle_line(drug_info, ml_total, locale))
 
             else:
                 ml_per_day = total_mg_day / conc
@@ -1959,32 +2904,26 @@ def calculate_dose(drug, indication, weight, age=None):
                     if "max_mg_per_dose" in phase:
                         ml_per_dose = min(ml_per_dose, phase["max_mg_per_dose"] / conc)
 
-                    reply_lines.append(
-                        f"{day_label} {total_mg_day:.0f} mg/day ≈ {ml_per_day:.1f} ml/day, "
-                        f"แบ่งวันละ {min_freq} ครั้ง × {days} วัน (ครั้งละ ~{ml_per_dose:.1f} ml)"
-                    )
+                    reply_lines.append(msg["fixed_line"](
+                        label=day_label, mg=total_mg_day, ml=ml_per_day, freq=min_freq, days=days, dose_ml=ml_per_dose,
+                    ))
                 else:
-                    reply_lines.append(
-                        f"{day_label} {total_mg_day:.0f} mg/day ≈ {ml_per_day:.1f} ml/day, "
-                        f"แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
-                        f"(ครั้งละ ~{ml_per_day / max_freq:.1f} – {ml_per_day / min_freq:.1f} ml)"
-                    )
+                    reply_lines.append(msg["fixed_line_freqs"](
+                        label=day_label, mg=total_mg_day, ml=ml_per_day, min_freq=min_freq, max_freq=max_freq, days=days,
+                        min_dose_ml=ml_per_day / max_freq, max_dose_ml=ml_per_day / min_freq,
+                    ))
                 # ✅ คำนวณขวดเฉพาะของช่วงนี้
-                bottles_needed = math.ceil(ml_phase / bottle_size)
-                reply_lines.append(f"→ รวม {ml_phase:.1f} ml ≈ {bottles_needed} ขวด (ขวดละ {bottle_size} ml)")
+                reply_lines.append(format_bottle_line(drug_info, ml_phase, locale))
 
             note = phase.get("note")
             if note:
-                reply_lines.append(f"📝 หมายเหตุ: {note}")
+                reply_lines.append(msg["note_line"](note=note))
 
 
 
     # ✅ กรณี indication เป็น dict ธรรมดา
     else:
-        dose_per_kg = indication_info.get("dose_mg_per_kg_per_day")
-        if dose_per_kg is None:
-            return "❌ ไม่พบข้อมูล dose_mg_per_kg_per_day ใน indication นี้"
-
+        dose_per_kg = indication_info["dose_mg_per_kg_per_day"]
         freqs = indication_info["frequency"] if isinstance(indication_info["frequency"], list) else [indication_info["frequency"]]
         days = indication_info["duration_days"]
         max_mg_day = indication_info.get("max_mg_per_day")
@@ -2008,11 +2947,12 @@ def calculate_dose(drug, indication, weight, age=None):
             max_dose_per_time = max(ml_per_day_min / min_freq, ml_per_day_max / max_freq)
             min_dose_per_time, max_dose_per_time = sorted([min_dose_per_time, max_dose_per_time])
 
-            reply_lines.append(
-                f"ขนาดยา: {min_dose} – {max_dose} mg/kg/day → {min_total_mg_day:.0f} – {max_total_mg_day:.0f} mg/day ≈ "
-                f"{ml_per_day_min:.1f} – {ml_per_day_max:.1f} ml/day, แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
-                f"(ครั้งละ ~{min_dose_per_time:.1f} – {max_dose_per_time:.1f} ml)"
-            )
+            reply_lines.append(msg["perkg_range_line"](
+                prefix=msg["dose_label"](), min_dose=min_dose, max_dose=max_dose,
+                min_mg=min_total_mg_day, max_mg=max_total_mg_day, min_ml=ml_per_day_min, max_ml=ml_per_day_max,
+                min_freq=min_freq, max_freq=max_freq, days=days,
+                min_dose_ml=min_dose_per_time, max_dose_ml=max_dose_per_time,
+            ))
         else:
             total_mg_day = weight * dose_per_kg
             if max_mg_day:
@@ -2026,27 +2966,31 @@ def calculate_dose(drug, indication, weight, age=None):
                 ml_per_dose = ml_per_day / freq
                 if "max_mg_per_dose" in indication_info:
                     ml_per_dose = min(ml_per_dose, indication_info["max_mg_per_dose"] / conc)
-                reply_lines.append(
-                    f"ขนาดยา: {dose_per_kg} mg/kg/day → {total_mg_day:.0f} mg/day ≈ {ml_per_day:.1f} ml/day, "
-                    f"ครั้งละ ~{ml_per_dose:.1f} ml × {freq} ครั้ง/วัน × {days} วัน"
-                )
+                reply_lines.append(msg["perkg_once_line"](
+                    prefix=msg["dose_label"](), dose_per_kg=dose_per_kg, mg=total_mg_day, ml=ml_per_day,
+                    dose_ml=ml_per_dose, freq=freq, days=days,
+                ))
             else:
                 min_freq = min(freqs)
                 max_freq = max(freqs)
-                reply_lines.append(
-                    f"ขนาดยา: {dose_per_kg} mg/kg/day → {total_mg_day:.0f} mg/day ≈ {ml_per_day:.1f} ml/day, "
-                    f"แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
-                    f"(ครั้งละ ~{ml_per_day / max_freq:.1f} – {ml_per_day / min_freq:.1f} ml)"
-                )
+                reply_lines.append(msg["perkg_split_line"](
+                    prefix=msg["dose_label"](), dose_per_kg=dose_per_kg, mg=total_mg_day, ml=ml_per_day,
+                    min_freq=min_freq, max_freq=max_freq, days=days,
+                    min_dose_ml=ml_per_day / max_freq, max_dose_ml=ml_per_day / min_freq,
+                ))
         note = indication_info.get("note")
         if note:
-            reply_lines.append(f"\n📝 หมายเหตุ: {note}")
+            reply_lines.append("\n" + msg["note_line"](note=note))
 
     return "\n".join(reply_lines)
 
-def calculate_special_drug(user_id, drug, weight, age):
+def calculate_special_drug(user_id, drug, weight, age, indication=None, locale=DEFAULT_LOCALE):
+    msg = message_catalog.table(locale)
+    if not valid_weight(weight):
+        return msg["weight_out_of_range"](max_weight=MAX_WEIGHT_KG)
     info = SPECIAL_DRUGS[drug]
-    indication = user_drug_selection.get(user_id, {}).get("indication")
+    if indication is None:
+        indication = user_drug_selection.get(user_id, {}).get("indication")
     indication_info = next(iter(info["indications"].values()))
     concentration = info["concentration_mg_per_ml"]
 
@@ -2056,7 +3000,7 @@ def calculate_special_drug(user_id, drug, weight, age):
         if indication == "mucolytic (age-based)":
             data = info["indications"]["mucolytic (age-based)"]
 
-            reply_lines = [f"🧪 {drug} - การใช้แบบอิงอายุ", f"(น้ำหนัก {weight:.1f} kg, อายุ {age:.1f} ปี):\n"]
+            reply_lines = [msg["carbocysteine_age_title"](drug=drug), msg["special_patient"](weight=weight, age=age) + "\n"]
 
             matched = False
             for profile in data:
@@ -2069,46 +3013,46 @@ def calculate_special_drug(user_id, drug, weight, age):
                     for dose in dose_range:
                         dose_per_time = min(dose, profile["max_mg_per_day"])
                         volume = round(dose_per_time / concentration, 1)
-                        reply_lines.append(f"ขนาดยา: {dose_per_time:.1f} mg × วันละ {freq_str} ครั้ง ≈ ~{volume:.1f} ml/ครั้ง")
+                        reply_lines.append(msg["special_dose_times"](mg=dose_per_time, freq=freq_str, ml=volume))
 
                     if "note" in profile:
-                        reply_lines.append(f"\n📌 หมายเหตุ: {profile['note']}")
+                        reply_lines.append("\n" + msg["special_note"](note=profile['note']))
                     matched = True
                     break
 
             if not matched:
-                reply_lines.append("❌ ไม่พบช่วงอายุที่รองรับ")
+                reply_lines.append(msg["age_range_not_found"]())
 
             return "\n".join(reply_lines)
 
         elif indication == "mucolytic (weight-based)":
             data = info["indications"]["mucolytic (weight-based)"]
             if age < data["age_min"]:
-                return f"❌ ไม่แนะนำการใช้ Carbocysteine ตามน้ำหนักในเด็กอายุน้อยกว่า {data['age_min']} ปี"
+                return msg["age_gate_weight_based"](drug="Carbocysteine", min_age=format_min_age(data["age_min"], locale))
 
             dose_min, dose_max = data["dose_mg_per_kg_per_day"]
             freqs = data["frequency"]
             max_dose = data["max_mg_per_day"]
 
-            reply_lines = [f"🧪 {drug} - การใช้แบบอิงน้ำหนัก", f"(น้ำหนัก {weight:.1f} kg, อายุ {age:.1f} ปี):\n"]
+            reply_lines = [msg["carbocysteine_weight_title"](drug=drug), msg["special_patient"](weight=weight, age=age) + "\n"]
 
             for dose_per_kg in [dose_min, dose_max]:
                 total_mg_day = weight * dose_per_kg
-                reply_lines.append(f"💊 ขนาดรวมทั้งวัน: {dose_per_kg:.1f} mg/kg/day × {weight:.1f} kg = {total_mg_day:.1f} mg/day")
+                reply_lines.append(msg["special_daily_total"](dose_per_kg=dose_per_kg, weight=weight, mg=total_mg_day))
 
                 for freq in freqs:
                     dose_per_time = min(total_mg_day / freq, max_dose)
                     volume = round(dose_per_time / concentration, 1)
-                    reply_lines.append(f"  → วันละ {freq} ครั้ง → ครั้งละ ~{dose_per_time:.1f} mg ≈ ~{volume:.1f} ml/ครั้ง")
+                    reply_lines.append("  " + msg["special_split_line"](freq=freq, mg=dose_per_time) + msg["special_split_ml"](ml=volume))
 
-            reply_lines.append("\n📌 หมายเหตุ: ขนาดยาไม่ควรเกิน 2,250 mg/วัน")
+            reply_lines.append("\n" + msg["carbocysteine_max_note"]())
             return "\n".join(reply_lines)
 
         else:
-            return f"❌ ยังไม่รองรับข้อบ่งใช้ {indication} ของ {drug}"
+            return msg["special_indication_unsupported"](indication=indication, drug=drug)
     
     if drug == "Hydroxyzine" and age < 2:
-        return "❌ ไม่แนะนำให้ใช้ Hydroxyzine ในเด็กอายุน้อยกว่า 2 ปี"
+        return msg["age_gate"](drug="Hydroxyzine", min_age=format_min_age(2, locale))
 
     if drug == "Hydroxyzine":
         if indication in ["Anxiety", "Pruritus (age-based)"]:
@@ -2123,21 +3067,19 @@ def calculate_special_drug(user_id, drug, weight, age):
                 freq_str = f"{min(freqs)}–{max(freqs)}" if len(freqs) > 1 else f"{freqs[0]}"
 
                 reply_lines = [
-                    f"🧪 {drug} - {indication}",
-                    f"(น้ำหนัก {weight:.1f} kg, อายุ {age:.1f} ปี):\n",
-                    f"🔹 อายุน้อยกว่า 6 ปี",
-                    f"ขนาดยา: {dose:.1f} mg × วันละ {freq_str} ครั้ง ≈ ~{volume:.1f} ml/ครั้ง",
+                    msg["special_title"](drug=drug, indication=indication),
+                    msg["special_patient"](weight=weight, age=age) + "\n",
+                    msg["hydroxyzine_under_6"](),
+                    msg["special_dose_times"](mg=dose, freq=freq_str, ml=volume),
                 ]
 
                 # หมายเหตุแยกตาม indication
                 if indication == "Anxiety":
                     reply_lines.append("")
-                    reply_lines.append("📌 หมายเหตุเพิ่มเติม: แม้ FDA จะอนุมัติให้ใช้ในเด็ก <6 ปี แต่แนวทางผู้เชี่ยวชาญส่วนใหญ่ไม่แนะนำให้ใช้ยาในกลุ่มนี้")
+                    reply_lines.append(msg["hydroxyzine_anxiety_under_6_note"]())
                 elif indication == "Pruritus (age-based)":
                     reply_lines.append("")
-                    reply_lines.append(
-                        "📌 หมายเหตุ: อ้างอิงจากการศึกษาทางเภสัชจลนศาสตร์ ยานี้อาจให้วันละครั้ง (ก่อนนอน) หรือวันละ 2 ครั้งก็เพียงพอ เนื่องจากมีครึ่งชีวิตยาว"
-                    )
+                    reply_lines.append(msg["hydroxyzine_pruritus_under_6_note"]())
 
                 return "\n".join(reply_lines)
 
@@ -2149,25 +3091,23 @@ def calculate_special_drug(user_id, drug, weight, age):
                 freq_str = f"{min(freqs)}–{max(freqs)}" if len(freqs) > 1 else f"{freqs[0]}"
 
                 reply_lines = [
-                    f"🧪 {drug} - {indication}",
-                    f"(น้ำหนัก {weight:.1f} kg, อายุ {age:.1f} ปี):\n",
-                    f"🔹 อายุตั้งแต่ 6 ปีขึ้นไป"
+                    msg["special_title"](drug=drug, indication=indication),
+                    msg["special_patient"](weight=weight, age=age) + "\n",
+                    msg["hydroxyzine_6_and_over"](),
                 ]
 
                 for dose in dose_range:
                     dose_per_time = min(dose, max_dose)
                     volume = round(dose_per_time / concentration, 1)
-                    reply_lines.append(f"ขนาดยา: {dose_per_time:.1f} mg × วันละ {freq_str} ครั้ง ≈ ~{volume:.1f} ml/ครั้ง")
+                    reply_lines.append(msg["special_dose_times"](mg=dose_per_time, freq=freq_str, ml=volume))
 
                 reply_lines.append("")
 
                 # หมายเหตุแยกตาม indication
                 if indication == "Anxiety":
-                    reply_lines.append("📌 หมายเหตุเพิ่มเติม: แนวทางผู้เชี่ยวชาญไม่แนะนำให้ใช้ Hydroxyzine ในเด็กเพื่อรักษาภาวะวิตกกังวล")
+                    reply_lines.append(msg["hydroxyzine_anxiety_note"]())
                 elif indication == "Pruritus (age-based)":
-                    reply_lines.append(
-                        "📌 หมายเหตุ: จากการศึกษาทางเภสัชจลนศาสตร์ อาจให้วันละครั้ง (ก่อนนอน) หรือวันละ 2 ครั้งก็เพียงพอ เนื่องจากมีครึ่งชีวิตยาว"
-                    )
+                    reply_lines.append(msg["hydroxyzine_pruritus_note"]())
 
                 return "\n".join(reply_lines)
 
@@ -2189,27 +3129,29 @@ def calculate_special_drug(user_id, drug, weight, age):
                     volume = round(dose_per_time / concentration, 1)
                     dose_lines.append((freq, dose_per_time, volume))
 
-                reply_text = (
-                    f"🧪 {drug} - {indication} (≤40kg)\n"
-                    f"(น้ำหนัก {weight:.1f} kg, อายุ {age:.1f} ปี):\n\n"
-                    f"ขนาดยา: {total_mg_day:.1f} mg/day\n"
-                    f"  → วันละ {dose_lines[0][0]} ครั้ง → ครั้งละ ~{dose_lines[0][1]:.1f} mg ≈ ~{dose_lines[0][2]:.1f} ml/ครั้ง\n"
-                    f"  → วันละ {dose_lines[1][0]} ครั้ง → ครั้งละ ~{dose_lines[1][1]:.1f} mg ≈ ~{dose_lines[1][2]:.1f} ml/ครั้ง\n\n"
-                    f"📌 หมายเหตุ: จากการศึกษาทางเภสัชจลนศาสตร์ อาจให้วันละครั้ง (ก่อนนอน) หรือวันละ 2 ครั้งก็เพียงพอ เนื่องจากมีครึ่งชีวิตยาว"
-                )
+                reply_lines = [
+                    msg["special_title"](drug=drug, indication=indication) + " (≤40kg)",
+                    msg["special_patient"](weight=weight, age=age) + "\n",
+                    msg["special_daily_dose"](mg=total_mg_day),
+                ]
+                for freq, dose_per_time, volume in dose_lines[:2]:
+                    reply_lines.append("  " + msg["special_split_line"](freq=freq, mg=dose_per_time) + msg["special_split_ml"](ml=volume))
+                reply_lines.append("\n" + msg["hydroxyzine_pruritus_note"]())
 
-                return reply_text
+                return "\n".join(reply_lines)
 
         else:
-            return f"❌ ยังไม่รองรับข้อบ่งใช้ {indication} ของ {drug}"
+            return msg["special_indication_unsupported"](indication=indication, drug=drug)
 
     
     if drug in ["Cetirizine"]:
-        data = info["indications"][indication]
+        data = info["indications"].get(indication)
+        if not data:
+            return msg["special_indication_not_found"](indication=indication)
         concentration = info["concentration_mg_per_ml"]
 
         if drug == "Cetirizine" and age < 0.5:
-            return "❌ ไม่แนะนำให้ใช้ในเด็กอายุน้อยกว่า 6 เดือน"
+            return msg["age_gate_indication"](min_age=format_min_age(0.5, locale))
 
         # ✅ แปลงช่วงอายุ
         if drug == "Cetirizine" and indication == "Anaphylaxis (adjunctive only)":
@@ -2232,18 +3174,18 @@ def calculate_special_drug(user_id, drug, weight, age):
                 elif "above_or_equal_6" in data:
                     age_key = "above_or_equal_6"
                 else:
-                    return f"❌ ยังไม่มีข้อมูลช่วงอายุนี้ใน indication {indication}"   
+                    return msg["age_range_missing"](indication=indication)
             elif age >= 12:
                 age_key = "above_or_equal_12"
             else:
-                return f"❌ ไม่พบช่วงอายุที่เหมาะสม (อายุ {age} ปี)"
+                return msg["age_range_unsuitable"](age=age)
 
         # ✅ ตรวจสอบว่ามีข้อมูลช่วงอายุนี้หรือไม่
         profile = data.get(age_key)
         if not profile:
-            return f"❌ ยังไม่มีข้อมูลช่วงอายุนี้ใน indication {indication}"
+            return msg["age_range_missing"](indication=indication)
 
-        lines = [f"{drug} - {indication} (อายุ {age:.1f} ปี):"]
+        lines = [msg["special_header_age"](drug=drug, indication=indication, age=age)]
 
         def format_frequency(freqs):
             freqs = sorted(set(freqs))
@@ -2251,53 +3193,48 @@ def calculate_special_drug(user_id, drug, weight, age):
                 return f"{freqs[0]}"
             if freqs == list(range(freqs[0], freqs[-1] + 1)):
                 return f"{freqs[0]}–{freqs[-1]}"
-            return " หรือ ".join(str(f) for f in freqs)
+            return msg["frequency_or"]().join(str(f) for f in freqs)
 
         # 👉 แบบ initial_dose + options
         if "initial_dose_mg" in profile and "options" in profile:
             init_dose = profile["initial_dose_mg"]
             init_freq = profile["frequency"]
             init_vol = round(init_dose / concentration, 1)
-            lines.append("💊 ขนาดยาแนะนำ:")
-            lines.append(f"• เริ่มต้น: {init_dose} mg × {init_freq} ครั้ง/วัน ≈ ~{init_vol} ml/ครั้ง")
+            lines.append(msg["cetirizine_recommended"]())
+            lines.append(msg["cetirizine_initial"](mg=init_dose, freq=init_freq, ml=init_vol))
             if profile.get("options"):
-                lines.append("• ตัวเลือกอื่น:")
+                lines.append(msg["cetirizine_options"]())
                 for opt in profile["options"]:
                     dose = opt["dose_mg"]
                     freq = opt["frequency"]
                     vol = round(dose / concentration, 1)
-                    lines.append(f"   - {dose} mg × {freq} ครั้ง/วัน ≈ ~{vol} ml/ครั้ง")
+                    lines.append(msg["cetirizine_option"](mg=dose, freq=freq, ml=vol))
         else:
             # ✅ กรณีปกติ: dose_mg_range หรือ dose_mg + frequency
             freqs = profile["frequency"] if isinstance(profile["frequency"], list) else [profile["frequency"]]
-            if "dose_mg_range" in profile:
-                dose_range = profile["dose_mg_range"]
-            elif "dose_range_mg" in profile:
-                dose_range = profile["dose_range_mg"]  # 👈 รองรับชื่อเก่าที่ผิด
-            elif "dose_mg" in profile:
-                dose_range = [profile["dose_mg"]]
-            else:
-                return "❌ ไม่พบข้อมูล dose_mg ที่เหมาะสมใน profile"
-            
+            dose_range = profile["dose_mg_range"] if "dose_mg_range" in profile else [profile["dose_mg"]]
+
             max_dose = profile.get("max_mg_per_dose", None)
 
             for dose in dose_range:
                 dose_per_time = min(dose, max_dose) if max_dose else dose
                 vol = round(dose_per_time / concentration, 1)
                 freq_text = format_frequency(freqs)
-                lines.append(f"💊 ขนาดยา: {dose_per_time} mg × {freq_text} ครั้ง/วัน ≈ ~{vol} ml/ครั้ง")
+                lines.append(msg["cetirizine_dose"](mg=dose_per_time, freq=freq_text, ml=vol))
 
             if max_dose:
-                lines.append(f"\n📌 ขนาดยาสูงสุดต่อครั้ง: {max_dose} mg")
+                lines.append("\n" + msg["max_per_dose_note"](max_mg=max_dose))
 
         if "max_mg_per_day" in profile:
-            lines.append(f"📌 ขนาดยาสูงสุดต่อวัน: {profile['max_mg_per_day']} mg")
+            lines.append(msg["max_per_day_note"](max_mg=profile['max_mg_per_day']))
 
         return "\n".join(lines)
 
 
     
     if drug == "Ferrous drop":
+        if indication not in info["indications"]:
+            return msg["special_indication_not_found"](indication=indication)
         indication_info = info["indications"][indication]["all_ages"]
         dose_per_kg = indication_info["initial_dose_mg_per_kg_per_day"]
         max_range = indication_info["max_dose_range_mg_per_day"]
@@ -2315,17 +3252,17 @@ def calculate_special_drug(user_id, drug, weight, age):
 
         # เริ่มข้อความ
         reply_lines = [
-            f"🧪 {drug} - {indication} (น้ำหนัก {weight:.1f} kg):\n",
-            f"💊 {dose_per_kg:.0f} mg/kg/day → {total_mg_day:.1f} mg/day"
+            msg["special_title_weight"](drug=drug, indication=indication, weight=weight) + "\n",
+            msg["ferrous_daily"](dose_per_kg=dose_per_kg, mg=total_mg_day),
         ]
 
         # รองรับความถี่ 1–3 ครั้ง/วัน
         for freq in [1, 2, 3]:
             dose_per_time = total_mg_day / freq
-            line = f"→ วันละ {freq} ครั้ง → ครั้งละ ~{dose_per_time:.1f} mg"
+            line = msg["special_split_line"](freq=freq, mg=dose_per_time)
             if concentration:
                 volume = round(dose_per_time / concentration, 1)
-                line += f" ≈ ~{volume:.1f} ml/ครั้ง"
+                line += msg["special_split_ml"](ml=volume)
             reply_lines.append(line)
 
         if usual_max:
@@ -2334,19 +3271,19 @@ def calculate_special_drug(user_id, drug, weight, age):
             reply_lines.append(f"(absolute max: {absolute_max} mg/day)")
 
         if note:
-            reply_lines.append(f"\n📌 หมายเหตุ: {note}")
+            reply_lines.append("\n" + msg["special_note"](note=note))
 
         return "\n".join(reply_lines)
     
     if drug == "Domperidone" and age < 1 / 12:  # 1 เดือน = 1/12 ปี
-        return "❌ ไม่แนะนำให้ใช้ Domperidone ในเด็กอายุน้อยกว่า 1 เดือน"
+        return msg["age_gate"](drug="Domperidone", min_age=format_min_age(1 / 12, locale))
 
     if drug == "Domperidone":
         indication_data = info["indications"].get(indication)
         if not indication_data:
-            return f"❌ ไม่พบข้อมูลข้อบ่งใช้ {indication}"
+            return msg["special_indication_not_found"](indication=indication)
 
-        lines = [f"{drug} - {indication} (น้ำหนัก {weight} kg, อายุ {age} ปี):"]
+        lines = [msg["special_header_weight_age"](drug=drug, indication=indication, weight=weight, age=age)]
 
         matched_group = None
         for group in indication_data:
@@ -2360,9 +3297,9 @@ def calculate_special_drug(user_id, drug, weight, age):
                 break
 
         if not matched_group:
-            return "❌ ไม่พบข้อมูลที่ตรงกับช่วงอายุและน้ำหนักนี้"
+            return msg["age_weight_not_matched"]()
 
-        sub = matched_group.get("sub_indication", "ไม่ระบุช่วง")
+        sub = matched_group.get("sub_indication", msg["unspecified_range"]())
         lines.append(f"\n🔹 {sub}")
 
         if "dose_mg_per_kg_per_dose" in matched_group:
@@ -2373,35 +3310,33 @@ def calculate_special_drug(user_id, drug, weight, age):
             freqs = matched_group["frequency"]
             if isinstance(freqs, list) and len(freqs) > 1:
                 min_f, max_f = min(freqs), max(freqs)
-                freq_text = f"วันละ {min_f}–{max_f} ครั้ง"
+                freq_text = msg["times_per_day"](freq=f"{min_f}–{max_f}")
             else:
-                freq_text = f"วันละ {freqs[0] if isinstance(freqs, list) else freqs} ครั้ง"
+                freq_text = msg["times_per_day"](freq=freqs[0] if isinstance(freqs, list) else freqs)
 
-            lines.append(
-                f"ขนาดยา: {matched_group['dose_mg_per_kg_per_dose']} mg/kg/dose → {dose:.1f} mg/dose × {freq_text} "
-                f"(max {matched_group['max_mg_per_day']} mg/day) ≈ ~{ml:.1f} ml/dose"
-            )
+            lines.append(msg["perkg_dose_line"](
+                dose_per_kg=matched_group['dose_mg_per_kg_per_dose'], mg=dose, freq_text=freq_text,
+                max_mg=matched_group['max_mg_per_day'], ml=ml,
+            ))
 
         elif "dose_mg" in matched_group:
             dose = matched_group["dose_mg"]
             freq = matched_group["frequency"]
             ml = dose / concentration
-            lines.append(
-                f"ขนาดยา: {dose} mg × {freq} ครั้ง/วัน (max {matched_group['max_mg_per_day']} mg/day) ≈ ~{ml:.1f} ml/ครั้ง"
-            )
+            lines.append(msg["fixed_dose_max_line"](mg=dose, freq=freq, max_mg=matched_group['max_mg_per_day'], ml=ml))
 
         if matched_group.get("note"):
-            lines.append(f"📝 หมายเหตุ: {matched_group['note']}")
+            lines.append(msg["note_line"](note=matched_group['note']))
 
         return "\n".join(lines)
     
     if drug == "Salbutamol" and age < 2:
-        return "❌ ไม่แนะนำให้ใช้ Salbutamol ในเด็กอายุน้อยกว่า 2 ปี"
+        return msg["age_gate"](drug="Salbutamol", min_age=format_min_age(2, locale))
 
     if drug == "Salbutamol":
         indication_data = info["indications"].get(indication)
         if not indication_data:
-            return f"❌ ไม่พบข้อมูลข้อบ่งใช้ {indication}"
+            return msg["special_indication_not_found"](indication=indication)
 
         matched_group = None
         for group in indication_data:
@@ -2412,9 +3347,9 @@ def calculate_special_drug(user_id, drug, weight, age):
                 break
 
         if not matched_group:
-            return f"❌ ไม่พบข้อมูลสำหรับอายุ {age} ปี"
+            return msg["age_no_data"](age=age)
 
-        lines = [f"🧪 {drug} - {indication}", f"(น้ำหนัก {weight} kg, อายุ {age} ปี):"]
+        lines = [msg["special_title"](drug=drug, indication=indication), msg["special_patient_raw"](weight=weight, age=age)]
 
         sub = matched_group.get("sub_indication")
         if sub:
@@ -2430,9 +3365,7 @@ def calculate_special_drug(user_id, drug, weight, age):
                 total_mg = weight * dose_per_kg
                 total_mg = min(total_mg, max_doses[i])
                 ml = total_mg / concentration
-                lines.append(
-                    f"\nขนาดยา: {dose_per_kg} mg/kg/dose → {total_mg:.1f} mg/dose × วันละ {freq} ครั้ง (max {max_doses[i]} mg/dose) ≈ ~{ml:.1f} ml/ครั้ง"
-                )
+                lines.append("\n" + msg["salbutamol_perkg_line"](dose_per_kg=dose_per_kg, mg=total_mg, freq=freq, max_mg=max_doses[i], ml=ml))
 
         elif "dose_mg" in matched_group:
             dose = matched_group["dose_mg"]
@@ -2440,39 +3373,38 @@ def calculate_special_drug(user_id, drug, weight, age):
             ml = dose / concentration
 
             if isinstance(freqs, list) and len(freqs) > 1 and all(isinstance(f, (int, float)) for f in freqs):
-                freq_text = f"วันละ {min(freqs)}–{max(freqs)} ครั้ง"
-                lines.append(f"ขนาดยา: {dose} mg × {freq_text} ≈ ~{ml:.1f} ml/ครั้ง")
+                lines.append(msg["special_dose_times_raw"](mg=dose, freq=f"{min(freqs)}–{max(freqs)}", ml=ml))
             else:
                 for freq in freqs:
-                    lines.append(f"ขนาดยา: {dose} mg × วันละ {freq} ครั้ง ≈ ~{ml:.1f} ml/ครั้ง")
+                    lines.append(msg["special_dose_times_raw"](mg=dose, freq=freq, ml=ml))
 
         elif "dose_mg_range" in matched_group:
             freqs = matched_group["frequency"]
             for d in matched_group["dose_mg_range"]:
                 ml = d / concentration
                 for freq in freqs:
-                    lines.append(f"ขนาดยา: {d} mg × วันละ {freq} ครั้ง ≈ ~{ml:.1f} ml/ครั้ง")
+                    lines.append(msg["special_dose_times_raw"](mg=d, freq=freq, ml=ml))
 
         if matched_group.get("note"):
-            lines.append(f"\n📝 หมายเหตุ: {matched_group['note']}")
+            lines.append("\n" + msg["note_line"](note=matched_group['note']))
 
         if info.get("note"):
-            lines.append(f"\n📌 หมายเหตุเพิ่มเติม: {info['note']}")
+            lines.append("\n" + msg["special_extra_note"](note=info['note']))
 
         return "\n".join(lines)
 
     if drug == "Chlorpheniramine" and age < 2:
-        return "❌ ไม่แนะนำให้ใช้ Chlorpheniramine ในเด็กอายุน้อยกว่า 2 ปี"
+        return msg["age_gate"](drug="Chlorpheniramine", min_age=format_min_age(2, locale))
 
     if drug == "Chlorpheniramine":
         indication_data = info["indications"].get(indication)
         if not indication_data:
-            return f"❌ ไม่พบข้อมูลข้อบ่งใช้ {indication}"
+            return msg["special_indication_not_found"](indication=indication)
 
-        lines = [f"{drug} - {indication} (น้ำหนัก {weight} kg, อายุ {age} ปี):"]
+        lines = [msg["special_header_weight_age"](drug=drug, indication=indication, weight=weight, age=age)]
 
         if age < 2:
-            return "❌ ไม่แนะนำให้ใช้ในเด็กอายุน้อยกว่า 2 ปี"
+            return msg["age_gate_indication"](min_age=format_min_age(2, locale))
 
         matched_group = None
         for group in indication_data:
@@ -2492,9 +3424,9 @@ def calculate_special_drug(user_id, drug, weight, age):
                 break
 
         if not matched_group:
-            return f"❌ ไม่พบข้อมูลที่ตรงกับช่วงอายุ{'และน้ำหนัก' if check_weight else ''}นี้"
+            return msg["age_weight_not_matched" if check_weight else "age_not_matched"]()
 
-        sub = matched_group.get("sub_indication", "ไม่ระบุช่วง")
+        sub = matched_group.get("sub_indication", msg["unspecified_range"]())
         lines.append(f"\n🔹 {sub}")
 
         if "dose_mg_per_kg_per_dose" in matched_group:
@@ -2505,39 +3437,37 @@ def calculate_special_drug(user_id, drug, weight, age):
             freqs = matched_group["frequency"]
             if isinstance(freqs, list) and len(freqs) > 1:
                 min_f, max_f = min(freqs), max(freqs)
-                freq_text = f"วันละ {min_f}–{max_f} ครั้ง"
+                freq_text = msg["times_per_day"](freq=f"{min_f}–{max_f}")
             else:
-                freq_text = f"วันละ {freqs[0] if isinstance(freqs, list) else freqs} ครั้ง"
+                freq_text = msg["times_per_day"](freq=freqs[0] if isinstance(freqs, list) else freqs)
 
-            lines.append(
-                f"ขนาดยา: {matched_group['dose_mg_per_kg_per_dose']} mg/kg/dose → {dose:.1f} mg/dose × {freq_text} "
-                f"(max {matched_group['max_mg_per_day']} mg/day) ≈ ~{ml:.1f} ml/dose"
-            )
+            lines.append(msg["perkg_dose_line"](
+                dose_per_kg=matched_group['dose_mg_per_kg_per_dose'], mg=dose, freq_text=freq_text,
+                max_mg=matched_group['max_mg_per_day'], ml=ml,
+            ))
 
         elif "dose_mg" in matched_group:
             dose = matched_group["dose_mg"]
             freq = matched_group["frequency"]
             ml = dose / concentration
-            lines.append(
-                f"ขนาดยา: {dose} mg × {freq} ครั้ง/วัน (max {matched_group['max_mg_per_day']} mg/day) ≈ ~{ml:.1f} ml/ครั้ง"
-            )
+            lines.append(msg["fixed_dose_max_line"](mg=dose, freq=freq, max_mg=matched_group['max_mg_per_day'], ml=ml))
 
         if matched_group.get("note"):
-            lines.append(f"📝 หมายเหตุ: {matched_group['note']}")
+            lines.append(msg["note_line"](note=matched_group['note']))
 
         return "\n".join(lines)
 
     
     # ✅ Ibuprofen และยาอื่น ๆ ที่ใช้โครงสร้าง weight_based
     if drug == "Ibuprofen" and age < 0.25:
-        return "❌ ไม่แนะนำให้ใช้ Ibuprofen ในเด็กอายุน้อยกว่า 3 เดือน"
+        return msg["age_gate"](drug="Ibuprofen", min_age=format_min_age(0.25, locale))
 
     if drug == "Ibuprofen":
         indication_data = info["indications"].get(indication)
         if not indication_data:
-            return f"❌ ไม่พบข้อมูลข้อบ่งใช้ {indication}"
+            return msg["special_indication_not_found"](indication=indication)
 
-        reply_lines = [f"{drug} - {indication} (น้ำหนัก {weight} kg):"]
+        reply_lines = [msg["dose_header"](drug=drug, indication=indication, weight=weight)]
 
         for item in indication_data:
             if item.get("type") != "weight_based":
@@ -2556,14 +3486,14 @@ def calculate_special_drug(user_id, drug, weight, age):
                     doses = item.get("divided_doses", 3)
                     dose_per_time = total_mg_day / doses
                     dose_ml = dose_per_time / concentration
-                    reply_lines.append(
-                        f"💊 {d} mg/kg/day → ~{total_mg_day:.1f} mg/day → แบ่ง {doses} ครั้ง → ครั้งละ ~{dose_per_time:.1f} mg (~{dose_ml:.2f} ml)"
-                    )
+                    reply_lines.append(msg["ibuprofen_daily_line"](
+                        dose_per_kg=d, mg=total_mg_day, doses=doses, dose_mg=dose_per_time, dose_ml=dose_ml,
+                    ))
 
             if item.get("max_mg_per_dose"):
-                reply_lines.append(f"🔢 Max ต่อครั้ง: {item['max_mg_per_dose']} mg")
+                reply_lines.append(msg["ibuprofen_max_dose"](max_mg=item['max_mg_per_dose']))
             if item.get("max_mg_per_day"):
-                reply_lines.append(f"🔢 Max ต่อวัน: {item['max_mg_per_day']} mg")
+                reply_lines.append(msg["ibuprofen_max_day"](max_mg=item['max_mg_per_day']))
             if item.get("note"):
                 reply_lines.append(f"📌 {item['note']}")
 
@@ -2585,18 +3515,16 @@ def calculate_special_drug(user_id, drug, weight, age):
             min_ml = min_total / concentration
             max_ml = max_total / concentration
 
-            result = (
-                f"{drug} (น้ำหนัก {weight} kg):\n"
-                f"ขนาดยา: {min_dose}–{max_dose} mg/kg/ครั้ง → {min_total:.1f}–{max_total:.1f} mg/ครั้ง\n"
-                f"ปริมาณยา: {min_ml:.1f}–{max_ml:.1f} ml/ครั้ง\n"
-                f"ความถี่: {frequency}"
+            result = msg["paracetamol_header"](drug=drug, weight=weight) + "\n" + msg["paracetamol_dose"](
+                min_dose=min_dose, max_dose=max_dose, min_mg=min_total, max_mg=max_total,
+                min_ml=min_ml, max_ml=max_ml, frequency=frequency,
             )
             if max_mg_per_day:
-                result += f"\n⚠️ ไม่เกิน {max_mg_per_day} mg/วัน"
+                result += "\n" + msg["max_daily_warning"](max_mg=max_mg_per_day)
             if note:
                 result += f"\n📝 {note}"
             return result
-        return "❌ ไม่พบข้อมูลขนาดยา"
+        return msg["dose_data_not_found"]()
 
     if drug == "Paracetamol drop":
         dose_range = indication_info.get("dose_mg_per_kg_per_dose")
@@ -2613,25 +3541,127 @@ def calculate_special_drug(user_id, drug, weight, age):
             min_ml = min_total / concentration
             max_ml = max_total / concentration
 
-            result = (
-                f"{drug} (น้ำหนัก {weight} kg):\n"
-                f"ขนาดยา: {min_dose}–{max_dose} mg/kg/ครั้ง → {min_total:.1f}–{max_total:.1f} mg/ครั้ง\n"
-                f"ปริมาณยา: {min_ml:.1f}–{max_ml:.1f} ml/ครั้ง\n"
-                f"ความถี่: {frequency}"
+            result = msg["paracetamol_header"](drug=drug, weight=weight) + "\n" + msg["paracetamol_dose"](
+                min_dose=min_dose, max_dose=max_dose, min_mg=min_total, max_mg=max_total,
+                min_ml=min_ml, max_ml=max_ml, frequency=frequency,
             )
             if max_mg_per_day:
-                result += f"\n⚠️ ไม่เกิน {max_mg_per_day} mg/วัน"
+                result += "\n" + msg["max_daily_warning"](max_mg=max_mg_per_day)
             if note:
                 result += f"\n📝 {note}"
             return result
-        return "❌ ไม่พบข้อมูลขนาดยา"
+        return msg["dose_data_not_found"]()
 
-    return f"❌ ไม่พบขนาดยาที่เหมาะสมสำหรับอายุ {age} ปีใน {drug}"
+    return msg["age_dose_not_found"](age=age, drug=drug)
 
 
     
 
 
+def cached_reply(key, compute):
+    # ผลขึ้นกับ formulary version + input เท่านั้น → ใช้ reply cache ร่วมกันทุก node (ถ้าเปิดไว้)
+    if reply_cache is None:
+        return compute()
+    return reply_cache.get_or_compute([formulary_store.version(), *key], compute)
+
+
+def compute_dose(user_id, drug, indication, weight, age=None, locale=DEFAULT_LOCALE):
+    """จุดเดียวที่ LINE (handle_message), JSON API และ dosesheet ใช้คำนวณขนาดยา: เลือก calculator + audit"""
+    if drug in SPECIAL_DRUGS:
+        return audited(
+            "special", user_id, drug, indication,
+            {"weight": weight, "age": age},
+            cached_reply, ("special", drug, indication, weight, age, locale),
+            lambda: calculate_special_drug(user_id, drug, weight, age, indication, locale)
+        )
+    return audited(
+        "dose", user_id, drug, indication,
+        {"weight": weight, "age": age},
+        cached_reply, ("dose", drug, indication, weight, age, locale),
+        lambda: calculate_dose(drug, indication, weight, age, locale)
+    )
+
+
+# ✅ ภาษาของผลการคำนวณ (ขนาดยา, ขวด, คำเตือน, warfarin) เลือกได้ต่อผู้ใช้ เมนูและคำถามยังเป็นภาษาไทย
+LOCALE_COMMANDS = {
+    "ภาษาไทย": "th", "thai": "th",
+    "ภาษาอังกฤษ": "en", "english": "en",
+}
+
+
+def user_locale(user_id):
+    return user_locales.get(user_id, DEFAULT_LOCALE)
+
+
+COMPARE_USAGE = "📊 พิมพ์ข้อบ่งใช้ อายุ และน้ำหนัก เช่น 'เทียบยา: คออักเสบ 5 ปี 18 กก'"
+LINE_TEXT_LIMIT = 5000
+LINE_REPLY_MESSAGES = 5
+
+
+def parse_age_weight(text):
+    """แยกอายุ (ปี) และน้ำหนัก (กก.) ออกจากข้อความ คืน (อายุ, น้ำหนัก, ข้อความที่เหลือ)"""
+    age = weight = None
+    weight_match = re.search(r"(\d+(?:\.\d+)?)\s*(?:กก\.?|kg|กิโลกรัม|กิโล)", text, re.IGNORECASE)
+    if weight_match:
+        weight = float(weight_match.group(1))
+        text = text[:weight_match.start()] + " " + text[weight_match.end():]
+    year_match = re.search(r"(\d+(?:\.\d+)?)\s*(?:ปี|ขวบ|y)", text, re.IGNORECASE)
+    month_match = re.search(r"(\d+(?:\.\d+)?)\s*(?:เดือน|mo)", text, re.IGNORECASE)
+    if year_match or month_match:
+        years = float(year_match.group(1)) if year_match else 0
+        months = float(month_match.group(1)) if month_match else 0
+        age = round(years + months / 12, 2)
+        for match in sorted(filter(None, (year_match, month_match)), key=lambda m: m.start(), reverse=True):
+            text = text[:match.start()] + " " + text[match.end():]
+    return age, weight, " ".join(text.split())
+
+
+def compare_by_indication(user_id, concept, weight, age, locale=DEFAULT_LOCALE):
+    """คำนวณทุกยาในกลุ่มข้อบ่งใช้เดียวกันสำหรับเด็กคนเดียว คืนข้อความแยกตามยา"""
+    results = []
+    for candidate in indication_index().candidates(concept):
+        results.append(compute_dose(user_id, candidate.drug, candidate.indication, weight, age, locale))
+    return results
+
+
+def _pack_messages(header, blocks, separator="\n\n━━━━━━━━━━\n\n"):
+    """รวมผลเป็นข้อความไม่เกิน 5 ข้อความ ข้อความละไม่เกิน 5000 ตัวอักษร (ข้อจำกัดของ reply)"""
+    texts = [header]
+    for block in blocks:
+        if len(texts[-1]) + len(separator) + len(block) <= LINE_TEXT_LIMIT:
+            texts[-1] += separator + block
+        elif len(texts) < LINE_REPLY_MESSAGES:
+            texts.append(block[:LINE_TEXT_LIMIT])
+        else:
+            texts[-1] = texts[-1][:LINE_TEXT_LIMIT - 40] + "\n\n… ผลที่เหลือเลือกดูทีละยาได้"
+            break
+    return [TextMessage(text=text) for text in texts]
+
+
+def send_indication_comparison(event, user_id, query):
+    age, weight, query = parse_age_weight(query)
+    matches = indication_index().lookup(query) if query else []
+    if not matches:
+        reply = [TextMessage(text=f"❌ ไม่พบข้อบ่งใช้ '{query}'\n{COMPARE_USAGE}" if query else COMPARE_USAGE)]
+    elif matches[0][1] and len(matches) > 1:
+        # สะกดไม่ตรงกลุ่มใด → ให้เลือกกลุ่ม (คงอายุ/น้ำหนักที่พิมพ์มา)
+        suffix = "".join(part for part in (f" {age:g} ปี" if age is not None else "", f" {weight:g} กก" if weight is not None else ""))
+        items = [
+            QuickReplyItem(action=MessageAction(label=concept[:20], text=f"เทียบยา: {concept}{suffix}"))
+            for concept, _ in matches
+        ]
+        reply = [TextMessage(text="🔎 หมายถึงข้อบ่งใช้ไหน?", quick_reply=QuickReply(items=items))]
+    elif age is None or weight is None:
+        reply = [TextMessage(text=f"📊 {matches[0][0]}: ต้องระบุทั้งอายุและน้ำหนัก\n{COMPARE_USAGE}")]
+    else:
+        concept = matches[0][0]
+        results = compare_by_indication(user_id, concept, weight, age, user_locale(user_id))
+        drugs = ", ".join(dict.fromkeys(c.drug for c in indication_index().candidates(concept)))
+        header = f"📊 เทียบยาสำหรับ {concept}\nอายุ {age:g} ปี น้ำหนัก {weight:g} kg\nยาที่ใช้ได้: {drugs}"
+        reply = _pack_messages(header, results)
+    messaging_api.reply_message(ReplyMessageRequest(reply_token=event.reply_token, messages=reply))
+
+
 def send_special_indication_carousel(event, drug_name):
     drug_info = SPECIAL_DRUGS.get(drug_name)
     if not drug_info or "indications" not in drug_info:
@@ -2695,7 +3725,8 @@ def send_special_indication_carousel(event, drug_name):
         )
         return
 
-    carousel_template = CarouselTemplate(columns=columns)
+    with tracer.span("build.carousel", columns=len(columns)):
+        carousel_template = CarouselTemplate(columns=columns)
     messages = [TemplateMessage(
         alt_text=f"ข้อบ่งใช้ {drug_name}",
         template=carousel_template
@@ -2754,9 +3785,16 @@ def get_indication_entry(drug, indication_name, entry_index=0):
     return entries
 
 @handler.add(MessageEvent)
+@shutdown_coordinator.tracked
+@tracer.event_handler("handle_message")
+@callback_profiler.handler
+@session_scope
+@formulary_store.pinned
 def handle_message(event: MessageEvent):
     if not isinstance(event.message, TextMessageContent):
         return
+    if not admit_event(event):
+        return
     user_id = event.source.user_id
     text = event.message.text.strip()
     text_lower = text.lower()
@@ -2779,6 +3817,31 @@ def handle_message(event: MessageEvent):
     if text_lower in auto_response_commands:
         return
 
+    if text_lower in ['เตือนตรวจ inr', 'ยกเลิกเตือนตรวจ inr']:
+        reply = handle_inr_reminder_command(user_id, text_lower, user_locale(user_id))
+        messaging_api.reply_message(
+            ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=reply)])
+        )
+        return
+
+    if text_lower in LOCALE_COMMANDS:
+        locale = LOCALE_COMMANDS[text_lower]
+        if locale == DEFAULT_LOCALE:
+            user_locales.pop(user_id, None)
+        else:
+            user_locales[user_id] = locale
+        messaging_api.reply_message(
+            ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=message_catalog.render("locale_set", locale))])
+        )
+        return
+
+    if text_lower.startswith("เทียบยา"):
+        user_sessions.pop(user_id, None)
+        user_drug_selection.pop(user_id, None)
+        user_ages.pop(user_id, None)
+        send_indication_comparison(event, user_id, text[len("เทียบยา"):].lstrip(" :"))
+        return
+
     if text_lower in ['คำนวณยา warfarin']:
         user_sessions.pop(user_id, None)
         user_drug_selection.pop(user_id, None)
@@ -2826,7 +3889,10 @@ def handle_message(event: MessageEvent):
             step = session.get("step")
             if step == "ask_inr":
                 try:
-                    session["inr"] = float(text)
+                    inr = float(text)
+                    if not math.isfinite(inr) or inr < 0:
+                        raise ValueError(text)
+                    session["inr"] = inr
                     session["step"] = "ask_twd"
                     reply = "📈 ใส่ Total Weekly Dose (TWD) เช่น 28"
                 except:
@@ -2838,9 +3904,13 @@ def handle_message(event: MessageEvent):
 
             elif step == "ask_twd":
                 try:
-                    session["twd"] = float(text)
-                    session["step"] = "ask_bleeding"
-                    reply = "🩸 มี major bleeding หรือไม่? (yes/no)"
+                    twd = float(text)
+                    if not valid_twd(twd):
+                        reply = f"❌ TWD ต้องมากกว่า 0 และไม่เกิน {WARFARIN_MAX_TWD:g} mg/สัปดาห์"
+                    else:
+                        session["twd"] = twd
+                        session["step"] = "ask_bleeding"
+                        reply = "🩸 มี major bleeding หรือไม่? (yes/no)"
                 except:
                     reply = "❌ กรุณาใส่ค่า TWD เป็นตัวเลข เช่น 28"
                 messaging_api.reply_message(
@@ -2858,7 +3928,11 @@ def handle_message(event: MessageEvent):
                 session["bleeding"] = text.lower()
                 if text.lower().strip(".") == "yes":
                 # ✅ มี bleeding → แสดงผลทันทีและจบ flow
-                    result = calculate_warfarin(session["inr"], session["twd"], session["bleeding"])
+                    result = audited(
+                        "warfarin", user_id, "Warfarin", None,
+                        {"inr": session["inr"], "twd": session["twd"], "bleeding": session["bleeding"]},
+                        calculate_warfarin, session["inr"], session["twd"], session["bleeding"], None, user_locale(user_id)
+                    )
                     user_sessions.pop(user_id, None)
                     messaging_api.reply_message(
                         ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=result)])
@@ -2910,8 +3984,14 @@ def handle_message(event: MessageEvent):
                 if text == "ไม่ได้ใช้":
                     interaction_note = ""
                     supplement = session.get("supplement", "")
-                    result = calculate_warfarin(session["inr"], session["twd"], session["bleeding"], supplement)
+                    result = audited(
+                        "warfarin", user_id, "Warfarin", None,
+                        {"inr": session["inr"], "twd": session["twd"], "bleeding": session["bleeding"],
+                         "supplement": supplement, "interaction": text},
+                        calculate_warfarin, session["inr"], session["twd"], session["bleeding"], supplement, user_locale(user_id)
+                    )
                     final_result = f"{result.split('\n\n')[0]}{interaction_note}\n\n{result.split('\n\n')[1]}"
+                    remember_inr_followup(user_id, session["inr"])
                     user_sessions.pop(user_id, None)
                     messaging_api.reply_message(
                         ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=final_result)])
@@ -2929,8 +4009,14 @@ def handle_message(event: MessageEvent):
                 else:
                     interaction_note = f"\n⚠️ พบการใช้ยา: {text} ซึ่งอาจมีปฏิกิริยากับ Warfarin"
                     supplement = session.get("supplement", "")
-                    result = calculate_warfarin(session["inr"], session["twd"], session["bleeding"], supplement)
+                    result = audited(
+                        "warfarin", user_id, "Warfarin", None,
+                        {"inr": session["inr"], "twd": session["twd"], "bleeding": session["bleeding"],
+                         "supplement": supplement, "interaction": text},
+                        calculate_warfarin, session["inr"], session["twd"], session["bleeding"], supplement, user_locale(user_id)
+                    )
                     final_result = f"{result.split('\n\n')[0]}{interaction_note}\n\n{result.split('\n\n')[1]}"
+                    remember_inr_followup(user_id, session["inr"])
                     user_sessions.pop(user_id, None)
                     messaging_api.reply_message(
                         ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=final_result)])
@@ -2940,8 +4026,14 @@ def handle_message(event: MessageEvent):
             elif step == "ask_interaction":
                 interaction_note = f"\n⚠️ พบการใช้ยา: {text.strip()} ซึ่งอาจมีปฏิกิริยากับ Warfarin"
                 supplement = session.get("supplement", "")
-                result = calculate_warfarin(session["inr"], session["twd"], session["bleeding"], supplement)
+                result = audited(
+                    "warfarin", user_id, "Warfarin", None,
+                    {"inr": session["inr"], "twd": session["twd"], "bleeding": session["bleeding"],
+                     "supplement": supplement, "interaction": text.strip()},
+                    calculate_warfarin, session["inr"], session["twd"], session["bleeding"], supplement, user_locale(user_id)
+                )
                 final_result = f"{result.split('\n\n')[0]}{interaction_note}\n\n{result.split('\n\n')[1]}"
+                remember_inr_followup(user_id, session["inr"])
                 user_sessions.pop(user_id, None)
                 messaging_api.reply_message(
                     ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=final_result)])
@@ -2969,6 +4061,12 @@ def handle_message(event: MessageEvent):
         elif drug_name in DRUG_DATABASE:
             send_indication_carousel(event, drug_name)
 
+        # ✅ พิมพ์ชื่อเอง (ตัวพิมพ์/สะกดไม่ตรง) → เสนอชื่อที่ใกล้ที่สุด
+        else:
+            user_drug_selection.pop(user_id, None)
+            if send_drug_suggestions(event, drug_name):
+                return
+
     if text.startswith("Indication:") and user_id in user_drug_selection:
         indication = text.replace("Indication:", "").strip()
         user_drug_selection[user_id]["indication"] = indication
@@ -3085,33 +4183,40 @@ def handle_message(event: MessageEvent):
                         )
                         return  # หยุดการทำงานที่นี่เลย
                     else:
+                        indication = entry.get("indication")
+                        # schema ตรวจโครงข้อมูลแล้ว แต่ยังกันไว้ชั้นสุดท้ายเพื่อให้ผู้ใช้ได้คำตอบเสมอ
                         try:
-                            reply = calculate_special_drug(user_id, drug, weight, age)
+                            reply = compute_dose(user_id, drug, indication, weight, age, user_locale(user_id))
+                            reply = dose_reply_message(drug, indication, reply)
                         except Exception as e:
                             logging.info(f"❌ คำนวณผิดพลาดใน SPECIAL_DRUG: {e}")
-                            reply = "เกิดข้อผิดพลาดในการคำนวณยา"
+                            reply = TextMessage(text="เกิดข้อผิดพลาดในการคำนวณยา")
                 else:
                     if "indication" not in entry:
-                        reply = "❗️ กรุณาเลือกข้อบ่งใช้ก่อน เช่น 'Indication: Fever'"
+                        reply = TextMessage(text="❗️ กรุณาเลือกข้อบ่งใช้ก่อน เช่น 'Indication: Fever'")
                     else:
                         indication = entry["indication"]
+                        age = user_ages.get(user_id)
                         try:
-                            age = user_ages.get(user_id)
-                            reply = calculate_dose(drug, indication, weight, age)
+                            reply = compute_dose(user_id, drug, indication, weight, age, user_locale(user_id))
+                            reply = dose_reply_message(drug, indication, reply)
                         except Exception as e:
                             logging.info(f"❌ คำนวณผิดพลาดใน DRUG_DATABASE: {e}")
-                            reply = "เกิดข้อผิดพลาดในการคำนวณยา"
+                            reply = TextMessage(text="เกิดข้อผิดพลาดในการคำนวณยา")
 
                 messaging_api.reply_message(
                     ReplyMessageRequest(
                         reply_token=event.reply_token,
-                        messages=[TextMessage(text=reply)]
+                        messages=[reply]
                     )
                 )
                 return
 
     # กรณีที่ยังไม่มีการเลือกยา    
     elif user_id not in user_sessions and user_id not in user_drug_selection:
+        # ✅ พิมพ์ชื่อยามาเอง เช่น "amoxi", "paracetamal", "เซทิริซีน"
+        if send_drug_suggestions(event, text):
+            return
         messaging_api.reply_message(
             ReplyMessageRequest(
                 reply_token=event.reply_token,
@@ -3130,7 +4235,123 @@ def handle_message(event: MessageEvent):
         return
         
 
+# ✅ JSON API สำหรับ HIS/EHR (เปิดใช้เมื่อกำหนด API_TOKEN) ใช้ compute_dose / warfarin_plan ตัวเดียวกับ LINE
+app.register_blueprint(create_api(
+    formulary_store, resolve_drug, compute_dose, warfarin_plan,
+    token=os.environ.get("API_TOKEN"),
+    batch_limit=int(os.environ.get("API_BATCH_LIMIT", 10000)),
+    max_twd=WARFARIN_MAX_TWD,
+    max_weight=MAX_WEIGHT_KG,
+    locales=(DEFAULT_LOCALE, *(locale for locale in message_catalog.locales if locale != DEFAULT_LOCALE)),
+))
+
+if warmup is not None:
+    WARMUP_USER = "Uwarmup"
+    WARMUP_WEIGHT = float(os.environ.get("WARMUP_WEIGHT", 15))
+    WARMUP_AGE = float(os.environ.get("WARMUP_AGE", 5))
+
+    @warmup.phase("calculators")
+    def warm_calculators():
+        count = 0
+        with formulary_store.pin():
+            for drug, info in DRUG_DATABASE.items():
+                for indication in info["indications"]:
+                    calculate_dose(drug, indication, WARMUP_WEIGHT, WARMUP_AGE)
+                    count += 1
+            for drug, info in SPECIAL_DRUGS.items():
+                for indication in info["indications"]:
+                    calculate_special_drug(WARMUP_USER, drug, WARMUP_WEIGHT, WARMUP_AGE, indication)
+                    count += 1
+            for band in INR_BANDS:
+                inr = band["min_inr"] if math.isfinite(band["min_inr"]) else 1.0
+                calculate_warfarin(inr, 35.0, "no")
+                count += 1
+            calculate_warfarin(2.5, 35.0, "yes")
+        return count + 1
+
+    @warmup.phase("dose_cards")
+    def warm_dose_cards():
+        if not DOSE_CARDS:
+            return None
+        with formulary_store.pin():
+            for drug, info in DRUG_DATABASE.items():
+                for indication in info["indications"]:
+                    dose_reply_message(drug, indication, calculate_dose(drug, indication, WARMUP_WEIGHT, WARMUP_AGE)).to_dict()
+            for drug, info in SPECIAL_DRUGS.items():
+                for indication in info["indications"]:
+                    reply = calculate_special_drug(WARMUP_USER, drug, WARMUP_WEIGHT, WARMUP_AGE, indication)
+                    dose_reply_message(drug, indication, reply).to_dict()
+            return len(dose_cards())
+
+    @warmup.phase("warfarin_schedules")
+    def warm_warfarin_schedules():
+        precompute_warfarin_schedules()
+
+    @warmup.phase("menus")
+    def warm_menus():
+        event = SimpleNamespace(reply_token="warmup", source=SimpleNamespace(user_id=WARMUP_USER))
+        with warmup_api.capture() as sent:
+            for send_menu in (send_drug_ATB_selection, send_drug_APY_selection,
+                              send_drug_AH_selection, send_drug_OT_selection):
+                send_menu(event)
+            for drug in DRUG_DATABASE:
+                send_indication_carousel(event, drug)
+                send_indication_carousel(event, drug, show_all=True)
+            for drug in SPECIAL_DRUGS:
+                send_special_indication_carousel(event, drug)
+            send_supplement_flex(event.reply_token)
+            send_interaction_flex(event.reply_token)
+        return len(sent)
+
+    @warmup.phase("line_pool", required=False)
+    def warm_line_pool():
+        # เปิด connection (TLS) ไป api.line.me ไว้ใน pool ก่อน reply แรก
+        if not LINE_CONFIGURED:
+            return None
+        messaging_api.get_bot_info()
+
+    @warmup.phase("golden")
+    def warm_golden():
+        import golden
+
+        snapshot = golden.load(os.environ.get("WARMUP_GOLDEN", golden.DEFAULT_SNAPSHOT))
+        # ส่ง module ที่กำลังรันอยู่ไปเอง: ตอน `python app.py` module นี้คือ __main__ ถ้า golden import app
+        # จะได้ app ชุดที่สอง (consumer, outbox, scheduler, atexit ซ้ำ)
+        changed = golden.check_sample(snapshot, sys.modules[__name__])
+        if changed:
+            raise ValueError(f"ผลไม่ตรง golden {len(changed)} กลุ่ม เช่น {changed[0][0]}")
+        return len(snapshot["expected"])
+
+    warmup.start()
+
+
+@app.route('/ready')
+def ready():
+    if shutdown_coordinator.draining:
+        return jsonify({"state": "shutting_down", **shutdown_coordinator.status()}), 503
+    if warmup is None:
+        return jsonify({"state": "skipped"})
+    return jsonify(warmup.status()), 200 if warmup.ready else 503
+
+
+# consumer เริ่มหลัง handler ทุกตัวถูกลงทะเบียนแล้ว (event ที่ค้างจากรอบก่อนจะถูก claim ใหม่ทันที)
+if event_queue is not None:
+    event_consumer = EventQueueConsumer(
+        event_queue, process_queued_event,
+        threads=int(os.environ.get("EVENT_QUEUE_CONSUMERS", 4)),
+        lease_sec=float(os.environ.get("EVENT_QUEUE_LEASE_SEC", 60)),
+    ).start()
+    shutdown_coordinator.on_drain("event_consumer", event_consumer.stop)
+    shutdown_coordinator.register("event_queue", event_queue.close)
+
+# ติดตั้งหลังลงทะเบียนครบ: SIGTERM → shutdown ทั้งหมด, จบ process ปกติก็ flush แบบเดียวกัน
+shutdown_coordinator.install()
+atexit.register(shutdown_coordinator.shutdown)
+
+
 if __name__ == "__main__":
+    if not LINE_CONFIGURED:
+        raise ValueError("Missing LINE_CHANNEL_ACCESS_TOKEN or LINE_CHANNEL_SECRET")
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
     
@@ -0,0 +1,297 @@
+"""
+Audit log ของผลการคำนวณยา (append-only)
+
+- request path เรียกแค่ AuditLog.record() ซึ่งเป็น enqueue แบบไม่ block
+- background thread รวม record เป็น batch แล้วเขียนลงไฟล์ JSONL บีบอัด gzip ทีละ batch (group commit)
+  หมุนไฟล์รายวันหรือเมื่อไฟล์ใหญ่เกิน max_bytes และเปิดไฟล์ใหม่ (.N) เสมอ ไม่ต่อท้ายไฟล์ของ process อื่น
+  (gzip member ที่ยังไม่ปิดของ process ที่ crash ทำให้ member ที่ต่อท้ายอ่านไม่ได้)
+- ใช้เป็น CLI เพื่อค้นย้อนหลังแบบ stream ได้ (ใช้หน่วยความจำคงที่):
+    python audit.py query LOG_DIR --since 2026-01-01 --drug Amoxicillin
+"""
+import argparse
+import codecs
+import gzip
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+FILE_PREFIX = "audit-"
+FILE_SUFFIX = ".jsonl.gz"
+# member ที่ไม่ได้ปิด (process crash) จบด้วย sync flush ถ้ามี member ใหม่ต่อท้ายทันทีคือจุดที่ต้องแยกอ่าน
+CRASHED_MEMBER_END = b"\x00\x00\xff\xff\x1f\x8b\x08"
+RECOVER_CHUNK_BYTES = 64 * 1024
+
+
+def hash_user(user_id, salt):
+    if not user_id:
+        return None
+    return hmac.new(salt.encode(), user_id.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+class AuditLog:
+    def __init__(self, directory, salt="", batch_size=256, flush_interval=0.5,
+                 max_queue=100000, max_bytes=64 * 1024 * 1024, prefix=FILE_PREFIX):
+        self.directory = directory
+        self.prefix = prefix
+        self.salt = salt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self.written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._raw = None
+        self._file_day = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, entry):
+        """enqueue แบบไม่ block; ถ้าคิวเต็มจะทิ้ง record และนับไว้ใน dropped"""
+        entry.setdefault("ts", time.time())
+        if "user_id" in entry:
+            entry["user"] = hash_user(entry.pop("user_id"), self.salt)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # ---------- writer thread ----------
+
+    def _open(self, day):
+        self._close_file()
+        index = 0
+        while True:
+            name = f"{self.prefix}{day}{'' if index == 0 else f'.{index}'}{FILE_SUFFIX}"
+            path = os.path.join(self.directory, name)
+            try:
+                # "xb": สร้างไฟล์ใหม่เท่านั้น (หลาย process เปิดพร้อมกันก็ไม่ได้ไฟล์เดียวกัน)
+                self._raw = open(path, "xb")
+                break
+            except FileExistsError:
+                index += 1
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self._file_day = day
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+            self._file = None
+            self._raw = None
+
+    def _write_batch(self, batch):
+        day = datetime.fromtimestamp(batch[0]["ts"]).strftime("%Y-%m-%d")
+        if self._file is None or day != self._file_day or self._raw.tell() >= self.max_bytes:
+            self._open(day)
+        data = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in batch)
+        self._file.write(data.encode("utf-8"))
+        # group commit: sync flush ครั้งเดียวต่อ batch เพื่อให้อ่านได้ทันทีแม้ process ตาย
+        self._file.flush(zlib.Z_SYNC_FLUSH)
+        self._raw.flush()
+        self.written += len(batch)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed.is_set():
+                    break
+                continue
+            if first is None:
+                break
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logging.info(f"❌ เขียน audit log ไม่สำเร็จ ({len(batch)} รายการ): {e}")
+            if stop:
+                break
+        self._close_file()
+
+    def close(self, timeout=5):
+        """เขียน record ที่ค้างในคิวให้หมดแล้วปิดไฟล์"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+
+# ---------- query CLI ----------
+
+def iter_log_files(directory, since=None, until=None, prefix=FILE_PREFIX):
+    names = sorted(
+        (n for n in os.listdir(directory) if n.startswith(prefix) and n.endswith(FILE_SUFFIX)),
+        key=lambda n: (n[:len(prefix) + 10], int(n[len(prefix) + 11:-len(FILE_SUFFIX)] or 0)),
+    )
+    for name in names:
+        day = name[len(prefix):len(prefix) + 10]
+        if since and day < since[:10]:
+            continue
+        if until and day > until[:10]:
+            continue
+        yield os.path.join(directory, name)
+
+
+def _recover_lines(path):
+    """อ่านไฟล์ที่มี member ไม่ได้ปิดคั่นกลาง (เขียนต่อท้ายหลัง crash โดยรุ่นก่อน) ทีละช่วง member แบบ stream"""
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    keep = len(CRASHED_MEMBER_END) - 1  # เผื่อ marker ที่ถูกตัดคร่อมระหว่าง chunk
+    state = {"inflater": zlib.decompressobj(16 + zlib.MAX_WBITS)}
+
+    def inflate(data):
+        inflater = state["inflater"]
+        if inflater is None:
+            return b""  # ช่วงนี้เสีย ข้ามไปจนถึง marker ถัดไป
+        out = []
+        try:
+            while data:
+                out.append(inflater.decompress(data))
+                if not inflater.eof:
+                    break  # member ที่ไม่ได้ปิด อ่านได้ถึง sync flush สุดท้าย
+                data = inflater.unused_data
+                inflater = state["inflater"] = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        except zlib.error as e:
+            logging.info(f"⚠️ {path}: ข้ามช่วงที่เสีย ({e})")
+            state["inflater"] = None
+        return b"".join(out)
+
+    partial = ""
+    with open(path, "rb") as f:
+        pending = b""
+        while True:
+            chunk = f.read(RECOVER_CHUNK_BYTES)
+            pending += chunk
+            text = []
+            end = pending.find(CRASHED_MEMBER_END)
+            while end >= 0:
+                text.append(inflate(pending[:end + 4]))
+                state["inflater"] = zlib.decompressobj(16 + zlib.MAX_WBITS)  # member ใหม่เริ่มที่ 1f 8b 08
+                pending = pending[end + 4:]
+                end = pending.find(CRASHED_MEMBER_END)
+            if not chunk:
+                text.append(inflate(pending))  # ท้ายไฟล์ที่ถูกตัด: ได้เท่าที่ decompress ได้แล้วหยุด
+            elif len(pending) > keep:
+                text.append(inflate(pending[:-keep]))
+                pending = pending[-keep:]
+            lines = (partial + decoder.decode(b"".join(text), final=not chunk)).splitlines(keepends=True)
+            partial = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+            yield from lines
+            if not chunk:
+                break
+    if partial:
+        yield partial
+
+
+def _iter_lines(path):
+    read = 0
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                read += 1
+                yield line
+    except EOFError:
+        pass  # ไฟล์ของวันปัจจุบันที่ยังเขียนไม่ปิด
+    except (zlib.error, gzip.BadGzipFile):
+        yield from itertools.islice(_recover_lines(path), read, None)
+
+
+def _iter_entries(path):
+    for line in _iter_lines(path):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue  # บรรทัดสุดท้ายที่เขียนไม่ครบ
+
+
+def iter_records(directory, since=None, until=None, prefix=FILE_PREFIX):
+    since_ts = datetime.fromisoformat(since).timestamp() if since else None
+    until_ts = datetime.fromisoformat(until).timestamp() if until else None
+    paths = iter_log_files(directory, since, until, prefix)
+    day_of = lambda path: os.path.basename(path)[len(prefix):len(prefix) + 10]
+    for _, day_paths in itertools.groupby(paths, key=day_of):
+        # แต่ละ process (worker) เขียนไฟล์ .N ของตัวเองในวันเดียวกัน → merge ตาม ts ให้เรียงตามเวลาจริง
+        streams = [_iter_entries(path) for path in day_paths]
+        for entry in heapq.merge(*streams, key=lambda e: e.get("ts", 0)):
+            ts = entry.get("ts", 0)
+            if since_ts and ts < since_ts:
+                continue
+            if until_ts and ts >= until_ts:
+                continue
+            yield entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ค้นหา audit log ของผลการคำนวณยา")
+    sub = parser.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("query")
+    q.add_argument("directory")
+    q.add_argument("--since", help="ISO date/time เช่น 2026-01-01")
+    q.add_argument("--until", help="ISO date/time (ไม่รวม)")
+    q.add_argument("--kind", choices=["dose", "special", "warfarin"])
+    q.add_argument("--drug")
+    q.add_argument("--indication")
+    q.add_argument("--user", help="hash ของผู้ใช้")
+    q.add_argument("--user-id", help="LINE user id (จะ hash ด้วย AUDIT_SALT)")
+    q.add_argument("--formulary")
+    q.add_argument("--count", action="store_true", help="แสดงเฉพาะจำนวนที่พบ")
+    args = parser.parse_args(argv)
+
+    user = args.user
+    if args.user_id:
+        user = hash_user(args.user_id, os.environ.get("AUDIT_SALT", ""))
+
+    filters = {
+        "kind": args.kind,
+        "drug": args.drug,
+        "indication": args.indication,
+        "user": user,
+        "formulary": args.formulary,
+    }
+    filters = {k: v for k, v in filters.items() if v is not None}
+
+    count = 0
+    out = sys.stdout
+    for entry in iter_records(args.directory, args.since, args.until):
+        if any(entry.get(k) != v for k, v in filters.items()):
+            continue
+        count += 1
+        if not args.count:
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    if args.count:
+        out.write(f"{count}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+การ์ด Flex สำหรับผลคำนวณขนาดยา (calculate_dose / calculate_special_drug) อ่านง่ายกว่าข้อความยาวตอนอยู่ข้างเตียง
+
+- แยกข้อความผลคำนวณทีละบรรทัดตามชนิด: หัวเรื่อง (บรรทัดแรก), กลุ่ม (🔹), ขนาดยา, ขวด (→), หมายเหตุ (📝), บรรทัดว่าง
+  บรรทัดกลุ่ม/หมายเหตุ/บรรทัดว่างไม่ขึ้นกับน้ำหนัก → เป็นโครงการ์ด ส่วนบรรทัดที่เหลือเป็นช่องตัวเลข
+- โครงการ์ด (skeleton) สร้างจาก dict แล้ว validate ด้วย FlexContainer.from_dict ครั้งเดียวต่อ (ยา, ข้อบ่งใช้, โครง)
+  ต่อ request แค่แทนข้อความในช่อง (copy แบบตื้นโดยไม่ validate ซ้ำ) ทั้งใน model และใน JSON ที่ serialize ไว้แล้ว
+  CardBubble คืน JSON นั้นตอนส่ง (to_dict/dict) แทนการไล่ model ทั้งต้นของ SDK การ์ดจึงมีต้นทุนใกล้เคียงกับข้อความธรรมดา
+- ข้อความปฏิเสธ (❌) หรือการ์ดที่ใหญ่เกินขีดจำกัดของ bubble → None (ผู้เรียกส่งเป็นข้อความธรรมดาแทน)
+    python cards.py show Amoxicillin "Pharyngitis/Tonsillitis" 18   # ดู JSON ของการ์ด
+    python cards.py bench                                            # เวลาต่อการ์ด: from_dict ทุกครั้ง vs skeleton
+"""
+import argparse
+import json
+import sys
+import time
+
+from linebot.v3.messaging import FlexBubble, FlexMessage, ReplyMessageRequest, TextMessage
+from linebot.v3.messaging.models import FlexContainer
+from pydantic.v1 import PrivateAttr
+
+BUBBLE_LIMIT_BYTES = 30000
+ALT_TEXT_LIMIT = 400
+
+SECTION = "section"
+NOTE = "note"
+BOTTLE = "bottle"
+BLANK = "blank"
+VALUE = "value"
+STATIC_KINDS = (SECTION, NOTE, BLANK)
+
+TEXT_STYLES = {
+    SECTION: {"weight": "bold", "size": "sm", "color": "#1F4E79", "margin": "md"},
+    VALUE: {"size": "sm", "margin": "sm"},
+    BOTTLE: {"size": "xs", "color": "#555555"},
+    NOTE: {"size": "xs", "color": "#888888", "margin": "sm"},
+}
+
+
+def line_kind(line):
+    if not line.strip():
+        return BLANK
+    if line.startswith("🔹"):
+        return SECTION
+    if line.startswith(("📝", "📌 หมายเหตุ")):
+        return NOTE
+    if line.startswith("→"):
+        return BOTTLE
+    return VALUE
+
+
+def card_layout(lines):
+    """lines: [(ชนิด, ข้อความ)] ของบรรทัดหลังหัวเรื่อง → (body contents, index ของช่องตัวเลขใน body)"""
+    contents = []
+    slots = []
+    for kind, text in lines:
+        if kind == BLANK:
+            # ไม่ขึ้นต้น body ด้วยเส้นคั่น และไม่ซ้อนเส้นคั่นติดกัน
+            if contents and contents[-1]["type"] != "separator":
+                contents.append({"type": "separator", "margin": "md"})
+            continue
+        if kind not in STATIC_KINDS:
+            slots.append(len(contents))
+        contents.append({"type": "text", "text": text, "wrap": True, **TEXT_STYLES[kind]})
+    return contents, slots
+
+
+def card_dict(title, lines):
+    body, _ = card_layout(lines)
+    return {
+        "type": "bubble",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [{"type": "text", "text": title, "weight": "bold", "size": "md", "wrap": True}],
+        },
+        "body": {"type": "box", "layout": "vertical", "spacing": "xs", "contents": body},
+        "styles": {
+            "header": {"backgroundColor": "#D0E6FF"},
+            "body": {"backgroundColor": "#FFFFFF"},
+        },
+    }
+
+
+def split_reply(text):
+    """ข้อความผลคำนวณ → (หัวเรื่อง, [(ชนิด, บรรทัด)])"""
+    title, *rest = text.split("\n")
+    return title, [(line_kind(line), line) for line in rest]
+
+
+class CardBubble(FlexBubble):
+    """FlexBubble ที่มี JSON ของตัวเองอยู่แล้ว (to_dict ของ SDK เรียก dict() ซ้อนกันทุกชั้นทุกครั้งที่ส่ง)"""
+    _serialized = PrivateAttr(default=None)
+
+    def dict(self, **kwargs):
+        if self._serialized is not None and kwargs.get("by_alias") and kwargs.get("exclude_none") \
+                and not kwargs.get("include") and not kwargs.get("exclude"):
+            return self._serialized
+        return super().dict(**kwargs)
+
+    def to_dict(self):
+        if self._serialized is not None:
+            return self._serialized
+        return super().to_dict()
+
+
+def _replace(model, cls=None, **changes):
+    """copy แบบตื้นของ model ที่ validate แล้ว (เร็วกว่า .copy(update=...) ของ pydantic ที่ไล่ทุก field)"""
+    cls = cls or model.__class__
+    copied = cls.__new__(cls)
+    object.__setattr__(copied, "__dict__", {**model.__dict__, **changes})
+    object.__setattr__(copied, "__fields_set__", model.__fields_set__ | changes.keys())
+    return copied
+
+
+class CardSkeleton:
+    def __init__(self, title, lines):
+        card = card_dict(title, lines)
+        self.bubble = FlexContainer.from_dict(card)
+        self.serialized = self.bubble.to_dict()
+        _, self.slots = card_layout(lines)
+        filled = len(title.encode()) + sum(len(text.encode()) for kind, text in lines if kind not in STATIC_KINDS)
+        self.size = len(json.dumps(self.serialized, ensure_ascii=False).encode()) - filled
+
+    def fill(self, title, values):
+        """คืน bubble ใหม่ที่แทนข้อความหัวเรื่องและช่องตัวเลข (โครงที่ validate แล้วใช้ร่วมกัน ไม่ถูกแก้)"""
+        header = self.bubble.header
+        body = self.bubble.body
+        contents = list(body.contents)
+        serialized = self.serialized
+        serialized_contents = list(serialized["body"]["contents"])
+        for index, value in zip(self.slots, values):
+            contents[index] = _replace(contents[index], text=value)
+            serialized_contents[index] = {**serialized_contents[index], "text": value}
+        bubble = _replace(
+            self.bubble, CardBubble,
+            header=_replace(header, contents=[_replace(header.contents[0], text=title)]),
+            body=_replace(body, contents=contents),
+        )
+        object.__setattr__(bubble, "_serialized", {
+            **serialized,
+            "header": {**serialized["header"], "contents": [{**serialized["header"]["contents"][0], "text": title}]},
+            "body": {**serialized["body"], "contents": serialized_contents},
+        })
+        return bubble
+
+
+class DoseCards:
+    def __init__(self, max_skeletons=4096):
+        self.max_skeletons = max_skeletons
+        self._skeletons = {}
+        self.builds = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._skeletons)
+
+    def bubble(self, drug, indication, text):
+        """bubble ของผลคำนวณ หรือ None ถ้าควรส่งเป็นข้อความธรรมดา"""
+        if not text or text.startswith("❌"):
+            return None
+        title, lines = split_reply(text)
+        if not lines:
+            return None
+        shape = tuple(line if kind in STATIC_KINDS else kind for kind, line in lines)
+        key = (drug, indication, shape)
+        skeleton = self._skeletons.get(key)
+        if skeleton is None:
+            skeleton = CardSkeleton(title, lines)
+            self.builds += 1
+            if len(self._skeletons) < self.max_skeletons:
+                self._skeletons[key] = skeleton
+        else:
+            self.hits += 1
+        values = [line for kind, line in lines if kind not in STATIC_KINDS]
+        if skeleton.size + len(title.encode()) + sum(len(value.encode()) for value in values) > BUBBLE_LIMIT_BYTES:
+            return None
+        return skeleton.fill(title, values)
+
+    def message(self, drug, indication, text):
+        """FlexMessage ของผลคำนวณ (alt text = หัวเรื่อง) หรือ TextMessage ถ้าทำเป็นการ์ดไม่ได้"""
+        bubble = self.bubble(drug, indication, text)
+        if bubble is None:
+            return TextMessage(text=text)
+        return FlexMessage(alt_text=text.split("\n", 1)[0][:ALT_TEXT_LIMIT], contents=bubble)
+
+    def status(self):
+        return {"skeletons": len(self._skeletons), "builds": self.builds, "hits": self.hits}
+
+
+def _samples(app, weights):
+    samples = []
+    for weight in weights:
+        for drug, info in app.DRUG_DATABASE.items():
+            for indication in info["indications"]:
+                samples.append((drug, indication, app.calculate_dose(drug, indication, weight, 5)))
+        for drug, info in app.SPECIAL_DRUGS.items():
+            for indication in info["indications"]:
+                samples.append((drug, indication, app.calculate_special_drug("Ubench", drug, weight, 5, indication)))
+    return samples
+
+
+def bench(app, repeat=20):
+    samples = [sample for sample in _samples(app, (8, 15, 22.5, 40)) if not sample[2].startswith("❌")]
+    cards = DoseCards()
+    # การ์ดที่ได้จาก skeleton ต้องเหมือนกับการสร้างจาก dict ทุกครั้ง
+    for drug, indication, text in samples:
+        bubble = cards.bubble(drug, indication, text)
+        if bubble is not None:
+            title, lines = split_reply(text)
+            expected = FlexContainer.from_dict(card_dict(title, lines))
+            assert bubble.to_dict() == expected.to_dict(), (drug, indication)
+            assert (bubble.header, bubble.body) == (expected.header, expected.body), (drug, indication)
+
+    def from_dict(drug, indication, text):
+        title, lines = split_reply(text)
+        return FlexMessage(alt_text=title[:ALT_TEXT_LIMIT], contents=FlexContainer.from_dict(card_dict(title, lines)))
+
+    def timed(build, send=False):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for drug, indication, text in samples:
+                message = build(drug, indication, text)
+                if send:
+                    ReplyMessageRequest(reply_token="bench", messages=[message]).to_json()
+        return (time.perf_counter() - started) / (repeat * len(samples)) * 1e6
+
+    text_message = lambda drug, indication, text: TextMessage(text=text)  # noqa: E731
+    print(f"{len(samples)} ผลคำนวณ, skeleton {len(cards)} แบบ")
+    print(f"{'':<34} {'สร้าง':>8} {'สร้าง+serialize':>16} (µs/ข้อความ)")
+    for name, build in [
+        ("TextMessage", text_message),
+        ("FlexContainer.from_dict ทุกครั้ง", from_dict),
+        ("skeleton ที่ cache ไว้", cards.message),
+    ]:
+        print(f"{name:<34} {timed(build):8.1f} {timed(build, send=True):16.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="การ์ด Flex ของผลคำนวณขนาดยา")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show")
+    show.add_argument("drug")
+    show.add_argument("indication")
+    show.add_argument("weight", type=float)
+    show.add_argument("--age", type=float, default=5)
+    bench_parser = sub.add_parser("bench")
+    bench_parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    import app
+
+    if args.command == "bench":
+        bench(app, args.repeat)
+        return 0
+    if args.drug in app.SPECIAL_DRUGS:
+        text = app.calculate_special_drug("Ushow", args.drug, args.weight, args.age, args.indication)
+    else:
+        text = app.calculate_dose(args.drug, args.indication, args.weight, args.age)
+    bubble = DoseCards().bubble(args.drug, args.indication, text)
+    print(json.dumps(bubble.to_dict(), ensure_ascii=False, indent=2) if bubble is not None else text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
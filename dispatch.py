@@ -0,0 +1,207 @@
+"""
+ประมวลผล webhook ที่มีหลาย event พร้อมกัน
+
+- แยก event ใน body เดียวเป็นกลุ่มตามผู้ส่ง (userId / groupId / roomId)
+  แต่ละกลุ่มทำทีละ event ตามลำดับเดิม ส่วนต่างกลุ่มทำพร้อมกันบน thread pool ที่จำกัดขนาด
+- รอผลไม่เกิน deadline_sec แล้วตอบ LINE ทันที กลุ่มที่ยังไม่เสร็จทำต่อใน background
+- ถ้า pool เต็มเกิน max_pending จะทำกลุ่มนั้นใน request thread เอง (backpressure)
+- body ที่มีผู้ส่งคนเดียว (กรณีส่วนใหญ่) ทำใน request thread เหมือน WebhookHandler เดิมทุกประการ
+- ใช้คู่กับ eventqueue.py ได้: verify() + split_body() ตอนรับ webhook แล้ว dispatch(parse_event(...)) ใน consumer
+    python dispatch.py bench    # เทียบเวลาตอบกลับกับ WebhookHandler เดิม ที่ 1 / 10 / 100 event
+"""
+import inspect
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.models.events import UnknownEvent
+from linebot.v3.webhook import WebhookHandler
+from linebot.v3.webhooks import Event, MessageEvent
+
+
+def source_key(event):
+    source = getattr(event, "source", None)
+    for attr in ("user_id", "group_id", "room_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return None
+
+
+def raw_source_key(event):
+    """source_key ของ event ที่ยังเป็น dict (JSON จาก LINE)"""
+    source = event.get("source") or {}
+    return source.get("userId") or source.get("groupId") or source.get("roomId")
+
+
+def split_body(body):
+    """body ของ webhook → [(source, destination, JSON ของ event เดียว)] สำหรับเก็บลงคิวทีละ event"""
+    payload = json.loads(body)
+    destination = payload.get("destination")
+    return [
+        (raw_source_key(event), destination, json.dumps(event, ensure_ascii=False, separators=(",", ":")))
+        for event in payload["events"]
+    ]
+
+
+def parse_event(event):
+    """dict ของ event เดียว → model แบบเดียวกับที่ WebhookParser.parse สร้าง"""
+    try:
+        return Event.from_dict(event)
+    except ValueError:
+        logging.info(f"Unknown event type. type={event.get('type')}")
+        return UnknownEvent.new_from_json_dict(event)
+
+
+@lru_cache(maxsize=None)
+def _args_count(func):
+    spec = inspect.getfullargspec(func)
+    return spec.varargs is not None, len(spec.args)
+
+
+def group_events(events):
+    groups = {}
+    for event in events:
+        groups.setdefault(source_key(event), []).append(event)
+    return list(groups.values())
+
+
+class ConcurrentWebhookHandler(WebhookHandler):
+    def __init__(self, channel_secret, max_workers=8, max_pending=64, deadline_sec=1.0,
+                 task_wrapper=None, **kwargs):
+        super().__init__(channel_secret, **kwargs)
+        self._verifier = self.parser  # parser อาจถูกครอบภายหลัง (TracedParser) จึงเก็บตัวจริงไว้ตรวจ signature
+        self.deadline_sec = deadline_sec
+        # task_wrapper(fn) ถูกเรียกใน request thread และคืน fn ที่พา context (เช่น trace) ไปยัง worker
+        self.task_wrapper = task_wrapper
+        self.late_groups = 0
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="webhook")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def handle(self, body, signature):
+        started = time.monotonic()
+        payload = self.parser.parse(body, signature, as_payload=True)
+        groups = group_events(payload.events)
+        if len(groups) <= 1:
+            for events in groups:
+                for event in events:
+                    self.dispatch(event, payload.destination)
+            return
+
+        futures = []
+        inline = []
+        for events in groups:
+            if not self._slots.acquire(blocking=False):
+                inline.append(events)
+                continue
+            task = self._run_group
+            if self.task_wrapper is not None:
+                task = self.task_wrapper(task)
+            future = self._executor.submit(task, events, payload.destination)
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+
+        for events in inline:
+            self._run_group(events, payload.destination)
+
+        deadline = max(0.0, self.deadline_sec - (time.monotonic() - started))
+        _, not_done = wait(futures, timeout=deadline)
+        if not_done:
+            self.late_groups += len(not_done)
+            logging.info(f"⏱️ ตอบ webhook ก่อน {len(not_done)} กลุ่มจะเสร็จ (ทำต่อใน background)")
+
+    def verify(self, body, signature):
+        """ตรวจ signature อย่างเดียวโดยไม่ parse (event จะถูก parse ทีหลังโดย consumer ของคิว)"""
+        verifier = self._verifier
+        if not verifier.skip_signature_verification() and not verifier.signature_validator.validate(body, signature or ""):
+            raise InvalidSignatureError(f"Invalid signature. signature={signature}")
+
+    def _run_group(self, events, destination):
+        for event in events:
+            try:
+                self.dispatch(event, destination)
+            except Exception as e:
+                logging.info(f"❌ ประมวลผล event ของ {source_key(event)} ไม่สำเร็จ: {e}")
+
+    def dispatch(self, event, destination):
+        """เลือก handler แบบเดียวกับ WebhookHandler.handle แล้วเรียกกับ event เดียว"""
+        func = None
+        if isinstance(event, MessageEvent):
+            func = self._handlers.get(f"{event.__class__.__name__}_{event.message.__class__.__name__}")
+        if func is None:
+            func = self._handlers.get(event.__class__.__name__)
+        if func is None:
+            func = self._default
+        if func is None:
+            logging.info(f"No handler of {event.__class__.__name__} and no default handler")
+            return
+
+        has_varargs, args_count = _args_count(func)
+        if has_varargs or args_count == 2:
+            func(event, destination)
+        elif args_count == 1:
+            func(event)
+        else:
+            func()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+# ---------- benchmark ----------
+
+def _bench_body(event_count, user_count):
+    events = [
+        {
+            "type": "message", "mode": "active", "timestamp": 0,
+            "source": {"type": "user", "userId": f"U{i % user_count:032d}"},
+            "webhookEventId": f"bench{i}", "deliveryContext": {"isRedelivery": False},
+            "replyToken": f"token{i}",
+            "message": {"id": str(i), "type": "text", "quoteToken": "q", "text": "bench"},
+        }
+        for i in range(event_count)
+    ]
+    return json.dumps({"destination": "Ubench", "events": events})
+
+
+def bench(reply_latency_sec=0.02, repeat=3):
+    """จำลอง handler ที่ใช้เวลาตอบ reply_latency_sec ต่อ event แล้ววัดเวลาที่ใช้ตอบ webhook"""
+    def make(cls, **kwargs):
+        h = cls("bench", skip_signature_verification=lambda: True, **kwargs)
+
+        @h.add(MessageEvent)
+        def on_message(event):
+            time.sleep(reply_latency_sec)
+        return h
+
+    sequential = make(WebhookHandler)
+    concurrent = make(ConcurrentWebhookHandler, max_workers=32, deadline_sec=10.0)
+    rows = []
+    for event_count in (1, 10, 100):
+        for user_count in sorted({1, min(event_count, 10), event_count}):
+            body = _bench_body(event_count, user_count)
+            timings = []
+            for h in (sequential, concurrent):
+                best = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    h.handle(body, "")
+                    best = min(best, time.perf_counter() - started)
+                timings.append(best)
+            rows.append((event_count, user_count, *timings))
+    concurrent.shutdown()
+    return rows
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["bench"]:
+        sys.stdout.write(f"{'events':>6} {'users':>5} {'sequential ms':>14} {'concurrent ms':>14}\n")
+        for event_count, user_count, seq, conc in bench():
+            sys.stdout.write(f"{event_count:>6} {user_count:>5} {seq * 1000:>14.1f} {conc * 1000:>14.1f}\n")
+    else:
+        sys.stdout.write("usage: python dispatch.py bench\n")
@@ -0,0 +1,213 @@
+"""
+พิมพ์ใบขนาดยาจำนวนมากจากไฟล์ CSV (offline ไม่ต้องเปิด Flask และไม่ต้องมี LINE token)
+
+- อ่าน CSV แบบ stream ทีละแถว (คอลัมน์ drug, indication, age, weight; คอลัมน์อื่น เช่น HN/ชื่อ ส่งต่อไปยังผลลัพธ์)
+- แบ่งแถวเป็นก้อนละ --chunk แถว ส่งให้ process pool คำนวณด้วย calculate_dose / calculate_special_drug ของ app.py
+- เขียนผลตามลำดับแถวเดิมเป็น CSV, JSONL หรือ HTML (พิมพ์ได้) ทันทีที่ก้อนถัดไปเสร็จ
+  งานที่ค้างในคิวมีไม่เกิน workers × 2 ก้อน หน่วยความจำจึงคงที่แม้ไฟล์มีหลายล้านแถว
+    python dosesheet.py ward.csv -o ward.html
+    python dosesheet.py ward.csv --format jsonl --workers 8 > ward.jsonl
+"""
+import argparse
+import csv
+import html
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+REQUIRED_COLUMNS = ("drug", "indication", "age", "weight")
+SHEET_USER = "Udosesheet"
+
+
+def _number(value, name):
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} ไม่ใช่ตัวเลข: {value!r}")
+    if not math.isfinite(number):
+        raise ValueError(f"{name} ไม่ใช่ตัวเลขที่ใช้ได้: {value!r}")
+    if number < 0:
+        raise ValueError(f"{name} ติดลบ: {value!r}")
+    return number
+
+
+def calculate_row(row):
+    """คำนวณแถวเดียว คืน (ผลลัพธ์, error)"""
+    import app
+
+    drug = (row.get("drug") or "").strip()
+    indication = (row.get("indication") or "").strip()
+    try:
+        age = _number(row.get("age"), "age")
+        weight = _number(row.get("weight"), "weight")
+    except ValueError as e:
+        return "", str(e)
+
+    found = app.resolve_drug(drug)
+    if found is None:
+        return "", f"ไม่พบยา {drug}"
+    drug, kind = found
+    # แถวที่คำนวณไม่ได้ต้องไม่ทำให้ทั้งก้อน (และทั้งไฟล์) ล้ม → รายงานในคอลัมน์ error
+    try:
+        if kind == "special":
+            return app.calculate_special_drug(SHEET_USER, drug, weight, age, indication), ""
+        return app.calculate_dose(drug, indication, weight, age), ""
+    except Exception as e:
+        return "", f"คำนวณไม่สำเร็จ: {type(e).__name__}: {e}"
+
+
+def calculate_chunk(rows):
+    import app
+
+    with app.formulary_store.pin():  # ทั้งก้อนใช้ formulary version เดียวกัน
+        return [calculate_row(row) for row in rows]
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(rows, workers=None, chunk_size=500):
+    """คืน iterator ของ (row, ผลลัพธ์, error) ตามลำดับ input โดยมีงานค้างไม่เกิน workers × 2 ก้อน"""
+    import app  # noqa: F401 -- ไม่ได้ใช้ชื่อนี้ตรงๆ: โหลด formulary ก่อน fork ให้ worker ใช้ร่วมกัน
+
+    workers = workers or os.cpu_count() or 1
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork") if "fork" in methods else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for chunk in _chunks(rows, chunk_size):
+            pending.append((chunk, pool.submit(calculate_chunk, chunk)))
+            if len(pending) >= workers * 2:
+                yield from _drain(pending.popleft())
+        while pending:
+            yield from _drain(pending.popleft())
+
+
+def _drain(item):
+    chunk, future = item
+    for row, (result, error) in zip(chunk, future.result()):
+        yield row, result, error
+
+
+# ---------- output ----------
+
+class CsvWriter:
+    def __init__(self, out, columns):
+        self._writer = csv.writer(out)
+        self._writer.writerow(columns + ["result", "error"])
+        self._columns = columns
+
+    def write(self, row, result, error):
+        self._writer.writerow([row.get(c, "") for c in self._columns] + [result, error])
+
+    def close(self):
+        pass
+
+
+class JsonlWriter:
+    def __init__(self, out, columns):
+        self._out = out
+
+    def write(self, row, result, error):
+        self._out.write(json.dumps({**row, "result": result, "error": error}, ensure_ascii=False) + "\n")
+
+    def close(self):
+        pass
+
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="th"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 1.5em; }}
+section {{ border: 1px solid #999; padding: .6em 1em; margin-bottom: 1em; page-break-inside: avoid; }}
+h2 {{ font-size: 1.05em; margin: 0 0 .4em; }}
+dl {{ display: grid; grid-template-columns: max-content auto; gap: .1em 1em; margin: 0 0 .5em; }}
+dt {{ font-weight: bold; }}
+pre {{ white-space: pre-wrap; font-family: inherit; margin: 0; }}
+.error {{ color: #b00; }}
+</style></head><body>
+<h1>{title}</h1>
+"""
+
+
+class HtmlWriter:
+    def __init__(self, out, columns, title="ใบขนาดยา"):
+        self._out = out
+        self._columns = columns
+        self._count = 0
+        out.write(HTML_HEAD.format(title=html.escape(title)))
+
+    def write(self, row, result, error):
+        self._count += 1
+        e = html.escape
+        fields = "".join(f"<dt>{e(c)}</dt><dd>{e(str(row.get(c, '')))}</dd>" for c in self._columns)
+        body = f'<pre class="error">{e(error)}</pre>' if error else f"<pre>{e(result)}</pre>"
+        self._out.write(f"<section><h2>#{self._count}</h2><dl>{fields}</dl>{body}</section>\n")
+
+    def close(self):
+        self._out.write("</body></html>\n")
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "html": HtmlWriter}
+
+
+def _read_rows(reader):
+    for row in reader:
+        yield {(k or "").strip().lower(): v for k, v in row.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="คำนวณขนาดยาจาก CSV (drug, indication, age, weight)")
+    parser.add_argument("input", help="ไฟล์ CSV หรือ - สำหรับ stdin")
+    parser.add_argument("-o", "--output", help="ไฟล์ผลลัพธ์ (ค่าเริ่มต้น: stdout)")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="ค่าเริ่มต้น: ตามนามสกุลของ --output หรือ csv")
+    parser.add_argument("--workers", type=int, default=None, help="จำนวน process (ค่าเริ่มต้น: ทุก core)")
+    parser.add_argument("--chunk", type=int, default=500, help="จำนวนแถวต่อก้อนงาน")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.output or "")[1].lstrip(".").lower()
+        fmt = ext if ext in WRITERS else "csv"
+
+    source = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8-sig")
+    out = sys.stdout if not args.output else open(args.output, "w", newline="", encoding="utf-8")
+    started = time.perf_counter()
+    count = errors = 0
+    try:
+        reader = csv.DictReader(source)
+        columns = [(c or "").strip().lower() for c in reader.fieldnames or ()]
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            sys.stderr.write(f"❌ ไม่มีคอลัมน์: {', '.join(missing)}\n")
+            return 2
+        writer = WRITERS[fmt](out, columns)
+        for row, result, error in run(_read_rows(reader), args.workers, args.chunk):
+            writer.write(row, result, error)
+            count += 1
+            errors += bool(error)
+        writer.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write(f"✅ {count:,} แถว ({errors:,} error) ใน {time.perf_counter() - started:.1f}s\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
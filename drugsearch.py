@@ -0,0 +1,162 @@
+"""
+ค้นหาชื่อยาแบบทนการพิมพ์ผิด (ชื่อยา, ชื่ออื่น/ชื่อการค้า, ชื่อภาษาไทย)
+
+- normalize: ตัวพิมพ์เล็ก, ตัดตัวเลข/เครื่องหมาย ("Cefdinir 125" → "cefdinir") เก็บสระ/วรรณยุกต์ไทย
+- DrugSearch สร้างครั้งเดียวต่อ formulary version: inverted index ของ trigram → term id
+  ตอนค้นหานับ trigram ที่ตรงกันเพื่อเลือก candidate ไม่กี่ตัว (แก้ 1 ตัวอักษรทำให้ trigram ต่างไม่เกิน 3 ตัว
+  term ที่ trigram ตรงน้อยกว่านั้นจึงตัดทิ้งได้โดยไม่ต้องคำนวณ) แล้วเรียงใหม่ด้วย edit distance แบบมีเพดาน
+  (หยุดคำนวณทันทีเมื่อเกิน max distance) และนับพิมพ์ต้นชื่อ (prefix) เช่น "amoxi" เป็นระยะ 0
+- ผลลัพธ์เป็นชื่อยาใน formulary ไม่ซ้ำกัน เรียงจากใกล้ที่สุด
+    python drugsearch.py query paracetamal      # ดูผลค้นหา
+    python drugsearch.py bench                  # เวลาต่อการค้นหา (µs)
+"""
+import argparse
+import sys
+import time
+import unicodedata
+from collections import defaultdict
+
+MIN_QUERY_LENGTH = 3
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFC", text).lower()
+    text = "".join(c if c.isalpha() or unicodedata.category(c) == "Mn" else " " for c in text)
+    return " ".join(text.split())
+
+
+def trigrams(term):
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_distance(length):
+    """ระยะแก้ไขที่ยอมได้ตามความยาวคำค้น"""
+    if length <= 4:
+        return 1
+    if length <= 8:
+        return 2
+    return 3
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance ถ้าไม่เกิน limit ไม่เช่นนั้นคืน limit + 1 (คำนวณเฉพาะแถบกว้าง ±limit รอบเส้นทแยง)"""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        best = current[0]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] if ca == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+class DrugSearch:
+    def __init__(self, names, candidates=16):
+        """names: {ชื่อยาใน formulary: [ชื่ออื่น, ชื่อไทย, ...]}"""
+        self.candidates = candidates
+        self._terms = []
+        self._drugs = []
+        postings = defaultdict(list)
+        seen = set()
+        for drug, aliases in names.items():
+            for alias in (drug, *aliases):
+                term = normalize(alias)
+                if len(term) < 2 or (term, drug) in seen:
+                    continue
+                seen.add((term, drug))
+                term_id = len(self._terms)
+                self._terms.append(term)
+                self._drugs.append(drug)
+                for gram in trigrams(term):
+                    postings[gram].append(term_id)
+        self._postings = {gram: tuple(ids) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self._terms)
+
+    def search(self, query, limit=4):
+        """คืน [(ชื่อยา, distance)] เรียงจากใกล้ที่สุด ไม่เกิน limit รายการ"""
+        query = normalize(query)
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        grams = trigrams(query)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for term_id in self._postings.get(gram, ()):
+                overlap[term_id] += 1
+        limit_distance = max_distance(len(query))
+        # trigram ท้ายคำค้นไม่ตรงเมื่อพิมพ์แค่ต้นชื่อ จึงเผื่อไว้ 1
+        required = max(1, len(grams) - 1 - 3 * limit_distance)
+        candidates = [term_id for term_id, count in overlap.items() if count >= required]
+        if not candidates:
+            return []
+
+        best = {}
+        for term_id in sorted(candidates, key=overlap.get, reverse=True)[:self.candidates]:
+            term = self._terms[term_id]
+            distance = bounded_distance(query, term, limit_distance)
+            if len(term) > len(query):
+                # พิมพ์แค่ต้นชื่อ: เทียบกับต้นชื่อที่ยาวเท่ากัน (ได้ลำดับหลังชื่อที่ตรงทั้งคำ)
+                distance = min(distance, bounded_distance(query, term[:len(query)], limit_distance) + 0.5)
+            if distance > limit_distance:
+                continue
+            drug = self._drugs[term_id]
+            rank = (distance, -overlap[term_id], len(term))
+            if drug not in best or rank < best[drug]:
+                best[drug] = rank
+        ranked = sorted(best.items(), key=lambda item: item[1])[:limit]
+        return [(drug, rank[0]) for drug, rank in ranked]
+
+
+def _load():
+    import app
+
+    return app.drug_search()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ค้นหาชื่อยาแบบทนการพิมพ์ผิด")
+    sub = parser.add_subparsers(dest="command", required=True)
+    query = sub.add_parser("query")
+    query.add_argument("text", nargs="+")
+    bench = sub.add_parser("bench")
+    bench.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    search = _load()
+    if args.command == "query":
+        for drug, distance in search.search(" ".join(args.text)):
+            print(f"{distance:>4}  {drug}")
+        return 0
+
+    queries = ["amoxi", "cefdinir 125", "เซทิริซีน", "paracetamal", "ibuprofin", "ออกเมนติน", "zzzz"]
+    for text in queries:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            result = search.search(text)
+        elapsed = (time.perf_counter() - started) / args.repeat * 1e6
+        print(f"{text:<16} {elapsed:7.1f} µs  {[drug for drug, _ in result]}")
+    print(f"{len(search)} ชื่อในดัชนี")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""
+คิว event แบบ durable (SQLite WAL) ระหว่าง /callback กับการประมวลผล
+
+- /callback ตรวจ signature แล้ว put() event ลงคิว และตอบ LINE หลัง commit ลงดิสก์แล้วเท่านั้น
+  writer thread เดียวรวม event จากทุก request ที่เข้ามาพร้อมกันเป็น transaction เดียว (batched insert / group commit)
+- consumer claim event พร้อม lease → ประมวลผล → ack (ลบออกจากคิว)
+  ถ้า worker ตายหรือถูก recycle ระหว่างทาง lease จะหมดอายุแล้ว consumer อื่น claim ใหม่ได้
+  event ที่ล้มเหลวครบ max_attempts ครั้งถูกย้ายไป dead_events (ไม่วนซ้ำไม่รู้จบ)
+- ลำดับต่อผู้ใช้คงเดิม: event ของผู้ใช้ที่มี event อื่นติด lease ของ consumer อื่นอยู่จะยังไม่ถูก claim
+- consumer เป็น thread ใน process เดียวกันหรือ process อื่นที่เปิดไฟล์เดียวกันก็ได้
+    python eventqueue.py bench                  # throughput enqueue/dequeue เมื่อมี writer หลาย thread
+    python eventqueue.py stats events.db        # จำนวน event ที่รอ / ติด lease / dead
+"""
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT,
+    destination TEXT,
+    body TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    owner TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS events_leased ON events (lease_until);
+CREATE TABLE IF NOT EXISTS dead_events (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    destination TEXT,
+    body TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+QueuedEvent = namedtuple("QueuedEvent", "id source destination body enqueued_at attempts")
+
+
+class EnqueueError(Exception):
+    """บันทึก event ลงคิวไม่สำเร็จ (/callback ควรตอบ 5xx ให้ LINE ส่งซ้ำ)"""
+
+
+class _Pending:
+    __slots__ = ("rows", "done", "error")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error = None
+
+
+class EventQueue:
+    def __init__(self, path, max_batch=512, max_attempts=5, synchronous="NORMAL", start_writer=True):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.synchronous = synchronous
+        self.enqueued = 0
+        self.commits = 0
+        self.dead_lettered = 0
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._conn().executescript(SCHEMA)
+
+        self._pending = []
+        self._pending_lock = threading.Condition()
+        # consumer ใน process เดียวกันตื่นทันทีเมื่อมี commit/ack แทนการรอ poll
+        self._changed = threading.Condition()
+        self._version = 0
+        self._closed = False
+        self._writer = None
+        if start_writer:
+            self._writer = threading.Thread(target=self._run_writer, name="eventqueue-writer", daemon=True)
+            self._writer.start()
+
+    # ---------- connection ----------
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit แล้วเปิด transaction เองด้วย BEGIN IMMEDIATE (ล็อกเขียนตั้งแต่ต้น ไม่ deadlock ตอน upgrade)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def _notify(self):
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def wait(self, timeout):
+        """รอจนมี event ใหม่หรือ ack (ใน process นี้) หรือครบ timeout"""
+        with self._changed:
+            version = self._version
+            self._changed.wait_for(lambda: self._version != version or self._closed, timeout)
+
+    # ---------- producer ----------
+
+    def put(self, events, timeout=5.0):
+        """
+        events: [(source, destination, body)] → block จน commit แล้ว
+        request ที่เข้ามาพร้อมกันถูกรวมเป็น transaction เดียวโดย writer thread
+        """
+        if not events:
+            return
+        now = time.time()
+        pending = _Pending([(source, destination, body, now) for source, destination, body in events])
+        if self._writer is None:
+            self._write([pending])
+        else:
+            with self._pending_lock:
+                if self._closed:
+                    raise EnqueueError("event queue ปิดแล้ว")
+                self._pending.append(pending)
+                self._pending_lock.notify()
+            if not pending.done.wait(timeout):
+                raise EnqueueError(f"บันทึก event ลงคิวไม่ทันใน {timeout}s")
+        if pending.error is not None:
+            raise EnqueueError(str(pending.error)) from pending.error
+
+    def _run_writer(self):
+        while True:
+            with self._pending_lock:
+                self._pending_lock.wait_for(lambda: self._pending or self._closed)
+                if not self._pending and self._closed:
+                    return
+                batch, count = [], 0
+                while self._pending and count < self.max_batch:
+                    pending = self._pending.pop(0)
+                    batch.append(pending)
+                    count += len(pending.rows)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO events (source, destination, body, enqueued_at) VALUES (?, ?, ?, ?)",
+                    [row for pending in batch for row in pending.rows],
+                )
+            self.commits += 1
+            self.enqueued += sum(len(pending.rows) for pending in batch)
+        except sqlite3.Error as e:
+            logging.info(f"❌ บันทึก event ลงคิวไม่สำเร็จ: {e}")
+            for pending in batch:
+                pending.error = e
+        for pending in batch:
+            pending.done.set()
+        self._notify()
+
+    # ---------- consumer ----------
+
+    def claim(self, owner, limit=16, lease_sec=60.0):
+        """claim event ที่พร้อม (ไม่มี lease หรือ lease หมดอายุ) ตามลำดับที่เข้าคิว คืน [QueuedEvent]"""
+        now = time.time()
+        with self._transaction() as conn:
+            blocked = {
+                source for (source,) in conn.execute(
+                    "SELECT DISTINCT source FROM events WHERE lease_until >= ? AND (owner IS NULL OR owner != ?)",
+                    (now, owner),
+                )
+            }
+            rows = conn.execute(
+                "SELECT id, source, destination, body, enqueued_at, attempts FROM events "
+                "WHERE lease_until < ? ORDER BY id LIMIT ?",
+                (now, limit * 4 + len(blocked)),
+            ).fetchall()
+
+            claimed, dead = [], []
+            for row in rows:
+                event = QueuedEvent(*row)
+                if event.source is not None and event.source in blocked:
+                    continue
+                if event.attempts >= self.max_attempts:
+                    dead.append(event.id)
+                    continue
+                claimed.append(event)
+                if len(claimed) >= limit:
+                    break
+
+            if dead:
+                self._dead_letter(conn, dead, now)
+            if claimed:
+                conn.executemany(
+                    "UPDATE events SET owner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(owner, now + lease_sec, event.id) for event in claimed],
+                )
+        return [event._replace(attempts=event.attempts + 1) for event in claimed]
+
+    def ack(self, owner, ids):
+        """ลบ event ที่ประมวลผลเสร็จ (เฉพาะที่ยังเป็น lease ของ owner นี้)"""
+        if not ids:
+            return
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM events WHERE id = ? AND owner = ?", [(i, owner) for i in ids])
+        self._notify()
+
+    def release(self, owner, ids, delay_sec=0.0, error=None, refund=False):
+        """
+        คืน lease ให้ claim ใหม่ได้หลัง delay_sec (ประมวลผลล้มเหลว หรือข้ามไปเพื่อรักษาลำดับ)
+        refund: ไม่นับเป็นความพยายามครั้งหนึ่ง (event ที่ยังไม่ได้ลองทำ)
+        """
+        if not ids:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE events SET lease_until = ?, owner = NULL, error = COALESCE(?, error), "
+                "attempts = attempts - ? WHERE id = ? AND owner = ?",
+                [(time.time() + delay_sec, error, int(refund), i, owner) for i in ids],
+            )
+        self._notify()
+
+    def _dead_letter(self, conn, ids, now):
+        conn.executemany(
+            "INSERT OR REPLACE INTO dead_events (id, source, destination, body, enqueued_at, attempts, error, failed_at) "
+            "SELECT id, source, destination, body, enqueued_at, attempts, error, ? FROM events WHERE id = ?",
+            [(now, i) for i in ids],
+        )
+        conn.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
+        self.dead_lettered += len(ids)
+        logging.info(f"☠️ ย้าย event {len(ids)} รายการที่ล้มเหลวครบ {self.max_attempts} ครั้งไป dead_events")
+
+    # ---------- สถานะ ----------
+
+    def stats(self):
+        now = time.time()
+        conn = self._conn()
+        ready, leased, oldest = conn.execute(
+            "SELECT SUM(lease_until < ?), SUM(lease_until >= ?), MIN(enqueued_at) FROM events", (now, now)
+        ).fetchone()
+        (dead,) = conn.execute("SELECT COUNT(*) FROM dead_events").fetchone()
+        return {
+            "ready": ready or 0,
+            "leased": leased or 0,
+            "dead": dead,
+            "oldest_age_sec": round(now - oldest, 3) if oldest else None,
+            "enqueued": self.enqueued,
+            "commits": self.commits,
+        }
+
+    def close(self, timeout=5.0):
+        """เขียน event ที่ค้างใน writer ให้หมดแล้วปิด connection"""
+        with self._pending_lock:
+            self._closed = True
+            self._pending_lock.notify_all()
+        if self._writer is not None:
+            self._writer.join(timeout)
+        self._notify()
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+def default_owner(name):
+    return f"{socket.gethostname()}:{os.getpid()}:{name}"
+
+
+class EventQueueConsumer:
+    """
+    thread ที่ claim → process(event) → ack
+    process ล้มเหลว: event นั้นถูกคืนให้ลองใหม่หลัง retry_delay_sec และ event ถัดไปของผู้ใช้เดียวกันใน batch
+    ถูกคืนด้วย (ไม่ข้ามลำดับ)
+    """
+
+    def __init__(self, queue, process, threads=4, batch_size=16, lease_sec=60.0,
+                 poll_interval=0.5, retry_delay_sec=5.0):
+        self.queue = queue
+        self.process = process
+        self.batch_size = batch_size
+        self.lease_sec = lease_sec
+        self.poll_interval = poll_interval
+        self.retry_delay_sec = retry_delay_sec
+        self.processed = 0
+        self.failed = 0
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, args=(default_owner(f"consumer-{i}"),),
+                             name=f"eventqueue-consumer-{i}", daemon=True)
+            for i in range(threads)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """หยุดรับ batch ใหม่ รอ batch ปัจจุบันเสร็จ (event ที่ยังไม่ ack จะถูก claim ใหม่ตอนเริ่มครั้งหน้า)"""
+        self._stopping.set()
+        self.queue._notify()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _run(self, owner):
+        while not self._stopping.is_set():
+            try:
+                batch = self.queue.claim(owner, self.batch_size, self.lease_sec)
+            except sqlite3.Error as e:
+                logging.info(f"❌ claim event จากคิวไม่สำเร็จ: {e}")
+                self._stopping.wait(self.poll_interval)
+                continue
+            if not batch:
+                self.queue.wait(self.poll_interval)
+                continue
+            self._run_batch(owner, batch)
+
+    def _run_batch(self, owner, batch):
+        failed_sources = set()
+        for index, event in enumerate(batch):
+            if self._stopping.is_set():
+                self.queue.release(owner, [e.id for e in batch[index:]], refund=True)
+                return
+            if event.source is not None and event.source in failed_sources:
+                self.queue.release(owner, [event.id], self.retry_delay_sec, refund=True)
+                continue
+            try:
+                self.process(event)
+            except Exception as e:
+                self.failed += 1
+                logging.info(f"❌ ประมวลผล event {event.id} (ครั้งที่ {event.attempts}) ไม่สำเร็จ: {e}")
+                failed_sources.add(event.source)
+                self.queue.release(owner, [event.id], self.retry_delay_sec, error=repr(e))
+                continue
+            self.queue.ack(owner, [event.id])
+            self.processed += 1
+
+
+# ---------- benchmark ----------
+
+def bench(writers=(1, 8, 32), events_per_writer=2000, consumers=4, synchronous="NORMAL"):
+    """
+    writer แต่ละ thread put() ทีละ event (เหมือน /callback ที่มีหลาย request พร้อมกัน)
+    แล้ว consumer หลาย thread claim + ack จนคิวว่าง
+    """
+    rows = []
+    for writer_count in writers:
+        with tempfile.TemporaryDirectory() as directory:
+            queue = EventQueue(os.path.join(directory, "bench.db"), synchronous=synchronous)
+            body = '{"type":"message","message":{"type":"text","text":"bench"}}'
+
+            def produce(w):
+                for i in range(events_per_writer):
+                    queue.put([(f"U{w}:{i % 50}", "Ubench", body)])
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=produce, args=(w,)) for w in range(writer_count)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            enqueue_sec = time.perf_counter() - started
+            total = writer_count * events_per_writer
+            commits = queue.commits
+
+            consumer = EventQueueConsumer(queue, lambda event: None, threads=consumers, batch_size=64,
+                                          poll_interval=0.05)
+
+            started = time.perf_counter()
+            consumer.start()
+            while consumer.processed < total:
+                time.sleep(0.005)
+            dequeue_sec = time.perf_counter() - started
+            consumer.stop()
+            queue.close()
+            rows.append((writer_count, total, total / enqueue_sec, total / commits, total / dequeue_sec))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="คิว event แบบ durable (SQLite WAL)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("bench")
+    p.add_argument("--events", type=int, default=2000, help="จำนวน event ต่อ writer")
+    p.add_argument("--consumers", type=int, default=4)
+    p.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    p = sub.add_parser("stats")
+    p.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        queue = EventQueue(args.path, start_writer=False)
+        for key, value in queue.stats().items():
+            sys.stdout.write(f"{key}: {value}\n")
+        queue.close()
+        return 0
+
+    sys.stdout.write(f"{'writers':>7} {'events':>7} {'enqueue/s':>10} {'events/commit':>13} {'dequeue/s':>10}\n")
+    for writer_count, total, enqueue_rate, per_commit, dequeue_rate in bench(
+        events_per_writer=args.events, consumers=args.consumers, synchronous=args.synchronous
+    ):
+        sys.stdout.write(
+            f"{writer_count:>7} {total:>7} {enqueue_rate:>10,.0f} {per_commit:>13.1f} {dequeue_rate:>10,.0f}\n"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""
+เก็บ DRUG_DATABASE / SPECIAL_DRUGS แบบ compact สำหรับทุก worker
+
+- string ทุกตัว (ทั้ง key และค่า) ถูก intern จึงมีสำเนาเดียวทั้ง process
+- sub-structure ที่เหมือนกันทุกประการ (เช่น ข้อบ่งใช้ของ Paracetamol ที่อยู่ทั้งสองตาราง, list ความถี่
+  [2, 3] ที่ซ้ำกันหลายยา) ถูกรวมเป็น object เดียวด้วย hash-consing
+- dict/list ถูกแทนด้วย FrozenDict/FrozenList ที่ยังเป็น subclass ของ dict/list (โค้ดเดิมที่ใช้
+  isinstance / .get / [] ทำงานเหมือนเดิม) แต่แก้ไขไม่ได้ และไม่มีต้นทุน __dict__ ต่อ object (__slots__ = ())
+    python formulary.py report    # วัดหน่วยความจำก่อน/หลังด้วย tracemalloc
+
+FormularyStore: โหลด formulary ใหม่ระหว่างรันได้ (ไฟล์ JSON ที่เปลี่ยน, SIGHUP หรือ admin endpoint)
+- ตรวจสอบ + compact + warm cache ใน thread ของ reloader แล้วค่อย publish ด้วยการสลับ reference ครั้งเดียว
+- cache ที่คำนวณจาก formulary ผูกกับ snapshot ของแต่ละ version (snapshot.cache(name))
+- request ที่กำลังทำงาน pin snapshot ไว้ตลอด request จึงจบด้วย version เดิมแม้มีการ reload ระหว่างทาง
+    python formulary.py export formulary.json    # เขียน formulary ปัจจุบันออกเป็นไฟล์ JSON สำหรับแก้ไข
+"""
+import gc
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections.abc import Mapping
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("formulary is read-only")
+
+
+class FrozenDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def _compact(value, memo):
+    # ลูกถูก compact ก่อนเสมอ → ลูกที่เท่ากันเป็น object เดียวกัน จึงใช้ id ของลูกเป็น key ได้
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        plain = {_compact(k, memo): _compact(v, memo) for k, v in value.items()}
+        key = ("d", tuple((k, id(v)) for k, v in plain.items()))
+    elif isinstance(value, (list, tuple)):
+        plain = [_compact(v, memo) for v in value]
+        key = (type(value).__name__, tuple(map(id, plain)))
+    else:
+        # ตัวเลข/None/bool: แยกตาม type เพื่อไม่ให้ 1, 1.0 และ True ถูกรวมกัน
+        plain = value
+        key = ("v", type(value), value)
+
+    shared = memo.get(key)
+    if shared is None:
+        if isinstance(value, dict):
+            shared = FrozenDict(plain)  # copy จาก dict ขนาดพอดี ไม่ต้องขยายตารางทีละขั้น
+        elif isinstance(value, list):
+            shared = FrozenList(plain)
+        elif isinstance(value, tuple):
+            shared = tuple(plain)
+        else:
+            shared = value
+        memo[key] = shared
+    return shared
+
+
+def compact_formulary(*tables):
+    """คืนตารางยาทุกตารางในรูป compact โดยใช้ sub-structure ร่วมกันข้ามตาราง"""
+    memo = {}
+    return tuple(_compact(table, memo) for table in tables)
+
+
+def compute_formulary_version(drugs, special_drugs):
+    payload = json.dumps([drugs, special_drugs], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def check_structure(drugs, special_drugs):
+    """ตรวจโครงสร้างขั้นต่ำที่ calculator ต้องใช้ คืน list ของปัญหา (ว่าง = ผ่าน)"""
+    problems = []
+    for table_name, table in (("DRUG_DATABASE", drugs), ("SPECIAL_DRUGS", special_drugs)):
+        if not isinstance(table, dict) or not table:
+            problems.append(f"{table_name}: ต้องเป็น object ที่ไม่ว่าง")
+            continue
+        for drug, info in table.items():
+            if not isinstance(info, dict):
+                problems.append(f"{table_name}.{drug}: ต้องเป็น object")
+                continue
+            if not isinstance(info.get("concentration_mg_per_ml"), (int, float)):
+                problems.append(f"{table_name}.{drug}: ไม่มี concentration_mg_per_ml")
+            if not info.get("indications"):
+                problems.append(f"{table_name}.{drug}: ไม่มี indications")
+    return problems
+
+
+class FormularySnapshot:
+    __slots__ = ("version", "drugs", "special_drugs", "source", "loaded_at", "warnings", "_caches", "_lock")
+
+    def __init__(self, drugs, special_drugs, source):
+        self.drugs, self.special_drugs = compact_formulary(drugs, special_drugs)
+        self.version = compute_formulary_version(self.drugs, self.special_drugs)
+        self.source = source
+        self.loaded_at = time.time()
+        self.warnings = []
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def cache(self, name, build=dict):
+        """cache ที่ผูกกับ version นี้ (หายไปพร้อม snapshot เมื่อไม่มี request ใดใช้แล้ว)"""
+        cache = self._caches.get(name)
+        if cache is None:
+            with self._lock:
+                cache = self._caches.get(name)
+                if cache is None:
+                    cache = self._caches[name] = build()
+        return cache
+
+
+class _PinLocal(threading.local):
+    snapshot = None
+
+
+class FormularyView(Mapping):
+    """mapping อ่านอย่างเดียวที่ชี้ไปยังตารางของ snapshot ที่ request นี้ pin ไว้ (หรือ version ล่าสุด)"""
+
+    def __init__(self, store, attr):
+        self._store = store
+        self._attr = attr
+
+    def _table(self):
+        return getattr(self._store.snapshot(), self._attr)
+
+    def __getitem__(self, key):
+        return self._table()[key]
+
+    def __iter__(self):
+        return iter(self._table())
+
+    def __len__(self):
+        return len(self._table())
+
+    def __contains__(self, key):
+        return key in self._table()
+
+    def get(self, key, default=None):
+        return self._table().get(key, default)
+
+    def __repr__(self):
+        return f"<FormularyView {self._attr} v{self._store.snapshot().version}>"
+
+
+class FormularyStore:
+    def __init__(self, validators=(), warmers=(), linters=()):
+        self.validators = list(validators)
+        self.warmers = list(warmers)
+        # linter คืนข้อความแจ้งเตือนแบบเดียวกับ validator แต่ไม่บล็อกการโหลด (เก็บไว้ที่ snapshot.warnings)
+        self.linters = list(linters)
+        self.current = None
+        self.last_error = None
+        self.reloads = 0
+        self._pins = _PinLocal()
+        self._reload_lock = threading.Lock()
+        self._watch_thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    # ---------- อ่าน ----------
+
+    def snapshot(self):
+        return self._pins.snapshot or self.current
+
+    def version(self):
+        return self.snapshot().version
+
+    def view(self, attr):
+        return FormularyView(self, attr)
+
+    def pin(self):
+        """context manager: ให้ทุกการอ่านใน thread นี้ใช้ snapshot เดียวกันจนจบ block"""
+        return _Pinned(self._pins, self.current)
+
+    def pinned(self, func):
+        def wrapper(*args):
+            with self.pin():
+                return func(*args)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    # ---------- โหลด / publish ----------
+
+    def build(self, drugs, special_drugs, source):
+        """validate + compact + warm cache (ยังไม่ publish) ถ้าไม่ผ่านจะ raise ValueError"""
+        problems = []
+        for validate in self.validators:
+            problems.extend(validate(drugs, special_drugs))
+        if problems:
+            raise ValueError(f"formulary ไม่ผ่านการตรวจสอบ ({len(problems)} ข้อ): " + "; ".join(problems[:10]))
+        snapshot = FormularySnapshot(drugs, special_drugs, source)
+        for lint in self.linters:
+            snapshot.warnings.extend(lint(snapshot.drugs, snapshot.special_drugs))
+        for warm in self.warmers:
+            warm(snapshot)
+        return snapshot
+
+    def publish(self, snapshot):
+        previous = self.current
+        self.current = snapshot  # สลับ reference ครั้งเดียว: request ใหม่เห็น version ใหม่ทันที
+        if previous is not None:
+            self.reloads += 1
+            logging.info(f"🔄 formulary {previous.version} → {snapshot.version} ({snapshot.source})")
+        for warning in snapshot.warnings:
+            logging.info(f"⚠️ formulary {snapshot.version}: {warning}")
+        return snapshot
+
+    def load(self, drugs, special_drugs, source="builtin"):
+        return self.publish(self.build(drugs, special_drugs, source))
+
+    def load_file(self, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: ต้องเป็น object ที่มี DRUG_DATABASE และ SPECIAL_DRUGS")
+        return self.load(data.get("DRUG_DATABASE"), data.get("SPECIAL_DRUGS"), source=path)
+
+    def reload(self, path):
+        """โหลดไฟล์ใหม่แบบปลอดภัย: ถ้าผิดพลาดจะคง version เดิมไว้ คืน (ok, version หรือข้อความ error)"""
+        with self._reload_lock:
+            try:
+                snapshot = self.load_file(path)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logging.info(f"❌ reload formulary ไม่สำเร็จ คงใช้ {self.current.version}: {self.last_error}")
+                return False, self.last_error
+            self.last_error = None
+            return True, snapshot.version
+
+    # ---------- file watcher / SIGHUP ----------
+
+    def watch(self, path, interval_sec=5.0):
+        if self._watch_thread is not None:
+            return
+        self._watch_thread = threading.Thread(
+            target=self._watch, args=(path, interval_sec), name="formulary-watcher", daemon=True
+        )
+        self._watch_thread.start()
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._wake.set())
+
+    def _watch(self, path, interval_sec):
+        def stamp():
+            try:
+                st = os.stat(path)
+                return st.st_mtime_ns, st.st_size
+            except OSError:
+                return None
+
+        seen = stamp()
+        while not self._stop.is_set():
+            forced = self._wake.wait(interval_sec)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            current = stamp()
+            if current is None:
+                continue
+            if forced or current != seen:
+                seen = current
+                self.reload(path)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+class _Pinned:
+    __slots__ = ("pins", "snapshot", "previous")
+
+    def __init__(self, pins, snapshot):
+        self.pins = pins
+        self.snapshot = snapshot
+
+    def __enter__(self):
+        self.previous = self.pins.snapshot
+        if self.previous is None:  # pin ซ้อนกันใช้ snapshot ของชั้นนอก
+            self.pins.snapshot = self.snapshot
+        return self.pins.snapshot
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pins.snapshot = self.previous
+        return False
+
+
+def memory_report(*tables):
+    """วัดหน่วยความจำที่ตารางยาใช้ (byte) ก่อนและหลัง compact ด้วย tracemalloc"""
+    def traced(build):
+        tracemalloc.start()
+        try:
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            result = build()
+            gc.collect()
+            return tracemalloc.get_traced_memory()[0] - before, result
+        finally:
+            tracemalloc.stop()
+
+    # สร้างสำเนาแบบ dict/list ธรรมดาเหมือนตอนโหลดจาก source แล้วค่อย compact สำเนานั้น
+    # (รับ FormularyView ได้ด้วย: Mapping ทุกชนิดถูกคัดลอกเป็น dict)
+    thaw = lambda v: (
+        {k: thaw(x) for k, x in v.items()} if isinstance(v, Mapping)
+        else [thaw(x) for x in v] if isinstance(v, list)
+        else v
+    )
+    before, plain = traced(lambda: tuple(thaw(t) for t in tables))
+    after, _ = traced(lambda: compact_formulary(*plain))
+    return {"before_bytes": before, "after_bytes": after, "saved_bytes": before - after}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["report"]:
+        import app
+
+        snapshot = app.formulary_store.current
+        report = memory_report(snapshot.drugs, snapshot.special_drugs)
+        for name, value in report.items():
+            sys.stdout.write(f"{name:>13}: {value:>8,}\n")
+    elif sys.argv[1:2] == ["export"] and len(sys.argv) == 3:
+        import app
+
+        snapshot = app.formulary_store.current
+        with open(sys.argv[2], "w", encoding="utf-8") as f:
+            json.dump({"DRUG_DATABASE": snapshot.drugs, "SPECIAL_DRUGS": snapshot.special_drugs},
+                      f, ensure_ascii=False, indent=2)
+        sys.stdout.write(f"{sys.argv[2]}: formulary {snapshot.version}\n")
+    else:
+        sys.stdout.write("usage: python formulary.py report | export FILE\n")
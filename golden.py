@@ -0,0 +1,294 @@
+"""
+Golden-output regression corpus ของ calculate_dose / calculate_special_drug / calculate_warfarin
+
+- build: รันทุกยา × ทุกข้อบ่งใช้ (ทุก sub-entry / ช่วงยาอยู่ในข้อความผลลัพธ์ของข้อบ่งใช้นั้น) บน grid น้ำหนัก × อายุ
+  และ warfarin บน grid INR × TWD (พร้อม bleeding / อาหารเสริม) แล้วเก็บเป็น snapshot
+- snapshot แบบ content-addressed: ผลลัพธ์แต่ละข้อความเก็บครั้งเดียวโดยอ้างด้วย sha256 ของเนื้อหา
+  (grid ที่หนาแน่นให้ผลซ้ำกันมาก) แต่ละ case ชี้ไปที่ object → JSON บีบอัดด้วย lzma
+  id ของ snapshot = sha256 ของ (case, object hash) ทั้งหมด จึงบอกได้ทันทีว่าผลลัพธ์สองชุดเหมือนกันหรือไม่
+- check: แบ่ง case เป็นก้อนตามยา/ข้อบ่งใช้ รันบน process pool ทุก core แล้วเทียบ hash กับ snapshot
+  แสดง diff ของ case ที่เปลี่ยน (ใช้เป็นด่านก่อน merge งาน optimize ทุกครั้ง)
+    python golden.py build             # เขียน golden/snapshot.json.xz
+    python golden.py check             # เทียบ build ปัจจุบันกับ snapshot (exit 1 ถ้าต่าง)
+- วันที่นัดตรวจ INR ในผลของ warfarin ขึ้นกับวันที่รัน จึงถูกแทนด้วย <วันนี้+N> ก่อนเก็บ/เทียบ
+  และตัดบรรทัดชวนตั้งเตือน (มีเฉพาะเมื่อกำหนด INR_REMINDER_DB) ออก ผลจึงไม่ขึ้นกับการตั้งค่าของเครื่องที่รัน
+- check_sample: เทียบเฉพาะ case แรกของทุกกลุ่ม (ใช้ตอน warm-up ก่อนรับ traffic)
+    INR_REMINDER_DB=/tmp/r.db python golden.py sample   # ตรวจแบบเดียวกับ warm-up ด้วยการตั้งค่าจาก env
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import lzma
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "snapshot.json.xz")
+GOLDEN_USER = "Ugolden"
+FORMAT = 1
+
+GRID = {
+    "weights": [w / 2 for w in range(1, 201)],  # 0.5–100 kg ทุก 0.5 kg
+    # calculate_dose ใช้อายุเฉพาะ MIN_AGE_LIMITS จึงใช้จุดรอบขอบเขตอายุ
+    "dose_ages": [0.05, 0.08, 0.1, 0.4, 0.5, 1, 2, 5, 12],
+    "special_ages": [0.05, 0.1, 0.2, 0.25, 0.3, 0.5, 0.75, 1, 1.5, 1.9, 2, 3, 4, 5, 5.5, 6, 8, 11, 11.5, 12, 14, 16, 18],
+    "inrs": [i / 10 for i in range(5, 121)],  # 0.5–12.0
+    "twds": [t / 2 for t in range(10, 141)],  # 5–70 mg/สัปดาห์
+    "supplements": ["กระเทียม", "ขมิ้น, น้ำมันปลา", "ยาลูกกลอน"],
+}
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _app(app=None):
+    """module app ที่ใช้คำนวณ: warm-up ใน app.py ส่งตัวเองมา (รันเป็น __main__ แล้ว import app จะโหลดซ้ำอีกชุด)"""
+    if app is None:
+        import app
+    return app
+
+
+def groups(grid, app=None):
+    """case ทั้งหมดแบ่งเป็นกลุ่ม (kind, drug, indication) ตามลำดับที่แน่นอน"""
+    app = _app(app)
+    for drug, info in app.DRUG_DATABASE.items():
+        for indication in info["indications"]:
+            yield ("dose", drug, indication)
+    for drug, info in app.SPECIAL_DRUGS.items():
+        for indication in info["indications"]:
+            yield ("special", drug, indication)
+    for inr in grid["inrs"]:
+        yield ("warfarin", f"{inr:g}", "")
+
+
+def cases(group, grid):
+    kind, drug, indication = group
+    if kind == "warfarin":
+        for twd in grid["twds"]:
+            yield (twd, "no", None)
+        yield (35.0, "yes", None)
+        for supplement in grid["supplements"]:
+            yield (35.0, "no", supplement)
+        return
+    ages = grid["dose_ages"] if kind == "dose" else grid["special_ages"]
+    for age in ages:
+        for weight in grid["weights"]:
+            yield (weight, age)
+
+
+def normalize_followup(text, days, due_date, reminder_hint=""):
+    """แทนวันที่นัดตรวจ INR (ขึ้นกับวันที่รัน) ด้วย <วันนี้+N> และตัดบรรทัดชวนตั้งเตือนออก เพื่อให้ snapshot เทียบได้ทุกวัน"""
+    if reminder_hint:
+        text = text.replace("\n" + reminder_hint, "")
+    return text.replace(f"วันที่ควรตรวจ: {due_date}", f"วันที่ควรตรวจ: <วันนี้+{days}>")
+
+
+def run_group(group, grid, app=None):
+    """คืน list ของข้อความผลลัพธ์ตามลำดับ cases(group)"""
+    app = _app(app)
+    kind, drug, indication = group
+    outputs = []
+    if kind == "dose":
+        for weight, age in cases(group, grid):
+            outputs.append(app.calculate_dose(drug, indication, weight, age))
+    elif kind == "special":
+        app.user_drug_selection[GOLDEN_USER] = {"drug": drug, "indication": indication}
+        for weight, age in cases(group, grid):
+            outputs.append(app.calculate_special_drug(GOLDEN_USER, drug, weight, age))
+    else:
+        inr = float(drug)
+        days = app.get_inr_followup(inr)
+        due_date = app.inr_followup_date(inr).strftime("%-d %B %Y")
+        reminder_hint = app.message_catalog.table(app.DEFAULT_LOCALE)["inr_reminder_hint"]()
+        for twd, bleeding, supplement in cases(group, grid):
+            text = app.calculate_warfarin(inr, twd, bleeding, supplement)
+            outputs.append(normalize_followup(text, days, due_date, reminder_hint))
+    return outputs
+
+
+def _check_group(group, grid, expected):
+    """worker: คำนวณกลุ่มนี้ใหม่แล้วคืน case ที่ hash ไม่ตรง [(index, hash เดิม, ข้อความใหม่)]"""
+    changed = []
+    for i, text in enumerate(run_group(group, grid)):
+        old = expected[i] if i < len(expected) else None
+        if old != _digest(text):
+            changed.append((i, old, text))
+    return group, changed
+
+
+def _pool(workers):
+    # fork: worker ได้ app ที่ import แล้วไปเลย ไม่ต้องโหลด formulary ใหม่ทุก process
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork") if "fork" in methods else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def snapshot_id(entries):
+    h = hashlib.sha256()
+    for group, hashes in entries:
+        h.update(json.dumps(group, ensure_ascii=False).encode("utf-8"))
+        for digest in hashes:
+            h.update(bytes.fromhex(digest))
+    return h.hexdigest()
+
+
+def build(path=DEFAULT_SNAPSHOT, grid=GRID, workers=None):
+    import app
+
+    all_groups = list(groups(grid))
+    objects = {}
+    entries = []
+    with _pool(workers) as pool:
+        results = pool.map(run_group, all_groups, [grid] * len(all_groups), chunksize=4)
+        for group, outputs in zip(all_groups, results):
+            hashes = []
+            for text in outputs:
+                digest = _digest(text)
+                objects.setdefault(digest, text)
+                hashes.append(digest)
+            entries.append((group, hashes))
+
+    # object เก็บเฉพาะข้อความเรียงตาม hash (hash คำนวณใหม่ได้ตอนโหลด) และ case อ้างด้วยลำดับใน list
+    # ซึ่งบีบอัดได้ดีกว่าเก็บ hash เต็มทุก case
+    order = sorted(objects)
+    position = {digest: i for i, digest in enumerate(order)}
+    payload = {
+        "format": FORMAT,
+        "id": snapshot_id(entries),
+        "formulary": app.formulary_store.version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "grid": grid,
+        "objects": [objects[digest] for digest in order],
+        "groups": [[list(group), [position[d] for d in hashes]] for group, hashes in entries],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with lzma.open(tmp, "wt", encoding="utf-8", preset=9) as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return payload["id"], sum(len(h) for _, h in entries), len(objects)
+
+
+def load(path=DEFAULT_SNAPSHOT):
+    with lzma.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    if payload.get("format") != FORMAT:
+        raise ValueError(f"{path}: snapshot format {payload.get('format')} (ต้องเป็น {FORMAT})")
+    order = [_digest(text) for text in payload["objects"]]
+    payload["texts"] = dict(zip(order, payload["objects"]))
+    payload["expected"] = {
+        tuple(group): [order[i] for i in indexes] for group, indexes in payload["groups"]
+    }
+    return payload
+
+
+def check(path=DEFAULT_SNAPSHOT, workers=None):
+    """คืน (ผลรวม, รายการ case ที่เปลี่ยน, กลุ่มที่เพิ่ม, กลุ่มที่หายไป)"""
+    snapshot = load(path)
+    grid = snapshot["grid"]
+    expected = snapshot["expected"]
+    current = list(groups(grid))
+    added = [g for g in current if g not in expected]
+    removed = [g for g in expected if g not in set(current)]
+
+    changed = []
+    total = 0
+    with _pool(workers) as pool:
+        futures = [pool.submit(_check_group, g, grid, expected[g]) for g in current if g in expected]
+        for future in futures:
+            group, group_changed = future.result()
+            total += len(expected[group])
+            if group_changed:
+                group_cases = list(cases(group, grid))
+                for index, old, text in group_changed:
+                    changed.append((group, group_cases[index], snapshot["texts"].get(old), text))
+    return total, changed, added, removed
+
+
+def check_sample(snapshot, app=None):
+    """เทียบ case แรกของทุกกลุ่มใน process นี้ (ไม่ใช้ pool) คืน [(group, case, เดิม, ใหม่)] ที่ไม่ตรง"""
+    grid = dict(snapshot["grid"])
+    grid["weights"] = grid["weights"][:1]
+    grid["dose_ages"] = grid["dose_ages"][:1]
+    grid["special_ages"] = grid["special_ages"][:1]
+    grid["twds"] = grid["twds"][:1]
+    grid["supplements"] = []
+    current = set(groups(grid, app))
+    changed = []
+    for group, expected in snapshot["expected"].items():
+        if group not in current:
+            changed.append((group, None, snapshot["texts"].get(expected[0]), None))
+            continue
+        text = run_group(group, grid, app)[0]
+        if _digest(text) != expected[0]:
+            changed.append((group, next(cases(group, grid)), snapshot["texts"].get(expected[0]), text))
+    return changed
+
+
+def _label(group, case):
+    kind, drug, indication = group
+    if kind == "warfarin":
+        twd, bleeding, supplement = case
+        return f"warfarin INR {drug} TWD {twd:g} bleeding={bleeding} supplement={supplement}"
+    weight, age = case
+    return f"{kind} {drug} / {indication} น้ำหนัก {weight:g} kg อายุ {age:g} ปี"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="golden-output regression corpus ของ calculator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("build", "check"):
+        p = sub.add_parser(name)
+        p.add_argument("--snapshot", default=DEFAULT_SNAPSHOT)
+        p.add_argument("--workers", type=int, default=None, help="จำนวน process (ค่าเริ่มต้น: ทุก core)")
+        if name == "check":
+            p.add_argument("--show", type=int, default=5, help="จำนวน diff ที่แสดง")
+    sample = sub.add_parser("sample")
+    sample.add_argument("--snapshot", default=DEFAULT_SNAPSHOT)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "sample":
+        snapshot = load(args.snapshot)
+        changed = check_sample(snapshot)
+        for group, case, old, new in changed:
+            sys.stdout.write(f"--- {' / '.join(filter(None, group))}: {_label(group, case) if case else 'หายไป'}\n")
+        sys.stdout.write(
+            f"{len(snapshot['expected']):,} กลุ่ม, ไม่ตรง {len(changed):,} ({time.perf_counter() - started:.1f}s)\n"
+        )
+        return 1 if changed else 0
+
+    if args.command == "build":
+        snapshot, case_count, object_count = build(args.snapshot, workers=args.workers)
+        size = os.path.getsize(args.snapshot)
+        sys.stdout.write(
+            f"{args.snapshot}: {case_count:,} case, {object_count:,} object, {size:,} bytes, "
+            f"id {snapshot[:12]} ({time.perf_counter() - started:.1f}s)\n"
+        )
+        return 0
+
+    total, changed, added, removed = check(args.snapshot, workers=args.workers)
+    for group, case, old, new in changed[:args.show]:
+        sys.stdout.write(f"--- {_label(group, case)}\n")
+        sys.stdout.writelines(
+            line + "\n" for line in difflib.unified_diff(
+                (old or "").splitlines(), new.splitlines(), "golden", "current", lineterm="", n=1
+            )
+        )
+    for group in added:
+        sys.stdout.write(f"+ กลุ่มใหม่ (ไม่มีใน snapshot): {' / '.join(filter(None, group))}\n")
+    for group in removed:
+        sys.stdout.write(f"- กลุ่มที่หายไป: {' / '.join(filter(None, group))}\n")
+    sys.stdout.write(
+        f"{total:,} case, เปลี่ยน {len(changed):,}, กลุ่มใหม่ {len(added)}, หายไป {len(removed)} "
+        f"({time.perf_counter() - started:.1f}s)\n"
+    )
+    return 1 if changed or added or removed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
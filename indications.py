@@ -0,0 +1,58 @@
+"""
+ดัชนีกลับจากข้อบ่งใช้ → ยา สำหรับเทียบยาหลายตัวที่ใช้กับโรคเดียวกัน (เช่น คออักเสบ: Amoxicillin, Cephalexin, Cefdinir ...)
+
+- ข้อบ่งใช้ที่สะกดต่างกันในแต่ละยา ("Otitis Media", "Otitis media", "Acute Otitis Media (AOM)") รวมเป็นกลุ่มเดียว
+  ตามตารางคำพ้อง (อังกฤษ/ไทย) ข้อบ่งใช้ที่ไม่อยู่ในตารางเป็นกลุ่มของตัวเอง
+- สร้างครั้งเดียวต่อ formulary version (snapshot.cache) กลุ่มหนึ่งเก็บ (ยา, kind, ชื่อข้อบ่งใช้ในยานั้น, entries)
+- ค้นหากลุ่มจากข้อความที่ผู้ใช้พิมพ์ด้วย DrugSearch ตัวเดียวกับการค้นชื่อยา (ทนการพิมพ์ผิด)
+"""
+from collections import namedtuple
+
+from drugsearch import DrugSearch, normalize
+
+Candidate = namedtuple("Candidate", "drug kind indication entries")
+
+
+class IndicationIndex:
+    def __init__(self, tables, synonyms):
+        """tables: [(kind, {ยา: info})], synonyms: {ชื่อกลุ่ม: [ชื่อข้อบ่งใช้/คำพ้อง, ...]}"""
+        concept_of = {}
+        for concept, words in synonyms.items():
+            for word in (concept, *words):
+                concept_of.setdefault(normalize(word), concept)
+
+        self.groups = {}
+        names = {}
+        for kind, table in tables:
+            for drug, info in table.items():
+                for indication, entries in info["indications"].items():
+                    concept = concept_of.get(normalize(indication), indication)
+                    self.groups.setdefault(concept, []).append(Candidate(drug, kind, indication, entries))
+                    names.setdefault(concept, set()).add(indication)
+        for concept in self.groups:
+            names[concept].update(synonyms.get(concept, ()))
+        self._exact = {}
+        for concept, words in names.items():
+            for word in (concept, *words):
+                self._exact.setdefault(normalize(word), concept)
+        self._search = DrugSearch({concept: sorted(words) for concept, words in names.items()})
+
+    def __len__(self):
+        return len(self.groups)
+
+    def shared(self):
+        """กลุ่มที่มีมากกว่า 1 ยา (ใช้เทียบได้จริง)"""
+        return {
+            concept: candidates for concept, candidates in self.groups.items()
+            if len({c.drug for c in candidates}) > 1
+        }
+
+    def lookup(self, query, limit=4):
+        """คืน [(ชื่อกลุ่ม, distance)] ตรงทั้งคำมาก่อน แล้วตามด้วยกลุ่มที่ใกล้ที่สุด"""
+        concept = self._exact.get(normalize(query))
+        if concept is not None:
+            return [(concept, 0)]
+        return self._search.search(query, limit)
+
+    def candidates(self, concept):
+        return self.groups.get(concept, [])
@@ -0,0 +1,618 @@
+"""
+ข้อความตอบกลับของ calculator แยกตาม message id และภาษา (th / en)
+
+- template เขียนแบบ str.format ("{mg:.0f} mg/day") และถูก compile ครั้งเดียวตอน import เป็นฟังก์ชันที่คืน f-string
+  ตอนตอบจึงเป็นการแทนค่า slot ล้วน ๆ ไม่ต้อง parse template ซ้ำ (เร็วเท่า f-string ที่เขียนในโค้ด)
+- catalog.table(locale) คืน dict ของ message id → ฟังก์ชัน ของภาษานั้น (id ที่ยังไม่แปลใช้ภาษาเริ่มต้น)
+  calculator ดึง table ครั้งเดียวต่อการคำนวณ เพิ่มภาษาใหม่จึงไม่ทำให้ hot path ช้าลง
+- ทุกภาษาต้องใช้ slot ชุดเดียวกับภาษาเริ่มต้น (ตรวจตอนสร้าง catalog ถ้าไม่ตรง → ValueError)
+    python messages.py check         # แสดง message id ที่ยังไม่มีคำแปล
+    python messages.py render en     # รัน calculator ทุกยาใน locale นี้ แล้วหาอักษรไทยที่ไม่ได้มาจากข้อมูล formulary
+    python messages.py bench         # เวลาต่อข้อความเทียบกับ f-string ตรง ๆ
+"""
+import argparse
+import re
+import string
+import sys
+import time
+
+DEFAULT_LOCALE = "th"
+THAI = re.compile("[\u0e00-\u0e7f]")
+QUOTED = re.compile("'[^']*'")  # คำสั่งที่ผู้ใช้ต้องพิมพ์เป็นภาษาไทย เช่น 'เตือนตรวจ INR'
+
+MESSAGES = {
+    # ---------- การคำนวณขนาดยา (calculate_dose) ----------
+    "dose_header": {
+        "th": "{drug} - {indication} (น้ำหนัก {weight} kg):",
+        "en": "{drug} - {indication} (weight {weight} kg):",
+    },
+    "dose_label": {
+        "th": "ขนาดยา:",
+        "en": "Dose:",
+    },
+    "perkg_range_line": {
+        "th": "{prefix} {min_dose} – {max_dose} mg/kg/day → {min_mg:.0f} – {max_mg:.0f} mg/day ≈ "
+              "{min_ml:.1f} – {max_ml:.1f} ml/day, แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
+              "(ครั้งละ ~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml)",
+        "en": "{prefix} {min_dose} – {max_dose} mg/kg/day → {min_mg:.0f} – {max_mg:.0f} mg/day ≈ "
+              "{min_ml:.1f} – {max_ml:.1f} ml/day, divided {min_freq} – {max_freq} times/day × {days} days "
+              "(~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml per dose)",
+    },
+    "perkg_once_line": {
+        "th": "{prefix} {dose_per_kg} mg/kg/day → {mg:.0f} mg/day ≈ {ml:.1f} ml/day, "
+              "ครั้งละ ~{dose_ml:.1f} ml × {freq} ครั้ง/วัน × {days} วัน",
+        "en": "{prefix} {dose_per_kg} mg/kg/day → {mg:.0f} mg/day ≈ {ml:.1f} ml/day, "
+              "~{dose_ml:.1f} ml per dose × {freq} times/day × {days} days",
+    },
+    "perkg_split_line": {
+        "th": "{prefix} {dose_per_kg} mg/kg/day → {mg:.0f} mg/day ≈ {ml:.1f} ml/day, "
+              "แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน (ครั้งละ ~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml)",
+        "en": "{prefix} {dose_per_kg} mg/kg/day → {mg:.0f} mg/day ≈ {ml:.1f} ml/day, "
+              "divided {min_freq} – {max_freq} times/day × {days} days (~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml per dose)",
+    },
+    "range_line": {
+        "th": "{label} {min_mg:.0f} – {max_mg:.0f} mg/day ≈ {min_ml:.1f} – {max_ml:.1f} ml/day, "
+              "แบ่งวันละ {freq} ครั้ง × {days} วัน (ครั้งละ ~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml)",
+        "en": "{label} {min_mg:.0f} – {max_mg:.0f} mg/day ≈ {min_ml:.1f} – {max_ml:.1f} ml/day, "
+              "divided {freq} times/day × {days} days (~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml per dose)",
+    },
+    "range_line_freqs": {
+        "th": "{label} {min_mg:.0f} – {max_mg:.0f} mg/day ≈ {min_ml:.1f} – {max_ml:.1f} ml/day, "
+              "แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน (ครั้งละ ~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml)",
+        "en": "{label} {min_mg:.0f} – {max_mg:.0f} mg/day ≈ {min_ml:.1f} – {max_ml:.1f} ml/day, "
+              "divided {min_freq} – {max_freq} times/day × {days} days (~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml per dose)",
+    },
+    "fixed_line": {
+        "th": "{label} {mg:.0f} mg/day ≈ {ml:.1f} ml/day, แบ่งวันละ {freq} ครั้ง × {days} วัน (ครั้งละ ~{dose_ml:.1f} ml)",
+        "en": "{label} {mg:.0f} mg/day ≈ {ml:.1f} ml/day, divided {freq} times/day × {days} days (~{dose_ml:.1f} ml per dose)",
+    },
+    "fixed_line_freqs": {
+        "th": "{label} {mg:.0f} mg/day ≈ {ml:.1f} ml/day, แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
+              "(ครั้งละ ~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml)",
+        "en": "{label} {mg:.0f} mg/day ≈ {ml:.1f} ml/day, divided {min_freq} – {max_freq} times/day × {days} days "
+              "(~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml per dose)",
+    },
+    "note_line": {
+        "th": "📝 หมายเหตุ: {note}",
+        "en": "📝 Note: {note}",
+    },
+    "bottle_line": {
+        "th": "→ รวม {ml:.1f} ml ≈ {count} ขวด (ขวดละ {size} ml)",
+        "en": "→ total {ml:.1f} ml ≈ {count} bottle(s) ({size} ml each)",
+    },
+    "bottle_mix_line": {
+        "th": "→ รวม {ml:.1f} ml ≈ {count} ขวด ({detail})",
+        "en": "→ total {ml:.1f} ml ≈ {count} bottle(s) ({detail})",
+    },
+    "weight_out_of_range": {
+        "th": "❌ น้ำหนักต้องมากกว่า 0 และไม่เกิน {max_weight:g} kg",
+        "en": "❌ Weight must be greater than 0 and at most {max_weight:g} kg",
+    },
+    "drug_not_found": {
+        "th": "❌ ไม่พบข้อมูลยา {drug}",
+        "en": "❌ No data for {drug}",
+    },
+    "indication_not_found": {
+        "th": "❌ ไม่พบ indication {indication} ใน {drug}",
+        "en": "❌ Indication {indication} not found for {drug}",
+    },
+    "indication_unsupported": {
+        "th": "❌ ยังไม่รองรับการคำนวณ {indication} ของ {drug}",
+        "en": "❌ Dose calculation for {indication} of {drug} is not supported yet",
+    },
+
+    # ---------- คำเตือน / ข้อจำกัดอายุ ----------
+    "age_years": {
+        "th": "{years} ปี",
+        "en": "{years} yr",
+    },
+    "age_months": {
+        "th": "{months} เดือน",
+        "en": "{months} mo",
+    },
+    "age_gate": {
+        "th": "❌ ไม่แนะนำให้ใช้ {drug} ในเด็กอายุน้อยกว่า {min_age}",
+        "en": "❌ {drug} is not recommended for children younger than {min_age}",
+    },
+    "age_gate_indication": {
+        "th": "❌ ไม่แนะนำให้ใช้ในเด็กอายุน้อยกว่า {min_age}",
+        "en": "❌ Not recommended for children younger than {min_age}",
+    },
+    "age_gate_weight_based": {
+        "th": "❌ ไม่แนะนำการใช้ {drug} ตามน้ำหนักในเด็กอายุน้อยกว่า {min_age}",
+        "en": "❌ Weight-based {drug} is not recommended for children younger than {min_age}",
+    },
+    "max_daily_warning": {
+        "th": "⚠️ ไม่เกิน {max_mg} mg/วัน",
+        "en": "⚠️ Do not exceed {max_mg} mg/day",
+    },
+
+    # ---------- ยาที่คำนวณแยกตามตัวยา (calculate_special_drug) ----------
+    "special_title": {
+        "th": "🧪 {drug} - {indication}",
+        "en": "🧪 {drug} - {indication}",
+    },
+    "special_title_weight": {
+        "th": "🧪 {drug} - {indication} (น้ำหนัก {weight:.1f} kg):",
+        "en": "🧪 {drug} - {indication} (weight {weight:.1f} kg):",
+    },
+    "special_header_age": {
+        "th": "{drug} - {indication} (อายุ {age:.1f} ปี):",
+        "en": "{drug} - {indication} (age {age:.1f} yr):",
+    },
+    "special_header_weight_age": {
+        "th": "{drug} - {indication} (น้ำหนัก {weight} kg, อายุ {age} ปี):",
+        "en": "{drug} - {indication} (weight {weight} kg, age {age} yr):",
+    },
+    "special_patient": {
+        "th": "(น้ำหนัก {weight:.1f} kg, อายุ {age:.1f} ปี):",
+        "en": "(weight {weight:.1f} kg, age {age:.1f} yr):",
+    },
+    "special_patient_raw": {
+        "th": "(น้ำหนัก {weight} kg, อายุ {age} ปี):",
+        "en": "(weight {weight} kg, age {age} yr):",
+    },
+    "special_dose_times": {
+        "th": "ขนาดยา: {mg:.1f} mg × วันละ {freq} ครั้ง ≈ ~{ml:.1f} ml/ครั้ง",
+        "en": "Dose: {mg:.1f} mg × {freq} times/day ≈ ~{ml:.1f} ml per dose",
+    },
+    "special_dose_times_raw": {
+        "th": "ขนาดยา: {mg} mg × วันละ {freq} ครั้ง ≈ ~{ml:.1f} ml/ครั้ง",
+        "en": "Dose: {mg} mg × {freq} times/day ≈ ~{ml:.1f} ml per dose",
+    },
+    "special_daily_total": {
+        "th": "💊 ขนาดรวมทั้งวัน: {dose_per_kg:.1f} mg/kg/day × {weight:.1f} kg = {mg:.1f} mg/day",
+        "en": "💊 Total daily dose: {dose_per_kg:.1f} mg/kg/day × {weight:.1f} kg = {mg:.1f} mg/day",
+    },
+    "special_daily_dose": {
+        "th": "ขนาดยา: {mg:.1f} mg/day",
+        "en": "Dose: {mg:.1f} mg/day",
+    },
+    "special_split_line": {
+        "th": "→ วันละ {freq} ครั้ง → ครั้งละ ~{mg:.1f} mg",
+        "en": "→ {freq} times/day → ~{mg:.1f} mg per dose",
+    },
+    "special_split_ml": {
+        "th": " ≈ ~{ml:.1f} ml/ครั้ง",
+        "en": " ≈ ~{ml:.1f} ml per dose",
+    },
+    "times_per_day": {
+        "th": "วันละ {freq} ครั้ง",
+        "en": "{freq} times/day",
+    },
+    "frequency_or": {
+        "th": " หรือ ",
+        "en": " or ",
+    },
+    "perkg_dose_line": {
+        "th": "ขนาดยา: {dose_per_kg} mg/kg/dose → {mg:.1f} mg/dose × {freq_text} (max {max_mg} mg/day) ≈ ~{ml:.1f} ml/dose",
+        "en": "Dose: {dose_per_kg} mg/kg/dose → {mg:.1f} mg/dose × {freq_text} (max {max_mg} mg/day) ≈ ~{ml:.1f} ml/dose",
+    },
+    "fixed_dose_max_line": {
+        "th": "ขนาดยา: {mg} mg × {freq} ครั้ง/วัน (max {max_mg} mg/day) ≈ ~{ml:.1f} ml/ครั้ง",
+        "en": "Dose: {mg} mg × {freq} times/day (max {max_mg} mg/day) ≈ ~{ml:.1f} ml per dose",
+    },
+    "special_note": {
+        "th": "📌 หมายเหตุ: {note}",
+        "en": "📌 Note: {note}",
+    },
+    "special_extra_note": {
+        "th": "📌 หมายเหตุเพิ่มเติม: {note}",
+        "en": "📌 Additional note: {note}",
+    },
+    "unspecified_range": {
+        "th": "ไม่ระบุช่วง",
+        "en": "unspecified range",
+    },
+    "special_indication_not_found": {
+        "th": "❌ ไม่พบข้อมูลข้อบ่งใช้ {indication}",
+        "en": "❌ No data for indication {indication}",
+    },
+    "special_indication_unsupported": {
+        "th": "❌ ยังไม่รองรับข้อบ่งใช้ {indication} ของ {drug}",
+        "en": "❌ Indication {indication} of {drug} is not supported yet",
+    },
+    "age_range_not_found": {
+        "th": "❌ ไม่พบช่วงอายุที่รองรับ",
+        "en": "❌ No supported age range",
+    },
+    "age_range_missing": {
+        "th": "❌ ยังไม่มีข้อมูลช่วงอายุนี้ใน indication {indication}",
+        "en": "❌ No data for this age range in indication {indication}",
+    },
+    "age_range_unsuitable": {
+        "th": "❌ ไม่พบช่วงอายุที่เหมาะสม (อายุ {age} ปี)",
+        "en": "❌ No suitable age range (age {age} yr)",
+    },
+    "age_no_data": {
+        "th": "❌ ไม่พบข้อมูลสำหรับอายุ {age} ปี",
+        "en": "❌ No data for age {age} yr",
+    },
+    "age_not_matched": {
+        "th": "❌ ไม่พบข้อมูลที่ตรงกับช่วงอายุนี้",
+        "en": "❌ No data matches this age range",
+    },
+    "age_weight_not_matched": {
+        "th": "❌ ไม่พบข้อมูลที่ตรงกับช่วงอายุและน้ำหนักนี้",
+        "en": "❌ No data matches this age and weight range",
+    },
+    "dose_data_not_found": {
+        "th": "❌ ไม่พบข้อมูลขนาดยา",
+        "en": "❌ No dosing data",
+    },
+    "age_dose_not_found": {
+        "th": "❌ ไม่พบขนาดยาที่เหมาะสมสำหรับอายุ {age} ปีใน {drug}",
+        "en": "❌ No suitable dose of {drug} for age {age} yr",
+    },
+    "carbocysteine_age_title": {
+        "th": "🧪 {drug} - การใช้แบบอิงอายุ",
+        "en": "🧪 {drug} - age-based dosing",
+    },
+    "carbocysteine_weight_title": {
+        "th": "🧪 {drug} - การใช้แบบอิงน้ำหนัก",
+        "en": "🧪 {drug} - weight-based dosing",
+    },
+    "carbocysteine_max_note": {
+        "th": "📌 หมายเหตุ: ขนาดยาไม่ควรเกิน 2,250 mg/วัน",
+        "en": "📌 Note: do not exceed 2,250 mg/day",
+    },
+    "hydroxyzine_under_6": {
+        "th": "🔹 อายุน้อยกว่า 6 ปี",
+        "en": "🔹 Younger than 6 years",
+    },
+    "hydroxyzine_6_and_over": {
+        "th": "🔹 อายุตั้งแต่ 6 ปีขึ้นไป",
+        "en": "🔹 6 years and older",
+    },
+    "hydroxyzine_anxiety_under_6_note": {
+        "th": "📌 หมายเหตุเพิ่มเติม: แม้ FDA จะอนุมัติให้ใช้ในเด็ก <6 ปี แต่แนวทางผู้เชี่ยวชาญส่วนใหญ่ไม่แนะนำให้ใช้ยาในกลุ่มนี้",
+        "en": "📌 Additional note: although FDA-approved for children <6 years, most expert guidelines do not recommend it in this group",
+    },
+    "hydroxyzine_anxiety_note": {
+        "th": "📌 หมายเหตุเพิ่มเติม: แนวทางผู้เชี่ยวชาญไม่แนะนำให้ใช้ Hydroxyzine ในเด็กเพื่อรักษาภาวะวิตกกังวล",
+        "en": "📌 Additional note: expert guidelines do not recommend Hydroxyzine for anxiety in children",
+    },
+    "hydroxyzine_pruritus_under_6_note": {
+        "th": "📌 หมายเหตุ: อ้างอิงจากการศึกษาทางเภสัชจลนศาสตร์ ยานี้อาจให้วันละครั้ง (ก่อนนอน) หรือวันละ 2 ครั้งก็เพียงพอ เนื่องจากมีครึ่งชีวิตยาว",
+        "en": "📌 Note: based on pharmacokinetic studies, once daily (at bedtime) or twice daily may be enough because of its long half-life",
+    },
+    "hydroxyzine_pruritus_note": {
+        "th": "📌 หมายเหตุ: จากการศึกษาทางเภสัชจลนศาสตร์ อาจให้วันละครั้ง (ก่อนนอน) หรือวันละ 2 ครั้งก็เพียงพอ เนื่องจากมีครึ่งชีวิตยาว",
+        "en": "📌 Note: pharmacokinetic studies suggest once daily (at bedtime) or twice daily may be enough because of its long half-life",
+    },
+    "cetirizine_recommended": {
+        "th": "💊 ขนาดยาแนะนำ:",
+        "en": "💊 Recommended dose:",
+    },
+    "cetirizine_initial": {
+        "th": "• เริ่มต้น: {mg} mg × {freq} ครั้ง/วัน ≈ ~{ml} ml/ครั้ง",
+        "en": "• Initial: {mg} mg × {freq} times/day ≈ ~{ml} ml per dose",
+    },
+    "cetirizine_options": {
+        "th": "• ตัวเลือกอื่น:",
+        "en": "• Other options:",
+    },
+    "cetirizine_option": {
+        "th": "   - {mg} mg × {freq} ครั้ง/วัน ≈ ~{ml} ml/ครั้ง",
+        "en": "   - {mg} mg × {freq} times/day ≈ ~{ml} ml per dose",
+    },
+    "cetirizine_dose": {
+        "th": "💊 ขนาดยา: {mg} mg × {freq} ครั้ง/วัน ≈ ~{ml} ml/ครั้ง",
+        "en": "💊 Dose: {mg} mg × {freq} times/day ≈ ~{ml} ml per dose",
+    },
+    "max_per_dose_note": {
+        "th": "📌 ขนาดยาสูงสุดต่อครั้ง: {max_mg} mg",
+        "en": "📌 Maximum per dose: {max_mg} mg",
+    },
+    "max_per_day_note": {
+        "th": "📌 ขนาดยาสูงสุดต่อวัน: {max_mg} mg",
+        "en": "📌 Maximum per day: {max_mg} mg",
+    },
+    "ferrous_daily": {
+        "th": "💊 {dose_per_kg:.0f} mg/kg/day → {mg:.1f} mg/day",
+        "en": "💊 {dose_per_kg:.0f} mg/kg/day → {mg:.1f} mg/day",
+    },
+    "salbutamol_perkg_line": {
+        "th": "ขนาดยา: {dose_per_kg} mg/kg/dose → {mg:.1f} mg/dose × วันละ {freq} ครั้ง (max {max_mg} mg/dose) ≈ ~{ml:.1f} ml/ครั้ง",
+        "en": "Dose: {dose_per_kg} mg/kg/dose → {mg:.1f} mg/dose × {freq} times/day (max {max_mg} mg/dose) ≈ ~{ml:.1f} ml per dose",
+    },
+    "ibuprofen_daily_line": {
+        "th": "💊 {dose_per_kg} mg/kg/day → ~{mg:.1f} mg/day → แบ่ง {doses} ครั้ง → ครั้งละ ~{dose_mg:.1f} mg (~{dose_ml:.2f} ml)",
+        "en": "💊 {dose_per_kg} mg/kg/day → ~{mg:.1f} mg/day → divided into {doses} doses → ~{dose_mg:.1f} mg per dose (~{dose_ml:.2f} ml)",
+    },
+    "ibuprofen_max_dose": {
+        "th": "🔢 Max ต่อครั้ง: {max_mg} mg",
+        "en": "🔢 Max per dose: {max_mg} mg",
+    },
+    "ibuprofen_max_day": {
+        "th": "🔢 Max ต่อวัน: {max_mg} mg",
+        "en": "🔢 Max per day: {max_mg} mg",
+    },
+    "paracetamol_header": {
+        "th": "{drug} (น้ำหนัก {weight} kg):",
+        "en": "{drug} (weight {weight} kg):",
+    },
+    "paracetamol_dose": {
+        "th": "ขนาดยา: {min_dose}–{max_dose} mg/kg/ครั้ง → {min_mg:.1f}–{max_mg:.1f} mg/ครั้ง\n"
+              "ปริมาณยา: {min_ml:.1f}–{max_ml:.1f} ml/ครั้ง\n"
+              "ความถี่: {frequency}",
+        "en": "Dose: {min_dose}–{max_dose} mg/kg/dose → {min_mg:.1f}–{max_mg:.1f} mg/dose\n"
+              "Volume: {min_ml:.1f}–{max_ml:.1f} ml/dose\n"
+              "Frequency: {frequency}",
+    },
+
+    # ---------- warfarin ----------
+    "warfarin_increase_major": {
+        "th": "\U0001f539 INR < 1.5 → เพิ่มขนาดยา 10–20%\nขนาดยาใหม่: {low:.1f} – {high:.1f} mg/สัปดาห์",
+        "en": "\U0001f539 INR < 1.5 → increase dose by 10–20%\nNew dose: {low:.1f} – {high:.1f} mg/week",
+    },
+    "warfarin_increase_minor": {
+        "th": "\U0001f539 INR 1.5–1.9 → เพิ่มขนาดยา 5–10%\nขนาดยาใหม่: {low:.1f} – {high:.1f} mg/สัปดาห์",
+        "en": "\U0001f539 INR 1.5–1.9 → increase dose by 5–10%\nNew dose: {low:.1f} – {high:.1f} mg/week",
+    },
+    "warfarin_keep": {
+        "th": "✅ INR 2.0–3.0 → คงขนาดยาเดิม",
+        "en": "✅ INR 2.0–3.0 → keep the current dose",
+    },
+    "warfarin_decrease": {
+        "th": "\U0001f539 INR 3.1–3.9 → ลดขนาดยา 5–10%\nขนาดยาใหม่: {low:.1f} – {high:.1f} mg/สัปดาห์",
+        "en": "\U0001f539 INR 3.1–3.9 → decrease dose by 5–10%\nNew dose: {low:.1f} – {high:.1f} mg/week",
+    },
+    "warfarin_hold_decrease": {
+        "th": "⚠\ufe0f INR 4.0–4.9 → หยุดยา 1 วัน และลดขนาดยา 10%\nขนาดยาใหม่: {low:.1f} mg/สัปดาห์",
+        "en": "⚠\ufe0f INR 4.0–4.9 → hold 1 day and decrease dose by 10%\nNew dose: {low:.1f} mg/week",
+    },
+    "warfarin_hold_vitamin_k": {
+        "th": "⚠\ufe0f INR 5.0–8.9 → หยุดยา 1–2 วัน และพิจารณาให้ Vitamin K1 1 mg",
+        "en": "⚠\ufe0f INR 5.0–8.9 → hold 1–2 days and consider Vitamin K1 1 mg",
+    },
+    "warfarin_stop": {
+        "th": "\U0001f6a8 INR ≥ 9.0 → หยุดยา และพิจารณาให้ Vitamin K1 5–10 mg",
+        "en": "\U0001f6a8 INR ≥ 9.0 → stop warfarin and consider Vitamin K1 5–10 mg",
+    },
+    "warfarin_bleeding": {
+        "th": "\U0001f6a8 มี major bleeding → หยุด Warfarin, ให้ Vitamin K1 10 mg IV",
+        "en": "\U0001f6a8 Major bleeding → stop Warfarin, give Vitamin K1 10 mg IV",
+    },
+    "warfarin_herb_warning": {
+        "th": "\u26a0\ufe0f พบว่าสมุนไพร/อาหารเสริมที่อาจมีผลต่อ INR ได้แก่: {herbs}\nโปรดพิจารณาความเสี่ยงต่อการเปลี่ยนแปลง INR อย่างใกล้ชิด",
+        "en": "\u26a0\ufe0f Herbs/supplements that may affect INR: {herbs}\nMonitor closely for INR changes",
+    },
+    "warfarin_supplement_warning": {
+        "th": "\u26a0\ufe0f มีการใช้อาหารเสริมหรือสมุนไพร → พิจารณาความเสี่ยงต่อการเปลี่ยนแปลง INR",
+        "en": "\u26a0\ufe0f Uses supplements or herbs → consider the risk of INR changes",
+    },
+    "inr_followup": {
+        "th": "📅  คำแนะนำ: ควรตรวจ INR ภายใน {days} วัน\n📌 วันที่ควรตรวจ: {date}",
+        "en": "📅  Advice: recheck INR within {days} days\n📌 Recheck date: {date}",
+    },
+    "inr_reminder_hint": {
+        "th": "🔔 พิมพ์ 'เตือนตรวจ INR' เพื่อรับการแจ้งเตือนทาง LINE ในวันนัด",
+        "en": "🔔 Type 'เตือนตรวจ INR' to get a LINE reminder on the recheck date",
+    },
+    "inr_reminder_disabled": {
+        "th": "❌ ระบบแจ้งเตือนนัดตรวจ INR ยังไม่เปิดใช้งาน",
+        "en": "❌ INR recheck reminders are not enabled",
+    },
+    "inr_reminder_cancelled": {
+        "th": "🔕 ยกเลิกการแจ้งเตือนนัดตรวจ INR แล้ว",
+        "en": "🔕 INR recheck reminder cancelled",
+    },
+    "inr_reminder_need_warfarin": {
+        "th": "❗️ กรุณาคำนวณยา warfarin ก่อน แล้วจึงพิมพ์ 'เตือนตรวจ INR'",
+        "en": "❗️ Please calculate a warfarin dose first, then type 'เตือนตรวจ INR'",
+    },
+    "inr_reminder_message": {
+        "th": "🔔 แจ้งเตือน: วันนี้ ({date}) ถึงกำหนดตรวจ INR ตามนัด\n"
+              "กรุณาตรวจ INR และแจ้งผลกับแพทย์/เภสัชกรเพื่อพิจารณาขนาดยา Warfarin",
+        "en": "🔔 Reminder: today ({date}) is your scheduled INR check\n"
+              "Please check your INR and report the result to your doctor/pharmacist so the Warfarin dose can be reviewed",
+    },
+    "inr_reminder_set": {
+        "th": "🔔 ตั้งการแจ้งเตือนตรวจ INR วันที่ {date} เรียบร้อยแล้ว\n(พิมพ์ 'ยกเลิกเตือนตรวจ INR' เพื่อยกเลิก)",
+        "en": "🔔 INR recheck reminder set for {date}\n(type 'ยกเลิกเตือนตรวจ INR' to cancel)",
+    },
+    "warfarin_schedule_header": {
+        "th": "💊 ตัวอย่างการจัดยา (รวม {weekly_mg:.1f} mg/สัปดาห์):",
+        "en": "💊 Example schedule (total {weekly_mg:.1f} mg/week):",
+    },
+    "warfarin_schedule_after_hold": {
+        "th": "(หยุดยา {days} วันก่อน แล้วจึงเริ่มตารางนี้)",
+        "en": "(hold for {days} day(s) first, then start this schedule)",
+    },
+    "warfarin_tablets": {
+        "th": "{strength} mg × {tablets} เม็ด",
+        "en": "{strength} mg × {tablets} tab",
+    },
+    "warfarin_no_dose": {
+        "th": "งดยา",
+        "en": "no dose",
+    },
+    "weekday_labels": {
+        "th": "จ. อ. พ. พฤ. ศ. ส. อา.",
+        "en": "Mon Tue Wed Thu Fri Sat Sun",
+    },
+    "locale_set": {
+        "th": "🌐 แสดงผลการคำนวณเป็นภาษาไทย",
+        "en": "🌐 Calculation results will be shown in English (type 'ภาษาไทย' to switch back)",
+    },
+}
+
+
+def _escape(literal):
+    return (literal.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r")
+            .replace("{", "{{").replace("}", "}}"))
+
+
+def compile_template(template, name="message"):
+    """แปลง template แบบ str.format เป็นฟังก์ชัน keyword-only ที่คืน f-string คืน (ฟังก์ชัน, ชุด slot)"""
+    parts = []
+    slots = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(_escape(literal))
+        if field is None:
+            continue
+        if not field.isidentifier() or "{" in (spec or ""):
+            raise ValueError(f"{name}: slot '{field}' ต้องเป็นชื่อธรรมดาและ format spec ห้ามซ้อน")
+        if field not in slots:
+            slots.append(field)
+        parts.append("{" + field + (f"!{conversion}" if conversion else "") + (f":{_escape(spec)}" if spec else "") + "}")
+    params = f"*, {', '.join(slots)}" if slots else ""
+    source = f"def render({params}):\n    return f'{''.join(parts)}'\n"
+    namespace = {}
+    exec(compile(source, f"<message {name}>", "exec"), namespace)
+    return namespace["render"], frozenset(slots)
+
+
+class MessageCatalog:
+    def __init__(self, messages, default_locale=DEFAULT_LOCALE):
+        self.default_locale = default_locale
+        self.missing = {}
+        compiled = {}
+        slots = {}
+        for message_id, by_locale in messages.items():
+            if default_locale not in by_locale:
+                raise ValueError(f"{message_id}: ไม่มีภาษาเริ่มต้น {default_locale}")
+            for locale, template in by_locale.items():
+                render, names = compile_template(template, f"{message_id}.{locale}")
+                if locale == default_locale:
+                    slots[message_id] = names
+                compiled.setdefault(locale, {})[message_id] = (render, names)
+
+        self._tables = {}
+        base = {message_id: render for message_id, (render, _) in compiled[default_locale].items()}
+        for locale, table in compiled.items():
+            for message_id, (_, names) in table.items():
+                if names != slots[message_id]:
+                    raise ValueError(f"{message_id}.{locale}: slot {sorted(names)} ไม่ตรงกับ {sorted(slots[message_id])}")
+            self.missing[locale] = sorted(set(base) - set(table))
+            self._tables[locale] = {**base, **{message_id: render for message_id, (render, _) in table.items()}}
+
+    @property
+    def locales(self):
+        return tuple(self._tables)
+
+    def table(self, locale=None):
+        """dict ของ message id → ฟังก์ชันสร้างข้อความ (ภาษาที่ไม่รู้จัก → ภาษาเริ่มต้น)"""
+        return self._tables.get(locale) or self._tables[self.default_locale]
+
+    def render(self, message_id, locale=None, **slots):
+        return self.table(locale)[message_id](**slots)
+
+
+catalog = MessageCatalog(MESSAGES)
+
+
+def bench(repeat=200000):
+    slots = dict(prefix="📌 Group A Streptococcus:", min_dose=40, max_dose=50, min_mg=720.0, max_mg=900.0,
+                 min_ml=14.4, max_ml=18.0, min_freq=2, max_freq=3, days=10, min_dose_ml=4.8, max_dose_ml=9.0)
+
+    def fstring(prefix, min_dose, max_dose, min_mg, max_mg, min_ml, max_ml, min_freq, max_freq, days,
+                min_dose_ml, max_dose_ml):
+        return (
+            f"{prefix} {min_dose} – {max_dose} mg/kg/day → {min_mg:.0f} – {max_mg:.0f} mg/day ≈ "
+            f"{min_ml:.1f} – {max_ml:.1f} ml/day, แบ่งวันละ {min_freq} – {max_freq} ครั้ง × {days} วัน "
+            f"(ครั้งละ ~{min_dose_ml:.1f} – {max_dose_ml:.1f} ml)"
+        )
+
+    assert fstring(**slots) == catalog.render("perkg_range_line", "th", **slots)
+    many = MessageCatalog({
+        message_id: {**by_locale, **{f"x{i}": by_locale["en"] for i in range(30)}} if "en" in by_locale else by_locale
+        for message_id, by_locale in MESSAGES.items()
+    })
+
+    def timed(func):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat * 1e9
+
+    results = {
+        "f-string ในโค้ด": timed(lambda: fstring(**slots)),
+        "catalog th (table ต่อการคำนวณ)": (lambda t: timed(lambda: t["perkg_range_line"](**slots)))(catalog.table("th")),
+        "catalog en": (lambda t: timed(lambda: t["perkg_range_line"](**slots)))(catalog.table("en")),
+        "catalog 32 ภาษา": (lambda t: timed(lambda: t["perkg_range_line"](**slots)))(many.table("x7")),
+        "catalog.render (lookup ทุกครั้ง)": timed(lambda: catalog.render("perkg_range_line", "th", **slots)),
+        "str.format ทุกครั้ง": timed(lambda: MESSAGES["perkg_range_line"]["th"].format(**slots)),
+    }
+    for name, ns in results.items():
+        print(f"{name:<34} {ns:7.0f} ns/ข้อความ")
+
+
+def _data_strings(value, found):
+    if isinstance(value, str):
+        found.add(value)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _data_strings(key, found)
+            _data_strings(item, found)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _data_strings(item, found)
+    return found
+
+
+def untranslated(app, locale, weights=(3, 12, 25, 45), ages=(0.3, 1, 3, 7, 13)):
+    """บรรทัดในผลคำนวณของ locale ที่ยังมีอักษรไทย โดยไม่นับข้อความที่มาจากข้อมูล formulary คืน [(ที่มา, บรรทัด)]"""
+    snapshot = app.formulary_store.current
+    data = sorted(_data_strings([snapshot.drugs, snapshot.special_drugs], set()), key=len, reverse=True)
+    outputs = []
+    for message_id, by_locale in MESSAGES.items():
+        outputs.append((f"catalog {message_id}", by_locale.get(locale, "")))
+    for weight in weights:
+        for age in ages:
+            for drug, info in snapshot.drugs.items():
+                for indication in info["indications"]:
+                    outputs.append((f"{drug} / {indication} {weight} kg {age} ปี",
+                                    app.calculate_dose(drug, indication, weight, age, locale)))
+            for drug, info in snapshot.special_drugs.items():
+                for indication in info["indications"]:
+                    outputs.append((f"{drug} / {indication} {weight} kg {age} ปี",
+                                    app.calculate_special_drug("Umessages", drug, weight, age, indication, locale)))
+    for inr in (1.2, 1.7, 2.5, 3.5, 4.5, 6, 10):
+        outputs.append((f"warfarin INR {inr}", app.calculate_warfarin(inr, 35.0, "no", "กระเทียม", locale)))
+    outputs.append(("warfarin bleeding", app.calculate_warfarin(2.5, 35.0, "yes", None, locale)))
+    outputs.append(("เตือนตรวจ INR", app.handle_inr_reminder_command("Umessages", "เตือนตรวจ inr", locale)))
+
+    found = []
+    for source, text in outputs:
+        if not THAI.search(text):
+            continue
+        stripped = text
+        for value in data:  # ข้อมูลบางรายการยาวหลายบรรทัด จึงตัดออกจากข้อความทั้งก้อนก่อนแยกบรรทัด
+            stripped = stripped.replace(value, "")
+        for line in stripped.splitlines():
+            if THAI.search(QUOTED.sub("", line)):
+                found.append((source, line))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="message catalog ของ calculator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("check")
+    render_parser = sub.add_parser("render")
+    render_parser.add_argument("locale")
+    bench_parser = sub.add_parser("bench")
+    bench_parser.add_argument("--repeat", type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        bench(args.repeat)
+        return 0
+    if args.command == "render":
+        import app
+
+        found = untranslated(app, args.locale)
+        for source, line in dict.fromkeys(found):
+            print(f"{source}: {line}")
+        print(f"{args.locale}: พบอักษรไทยนอกข้อมูล formulary {len(found)} บรรทัด")
+        return 1 if found else 0
+    for locale in catalog.locales:
+        missing = catalog.missing[locale]
+        print(f"{locale}: {len(MESSAGES) - len(missing)}/{len(MESSAGES)} ข้อความ" + (f" ขาด {', '.join(missing)}" if missing else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""
+ส่งข้อความออกไปยัง LINE อย่างทนทานเมื่อ LINE API ช้าหรือล่ม
+
+- CircuitBreaker: นับผล (สำเร็จ/ล้มเหลว/ช้าเกิน slow_call_sec) ของการเรียกล่าสุด window ครั้ง
+  อัตราล้มเหลวเกิน failure_rate → open (ไม่เรียก API เลย ตอบทันที) → ครบ open_sec → half-open
+  (ปล่อยให้ลองเรียกได้ทีละครั้ง) → สำเร็จครบ half_open_successes ครั้ง → closed
+- GuardedApi ครอบ messaging_api: reply_message ที่ล้มเหลวหรือถูก breaker ตัด จะไม่ raise แต่บันทึกข้อความลง outbox
+  (SQLite) พร้อม user ปลายทาง ซึ่งรู้จาก event ที่กำลังประมวลผลใน thread นั้น (bind)
+- OutboxSender: background thread ส่งข้อความใน outbox ด้วย push message (reply token ใช้ไม่ได้แล้ว)
+  เมื่อ breaker ยอมให้เรียก จำกัดจำนวนที่ส่งพร้อมกัน ลองใหม่แบบ backoff และทิ้งข้อความที่เก่าเกิน max_age_sec
+  (push message นับโควต้ารายเดือนของ LINE OA ต่างจาก reply)
+  ทุกแถวมี retry key (UUID) ของตัวเองส่งเป็น X-Line-Retry-Key: ถ้า push ครั้งก่อนถึง LINE แล้วแต่เราไม่ได้คำตอบ
+  LINE ตอบ 409 แทนการส่งซ้ำ และถือว่าส่งสำเร็จ
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.v3.messaging import PushMessageRequest
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate=0.5, window=20, min_calls=5, open_sec=30.0,
+                 half_open_successes=2, slow_call_sec=None, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_sec = open_sec
+        self.half_open_successes = half_open_successes
+        self.slow_call_sec = slow_call_sec
+        self.clock = clock
+        self.state = CLOSED
+        self.transitions = {OPEN: 0, HALF_OPEN: 0, CLOSED: 0}
+        self.rejected = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def _move(self, state):
+        if state != self.state:
+            logging.info(f"🔌 circuit breaker {self.state} → {state}")
+            self.state = state
+            self.transitions[state] += 1
+
+    def allow(self):
+        """True ถ้าเรียก API ได้ (half-open ปล่อยทีละ 1 call)"""
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.open_sec:
+                    self.rejected += 1
+                    return False
+                self._move(HALF_OPEN)
+                self._successes = 0
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok, elapsed=0.0):
+        if ok and self.slow_call_sec is not None and elapsed > self.slow_call_sec:
+            ok = False
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if not ok:
+                    self._open()
+                    return
+                self._successes += 1
+                if self._successes >= self.half_open_successes:
+                    self._outcomes.clear()
+                    self._move(CLOSED)
+                return
+            self._outcomes.append(ok)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def _open(self):
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+        self._move(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"circuit {self.state}")
+        started = self.clock()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record(not is_outage(e))
+            raise
+        self.record(True, self.clock() - started)
+        return result
+
+    def status(self):
+        return {"state": self.state, "transitions": dict(self.transitions), "rejected": self.rejected}
+
+
+def is_outage(error):
+    """ข้อผิดพลาดที่แสดงว่า LINE API มีปัญหา (timeout/เชื่อมต่อไม่ได้/5xx/429) ไม่ใช่ request ของเราผิด"""
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    return True
+
+
+class Outbox:
+    def __init__(self, db_path):
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY,"
+            " user_id TEXT NOT NULL,"
+            " messages TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " next_attempt_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " retry_key TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if "retry_key" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN retry_key TEXT")
+            self._db.executemany(
+                "UPDATE outbox SET retry_key = ? WHERE id = ?",
+                [(str(uuid.uuid4()), row[0]) for row in self._db.execute("SELECT id FROM outbox").fetchall()],
+            )
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)")
+        self._lock = threading.Lock()
+        self.added = 0
+
+    def add(self, user_id, messages, error=None):
+        payload = json.dumps([message.to_dict() for message in messages], ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO outbox (user_id, messages, created_at, next_attempt_at, error, retry_key)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, payload, now, now, error, str(uuid.uuid4())),
+            )
+            self.added += 1
+
+    def due(self, now, limit):
+        # ข้อความของผู้ใช้คนเดียวกันต้องออกตามลำดับ → เอาเฉพาะรายการแรกที่ค้างของแต่ละคน
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, user_id, messages, created_at, attempts, retry_key FROM outbox"
+                " WHERE id IN (SELECT MIN(id) FROM outbox GROUP BY user_id) AND next_attempt_at <= ?"
+                " ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+
+    def remove(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, entry_id, next_attempt_at, error):
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, error = ? WHERE id = ?",
+                (next_attempt_at, error, entry_id),
+            )
+
+    def depth(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class GuardedApi:
+    """ครอบ MessagingApi: reply_message ผ่าน breaker และไม่ทำให้คำตอบหาย (ส่งเข้า outbox แทน)"""
+
+    def __init__(self, api, breaker, outbox):
+        self._api = api
+        self._breaker = breaker
+        self._outbox = outbox
+        self._local = threading.local()
+        self.deferred = 0
+
+    def bind(self, reply_token, user_id):
+        """เรียกตอนเริ่มประมวลผล event: reply token นี้เป็นของ user คนไหน (ใช้ตอนต้อง push แทน)"""
+        self._local.target = (reply_token, user_id)
+
+    def reply_message(self, request, *args, **kwargs):
+        try:
+            return self._breaker.call(self._api.reply_message, request, *args, **kwargs)
+        except Exception as e:
+            # 4xx (เช่น reply token หมดอายุ / request ผิด) ส่งซ้ำแบบ push ก็ไม่ช่วย → ให้ผู้เรียกจัดการเอง
+            if not isinstance(e, CircuitOpenError) and not is_outage(e):
+                raise
+            reply_token, user_id = getattr(self._local, "target", (None, None))
+            if user_id is None or reply_token != request.reply_token:
+                raise
+            self._outbox.add(user_id, request.messages, error=repr(e))
+            self.deferred += 1
+            logging.info(f"📮 ตอบกลับไม่สำเร็จ ({e}) → เก็บลง outbox ส่งแบบ push ภายหลัง")
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+
+class OutboxSender:
+    def __init__(self, outbox, api, breaker, concurrency=4, batch_size=32, poll_interval=1.0,
+                 retry_delay_sec=10.0, max_retry_delay_sec=300.0, max_age_sec=3600.0, max_attempts=10):
+        self.outbox = outbox
+        self.api = api
+        self.breaker = breaker
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay_sec = retry_delay_sec
+        self.max_retry_delay_sec = max_retry_delay_sec
+        self.max_age_sec = max_age_sec
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.failed = 0
+        self.expired = 0
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="outbox")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0, flush_sec=0.0):
+        """หยุด thread แล้วส่งข้อความที่ถึงกำหนดต่ออีกไม่เกิน flush_sec (ที่เหลืออยู่ใน outbox ให้ process ถัดไปส่ง)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        deadline = time.monotonic() + flush_sec
+        while time.monotonic() < deadline:
+            try:
+                if not self.run_pending():
+                    break
+            except Exception as e:
+                logging.info(f"❌ ส่งข้อความจาก outbox ผิดพลาด: {e}")
+                break
+        self._executor.shutdown(wait=True)
+
+    def _send(self, row):
+        entry_id, user_id, messages, created_at, attempts, retry_key = row
+        request = PushMessageRequest.from_dict({"to": user_id, "messages": json.loads(messages)})
+        try:
+            self.breaker.call(self.api.push_message, request, x_line_retry_key=retry_key)
+            return entry_id, None
+        except Exception as e:
+            if getattr(e, "status", None) == 409:
+                return entry_id, None  # ครั้งก่อนที่ไม่ได้คำตอบส่งถึงแล้ว (retry key ซ้ำ)
+            return entry_id, e
+
+    def run_pending(self):
+        """ส่งรอบเดียว คืนจำนวนที่ส่งสำเร็จ"""
+        now = time.time()
+        rows = self.outbox.due(now, self.batch_size)
+        expired = [row[0] for row in rows if now - row[3] > self.max_age_sec or row[4] >= self.max_attempts]
+        if expired:
+            self.outbox.remove(expired)
+            self.expired += len(expired)
+            logging.info(f"🗑️ ทิ้งข้อความใน outbox {len(expired)} รายการ (เก่าเกินไปหรือส่งไม่สำเร็จหลายครั้ง)")
+        rows = [row for row in rows if row[0] not in set(expired)]
+
+        sent = []
+        attempts = {row[0]: row[4] for row in rows}
+        # ส่งเฉพาะเมื่อ breaker ยอม (half-open ปล่อยทีละรายการ) จำนวนพร้อมกันไม่เกินขนาด pool
+        futures = []
+        for row in rows:
+            if self.breaker.state != CLOSED and futures:
+                break
+            futures.append(self._executor.submit(self._send, row))
+        for future in futures:
+            entry_id, error = future.result()
+            if error is None:
+                sent.append(entry_id)
+                continue
+            if isinstance(error, CircuitOpenError):
+                continue
+            self.failed += 1
+            delay = min(self.max_retry_delay_sec, self.retry_delay_sec * 2 ** attempts[entry_id])
+            self.outbox.retry(entry_id, time.time() + delay, repr(error))
+        self.outbox.remove(sent)
+        self.sent += len(sent)
+        return len(sent)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.run_pending()
+            except Exception as e:
+                logging.info(f"❌ ส่งข้อความจาก outbox ผิดพลาด: {e}")
+                sent = 0
+            if not sent:
+                self._stop.wait(self.poll_interval)
+
+    def status(self):
+        return {
+            "depth": self.outbox.depth(),
+            "deferred": self.outbox.added,
+            "sent": self.sent,
+            "failed": self.failed,
+            "expired": self.expired,
+            "breaker": self.breaker.status(),
+        }
@@ -0,0 +1,289 @@
+"""
+Profiling แบบเปิด/ปิดได้ตอนรันจริง (ผ่าน admin endpoint ใน app.py)
+
+- CallbackProfiler: สุ่ม event ที่ dispatch ไปยัง handler ตาม sample_rate มาจับ cProfile แล้วรวมผลเป็น pstats ชุดเดียว
+  ครอบที่ตัว handler (CallbackProfiler.handler) จึงจับได้ทั้งใน request thread, worker pool และ consumer ของคิว
+  พร้อม stack sampler (sys._current_frames) สำหรับ collapsed stack (ใช้กับ flamegraph.pl / speedscope)
+  ตอนปิดอยู่ request() คืน object no-op ตัวเดียว จึงไม่มีต้นทุนกับ request ปกติ
+  หมายเหตุ: Python 3.12 ให้ cProfile ทำงานได้ทีละตัวทั้ง process จึงจับได้ครั้งละ 1 event
+- MemoryTracker: เปิด tracemalloc, เก็บ snapshot (พร้อมขนาด session dict ณ ตอนนั้น) และ diff ระหว่าง snapshot
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from functools import wraps
+
+# ค่าของ pstats.SortKey รวมชื่อย่อที่ sort_stats รับ (เช่น tottime, cumtime)
+SORT_KEYS = frozenset(key.value for key in pstats.SortKey) | frozenset(pstats.Stats.sort_arg_dict_default)
+
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP = _Noop()
+
+
+class StackSampler:
+    """สุ่มอ่าน stack ของ thread ที่กำลังถูก profile ทุก interval แล้วนับเป็น collapsed stack"""
+
+    def __init__(self, interval_sec=0.005):
+        self.interval_sec = interval_sec
+        self.counts = Counter()
+        self._threads = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def watch(self, thread_id):
+        self._threads.add(thread_id)
+
+    def unwatch(self, thread_id):
+        self._threads.discard(thread_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            if not self._threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id in list(self._threads):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(1)
+
+    def collapsed(self, limit=None):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common(limit))
+
+
+class _ProfiledRequest:
+    __slots__ = ("owner", "profile", "thread_id")
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.profile = cProfile.Profile()
+        self.thread_id = threading.get_ident()
+
+    def __enter__(self):
+        sampler = self.owner._sampler
+        if sampler is not None:
+            sampler.watch(self.thread_id)
+        try:
+            self.profile.enable()
+        except ValueError:
+            self.profile = None  # มี profiler/debugger ตัวอื่นใช้ sys.monitoring อยู่
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profile.disable()
+        self.owner._finish(self)
+        return False
+
+
+class CallbackProfiler:
+    def __init__(self):
+        self.active = False
+        self.sample_rate = 0.0
+        self.remaining = 0
+        self.profiled = 0
+        self.started_at = None
+        self._stats = None
+        self._sampler = None
+        self._running = threading.Lock()  # cProfile เปิดได้ครั้งละตัวทั้ง process
+        self._lock = threading.Lock()
+
+    def start(self, sample_rate=0.1, max_requests=1000, stack_interval_ms=5):
+        with self._lock:
+            self._stop_sampler()
+            self.sample_rate = sample_rate
+            self.remaining = max_requests
+            self.profiled = 0
+            self.started_at = time.time()
+            self._stats = None
+            self._sampler = StackSampler(stack_interval_ms / 1000) if stack_interval_ms else None
+            self.active = True
+
+    def stop(self):
+        with self._lock:
+            self.active = False
+            self._stop_sampler()
+
+    def _stop_sampler(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def request(self):
+        """คืน context manager ที่ profile หรือ no-op (ต้องเข้าใน thread ที่ประมวลผลจริง)"""
+        if not self.active or random.random() >= self.sample_rate:
+            return NOOP
+        if not self._running.acquire(blocking=False):
+            return NOOP
+        return _ProfiledRequest(self)
+
+    def handler(self, func):
+        """decorator ของ handler: สุ่ม profile ในทุก thread ที่ event ถูก dispatch"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.request():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _finish(self, profiled):
+        if self._sampler is not None:
+            self._sampler.unwatch(profiled.thread_id)
+        self._running.release()
+        if profiled.profile is None:
+            return
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiled.profile)
+            else:
+                self._stats.add(profiled.profile)
+            self.profiled += 1
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.active = False
+
+    def status(self):
+        return {
+            "active": self.active,
+            "sample_rate": self.sample_rate,
+            "profiled": self.profiled,
+            "remaining": max(0, self.remaining),
+            "started_at": self.started_at,
+        }
+
+    def report(self, fmt="pstats", limit=30, sort="cumulative"):
+        """fmt: pstats (ข้อความ top-N), prof (ไฟล์ pstats สำหรับ snakeviz), collapsed (collapsed stack)"""
+        if sort not in SORT_KEYS:
+            raise ValueError(f"unknown sort key: {sort}")
+        with self._lock:
+            if fmt == "collapsed":
+                return self._sampler.collapsed(limit) if self._sampler is not None else ""
+            if self._stats is None:
+                return b"" if fmt == "prof" else ""
+            if fmt == "prof":
+                return marshal.dumps(self._stats.stats)
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+
+class MemoryTracker:
+    def __init__(self, max_snapshots=10):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, nframes=10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(nframes)
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._snapshots.clear()
+
+    def snapshot(self, extra=None):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = {
+                "snapshot": snap,
+                "taken_at": time.time(),
+                "traced_bytes": current,
+                "peak_bytes": peak,
+                "extra": extra or {},
+            }
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def _get(self, snapshot_id):
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(snapshot_id)
+        return entry
+
+    def list(self):
+        with self._lock:
+            return [
+                {"id": snapshot_id, **{k: v for k, v in entry.items() if k != "snapshot"}}
+                for snapshot_id, entry in self._snapshots.items()
+            ]
+
+    def top(self, snapshot_id, limit=20, key_type="lineno"):
+        entry = self._get(snapshot_id)
+        stats = entry["snapshot"].statistics(key_type)[:limit]
+        return {
+            "id": snapshot_id,
+            "traced_bytes": entry["traced_bytes"],
+            "extra": entry["extra"],
+            "top": [
+                {"where": str(stat.traceback), "size": stat.size, "count": stat.count}
+                for stat in stats
+            ],
+        }
+
+    def diff(self, base_id, other_id, limit=20, key_type="lineno"):
+        base = self._get(base_id)
+        other = self._get(other_id)
+        stats = other["snapshot"].compare_to(base["snapshot"], key_type)[:limit]
+        extra = {
+            k: other["extra"][k] - base["extra"].get(k, 0)
+            for k in other["extra"]
+            if isinstance(other["extra"][k], (int, float))
+        }
+        return {
+            "base": base_id,
+            "to": other_id,
+            "traced_bytes_diff": other["traced_bytes"] - base["traced_bytes"],
+            "extra_diff": extra,
+            "top": [
+                {
+                    "where": str(stat.traceback),
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats
+            ],
+        }
@@ -0,0 +1,119 @@
+"""
+Rate limit ต่อผู้ใช้และทั้งระบบสำหรับ webhook + load shedding ตาม latency
+
+ใช้ GCRA (token bucket รูปแบบที่เก็บ state เป็นตัวเลขตัวเดียว: theoretical arrival time)
+- ผู้ใช้แต่ละคนใช้ float 1 ค่าใน OrderedDict ที่เรียงตามเวลาใช้งานล่าสุด
+- bucket ที่ idle จนเต็มแล้ว (tat <= now) มีค่าเท่ากับผู้ใช้ใหม่ จึงลบทิ้งได้ทันทีโดยไม่เสีย state
+  → หน่วยความจำขึ้นกับจำนวนผู้ใช้ที่ active จริงเท่านั้น
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+ALLOW = "allow"
+REJECT_NOTIFY = "notify"
+REJECT_SILENT = "silent"
+
+
+class KeyedGCRA:
+    def __init__(self, rate_per_sec, burst, max_entries=1_000_000, evict_batch=64):
+        self.interval = 1.0 / rate_per_sec
+        self.tolerance = self.interval * (burst - 1)
+        self.max_entries = max_entries
+        self.evict_batch = evict_batch
+        self._tat = OrderedDict()
+
+    def __len__(self):
+        return len(self._tat)
+
+    def check(self, key, now):
+        tats = self._tat
+        tat = tats.get(key, now)
+        if tat < now:
+            tat = now
+
+        if tat - now <= self.tolerance:
+            tats[key] = tat + self.interval
+            result = ALLOW
+        else:
+            # ถูกปฏิเสธ: แจ้ง busy เฉพาะครั้งแรกของช่วง แล้วเลื่อน tat เพื่อให้ครั้งต่อ ๆ ไปเงียบ
+            # (จำกัด penalty ไว้ไม่เกิน 2 interval จึงกลับมาใช้ได้เองเมื่อหยุดส่ง)
+            limit = now + self.tolerance + self.interval
+            result = REJECT_NOTIFY if tat <= limit else REJECT_SILENT
+            tats[key] = min(tat + self.interval, limit + self.interval)
+        tats.move_to_end(key)
+
+        self._evict(now)
+        return result
+
+    def refund(self, key):
+        """คืน token ที่ check() เพิ่งให้ไป (คำขอถูกปฏิเสธในขั้นถัดไปจึงไม่นับเป็นการใช้งานของ key นี้)"""
+        if key in self._tat:
+            self._tat[key] -= self.interval
+
+    def _evict(self, now):
+        # ตัวหน้าสุดคือคนที่ไม่ได้ใช้งานนานที่สุด (OrderedDict ดึง/ลบหัวได้ O(1) แม้ลบไปมากแล้ว)
+        tats = self._tat
+        for _ in range(self.evict_batch):
+            if not tats:
+                return
+            key, tat = next(iter(tats.items()))
+            if tat > now and len(tats) <= self.max_entries:
+                return
+            tats.popitem(last=False)
+
+
+class LoadShedder:
+    """ทิ้งงานบางส่วนแบบสุ่มเมื่อ EWMA ของ dispatch latency เกิน threshold"""
+
+    def __init__(self, threshold_sec, max_shed=0.9, alpha=0.2):
+        self.threshold = threshold_sec
+        self.max_shed = max_shed
+        self.alpha = alpha
+        self.latency = 0.0
+
+    def observe(self, latency_sec):
+        self.latency += self.alpha * (latency_sec - self.latency)
+
+    def shed_probability(self):
+        if not self.threshold or self.latency <= self.threshold:
+            return 0.0
+        return min(self.max_shed, (self.latency - self.threshold) / self.threshold)
+
+    def should_shed(self):
+        p = self.shed_probability()
+        return p > 0 and random.random() < p
+
+
+class WebhookAdmission:
+    def __init__(self, user_rate_per_sec, user_burst, global_rate_per_sec, global_burst,
+                 shed_latency_sec=None, max_users=1_000_000, clock=time.monotonic):
+        self.users = KeyedGCRA(user_rate_per_sec, user_burst, max_entries=max_users)
+        self.total = KeyedGCRA(global_rate_per_sec, global_burst, max_entries=1)
+        self.shedder = LoadShedder(shed_latency_sec)
+        self.clock = clock
+        self.stats = {ALLOW: 0, REJECT_NOTIFY: 0, REJECT_SILENT: 0, "shed": 0}
+        self._lock = threading.Lock()
+
+    def check(self, user_id):
+        """คืน ALLOW / REJECT_NOTIFY / REJECT_SILENT"""
+        with self._lock:
+            now = self.clock()
+            result = self.users.check(user_id or "", now)
+            if result == ALLOW:
+                if self.total.check("", now) != ALLOW:
+                    # ระบบรวมเกินขีดจำกัด → ไม่ตอบกลับ เพื่อไม่ใช้ quota reply เพิ่ม
+                    result = REJECT_SILENT
+                elif self.shedder.should_shed():
+                    self.stats["shed"] += 1
+                    result = REJECT_NOTIFY
+                if result != ALLOW:
+                    # ถูกปฏิเสธเพราะภาระของทั้งระบบ ไม่ใช่เพราะผู้ใช้ส่งถี่ → ไม่หัก quota ของผู้ใช้
+                    self.users.refund(user_id or "")
+            self.stats[result] += 1
+            return result
+
+    def observe_latency(self, latency_sec):
+        with self._lock:
+            self.shedder.observe(latency_sec)
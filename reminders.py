@@ -0,0 +1,272 @@
+"""
+ระบบแจ้งเตือนวันนัดตรวจ INR ผ่าน LINE push message (opt-in)
+
+- เก็บนัดทั้งหมดใน SQLite (index ตาม due_at) และดึงเฉพาะนัดที่ใกล้ถึงเข้ามาใน heap ทีละช่วง (horizon)
+  จึงไม่ต้องวนตรวจทุกรายการแม้มีหลายแสนนัด
+- นัดที่ถึงกำหนดจะถูกรวมเป็น batch แล้วส่งผ่าน pipeline เดียวที่จำกัดอัตราการเรียก API
+  (ข้อความเดียวกันหลายคน → multicast ครั้งละไม่เกิน 500 คน)
+- หลาย worker/process ใช้ฐานข้อมูลเดียวกันได้: heap ถูกเติมใหม่ทุก refresh_sec (เห็นนัดที่ worker อื่นตั้ง)
+  และ claim มีอายุ (lease_sec) นัดที่ claim ค้างเกินนั้น (worker crash ระหว่างส่ง) จึงถูกดึงกลับมาส่งใหม่
+  โดยไม่แย่งนัดที่ worker อื่นกำลังส่งอยู่
+- clock และ messaging_api ส่งเข้ามาได้ เพื่อทดสอบด้วยนาฬิกาปลอมและ LINE stub
+"""
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from linebot.v3.messaging import MulticastRequest, PushMessageRequest, TextMessage
+
+PENDING = 0
+SENT = 1
+CLAIMED = 2
+FAILED = 3
+
+MULTICAST_LIMIT = 500
+
+
+class SystemClock:
+    def time(self):
+        return time.time()
+
+
+class RateLimiter:
+    """token bucket แบบง่ายสำหรับจำกัดจำนวนการเรียก LINE API ต่อวินาที"""
+
+    def __init__(self, rate_per_sec, burst=None, clock=None, sleep=time.sleep):
+        self.rate = float(rate_per_sec)
+        self.capacity = float(burst or rate_per_sec)
+        self.clock = clock or SystemClock()
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = self.clock.time()
+
+    def acquire(self):
+        while True:
+            now = self.clock.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.sleep((1 - self.tokens) / self.rate)
+
+
+class ReminderScheduler:
+    def __init__(self, db_path, messaging_api, clock=None, sleep=time.sleep,
+                 rate_per_sec=20, horizon_sec=3600, batch_size=2000,
+                 retry_delay_sec=600, max_attempts=5, refresh_sec=60, lease_sec=900):
+        self.messaging_api = messaging_api
+        self.clock = clock or SystemClock()
+        self.limiter = RateLimiter(rate_per_sec, clock=self.clock, sleep=sleep)
+        self.horizon_sec = horizon_sec
+        self.batch_size = batch_size
+        self.retry_delay_sec = retry_delay_sec
+        self.max_attempts = max_attempts
+        self.refresh_sec = refresh_sec
+        self.lease_sec = lease_sec
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            " id INTEGER PRIMARY KEY,"
+            " user_id TEXT NOT NULL,"
+            " due_at REAL NOT NULL,"
+            " message TEXT NOT NULL,"
+            " status INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " claim TEXT,"
+            " claimed_at REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(reminders)")}
+        if "claimed_at" not in columns:
+            self._db.execute("ALTER TABLE reminders ADD COLUMN claimed_at REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS reminders_due ON reminders (status, due_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS reminders_user ON reminders (user_id, status)")
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._heap = []
+        self._queued = set()
+        self._loaded_until = None
+        self._refreshed_at = None
+
+    # ---------- การจัดการนัด ----------
+
+    def schedule(self, user_id, due_at, message):
+        """ตั้งนัดใหม่ (แทนที่นัดเดิมที่ยังไม่ได้ส่งของผู้ใช้คนเดียวกัน)"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM reminders WHERE user_id = ? AND status = ?", (user_id, PENDING))
+            cur = self._db.execute(
+                "INSERT INTO reminders (user_id, due_at, message) VALUES (?, ?, ?)",
+                (user_id, due_at, message),
+            )
+            self._db.execute("COMMIT")
+            if self._loaded_until is not None and due_at < self._loaded_until:
+                heapq.heappush(self._heap, (due_at, cur.lastrowid))
+                self._queued.add(cur.lastrowid)
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def cancel(self, user_id):
+        with self._lock:
+            self._db.execute("DELETE FROM reminders WHERE user_id = ? AND status = ?", (user_id, PENDING))
+
+    def pending_count(self):
+        return self._db.execute("SELECT COUNT(*) FROM reminders WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def _reclaim_expired(self, now):
+        # claim ที่เกิน lease = worker ที่ claim ไว้ตายระหว่างส่ง → กลับเป็น pending (claim ที่ยังไม่หมดอายุไม่แตะ)
+        self._db.execute(
+            "UPDATE reminders SET status = ?, claim = NULL, claimed_at = NULL"
+            " WHERE status = ? AND (claimed_at IS NULL OR claimed_at < ?)",
+            (PENDING, CLAIMED, now - self.lease_sec),
+        )
+
+    def _needs_refill(self, now):
+        return (self._loaded_until is None or self._loaded_until <= now
+                or now - self._refreshed_at >= self.refresh_sec)
+
+    def _refill(self, now):
+        # ดึงนัด pending ทั้งหมดที่ถึงกำหนดภายใน horizon จาก index เข้ามาใน heap รวมนัดที่ worker อื่นตั้ง
+        # หรือ reclaim หลังจากรอบก่อน (นัดที่อยู่ใน heap แล้วไม่ใส่ซ้ำ นัดที่ถูกลบจะถูกข้ามตอน claim)
+        end = now + self.horizon_sec
+        self._reclaim_expired(now)
+        rows = self._db.execute(
+            "SELECT due_at, id FROM reminders WHERE status = ? AND due_at < ?", (PENDING, end)
+        )
+        for due_at, reminder_id in rows:
+            if reminder_id not in self._queued:
+                heapq.heappush(self._heap, (due_at, reminder_id))
+                self._queued.add(reminder_id)
+        self._loaded_until = end
+        self._refreshed_at = now
+
+    def next_due(self):
+        with self._lock:
+            now = self.clock.time()
+            if self._needs_refill(now):
+                self._refill(now)
+            due = self._heap[0][0] if self._heap else self._loaded_until
+            return min(due, self._refreshed_at + self.refresh_sec)
+
+    # ---------- ส่งนัดที่ถึงกำหนด ----------
+
+    def _claim_due(self, now):
+        ids = []
+        with self._lock:
+            if self._needs_refill(now):
+                self._refill(now)
+            while self._heap and self._heap[0][0] <= now and len(ids) < self.batch_size:
+                reminder_id = heapq.heappop(self._heap)[1]
+                self._queued.discard(reminder_id)
+                ids.append(reminder_id)
+            if not ids:
+                return []
+
+            # claim แบบ atomic เผื่อมีหลาย worker ใช้ฐานข้อมูลเดียวกัน
+            claim = uuid.uuid4().hex
+            marks = ",".join("?" * len(ids))
+            self._db.execute(
+                f"UPDATE reminders SET status = ?, claim = ?, claimed_at = ?"
+                f" WHERE status = ? AND due_at <= ? AND id IN ({marks})",
+                (CLAIMED, claim, now, PENDING, now, *ids),
+            )
+            return self._db.execute(
+                "SELECT id, user_id, message, attempts FROM reminders WHERE claim = ? AND status = ?",
+                (claim, CLAIMED),
+            ).fetchall()
+
+    def _send(self, user_ids, message):
+        messages = [TextMessage(text=message)]
+        self.limiter.acquire()
+        if len(user_ids) == 1:
+            self.messaging_api.push_message(PushMessageRequest(to=user_ids[0], messages=messages))
+        else:
+            self.messaging_api.multicast(MulticastRequest(to=user_ids, messages=messages))
+
+    def run_pending(self):
+        """ส่งนัดที่ถึงกำหนดทั้งหมด คืนจำนวนข้อความที่ส่งสำเร็จ"""
+        sent_total = 0
+        while True:
+            now = self.clock.time()
+            rows = self._claim_due(now)
+            if not rows:
+                return sent_total
+
+            groups = {}
+            for reminder_id, user_id, message, attempts in rows:
+                groups.setdefault(message, []).append((reminder_id, user_id, attempts))
+
+            sent, failed = [], []
+            for message, members in groups.items():
+                for i in range(0, len(members), MULTICAST_LIMIT):
+                    chunk = members[i:i + MULTICAST_LIMIT]
+                    try:
+                        self._send([user_id for _, user_id, _ in chunk], message)
+                        sent.extend(reminder_id for reminder_id, _, _ in chunk)
+                    except Exception as e:
+                        logging.info(f"❌ ส่งแจ้งเตือน INR ไม่สำเร็จ ({len(chunk)} ราย): {e}")
+                        failed.extend(chunk)
+
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.executemany(
+                    "UPDATE reminders SET status = ?, claim = NULL WHERE id = ?",
+                    [(SENT, reminder_id) for reminder_id in sent],
+                )
+                retry_at = now + self.retry_delay_sec
+                for reminder_id, _, attempts in failed:
+                    if attempts + 1 >= self.max_attempts:
+                        self._db.execute(
+                            "UPDATE reminders SET status = ?, attempts = ?, claim = NULL WHERE id = ?",
+                            (FAILED, attempts + 1, reminder_id),
+                        )
+                    else:
+                        self._db.execute(
+                            "UPDATE reminders SET status = ?, attempts = ?, due_at = ?, claim = NULL WHERE id = ?",
+                            (PENDING, attempts + 1, retry_at, reminder_id),
+                        )
+                        if retry_at < self._loaded_until and reminder_id not in self._queued:
+                            heapq.heappush(self._heap, (retry_at, reminder_id))
+                            self._queued.add(reminder_id)
+                self._db.execute("COMMIT")
+
+            sent_total += len(sent)
+            if failed and not sent:
+                return sent_total
+
+    # ---------- background thread ----------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # นัดที่ค้างสถานะ claimed เกิน lease (process ก่อนหน้า crash ระหว่างส่ง) ให้กลับมาเป็น pending
+        with self._lock:
+            self._reclaim_expired(self.clock.time())
+        self._thread = threading.Thread(target=self._run, name="inr-reminders", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self.run_pending()
+                wait = max(0.0, self.next_due() - self.clock.time())
+            except Exception as e:
+                logging.info(f"❌ ตัวตั้งเวลาแจ้งเตือน INR ผิดพลาด: {e}")
+                wait = self.retry_delay_sec
+            self._wakeup.wait(min(wait, self.horizon_sec))
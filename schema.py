@@ -0,0 +1,488 @@
+"""
+ตรวจ schema ของ formulary แบบเข้มงวด ครั้งเดียวตอนโหลด (และทุกครั้งที่ reload ผ่าน FormularyStore)
+
+- error: field ที่ calculator ต้องใช้หายไป ชนิดผิด หรือขัดกันเอง (เช่น max_mg_per_day เป็น list หรือ None,
+  มีทั้ง dose_by_day และ dose_mg_per_kg_per_day, มีทั้ง duration_days และ duration_days_range)
+  → formulary ไม่ถูก publish ดังนั้น calculate_dose / calculate_special_drug ไม่ต้องตรวจซ้ำทุก request
+- warning: ข้อมูลที่คำนวณได้แต่ไม่ครบ หรือข้อบ่งใช้ / ช่วงอายุ / ช่วงยาที่ไม่มี branch ไหนของ calculator
+  ไปถึง → log และแสดงใน /admin/formulary แต่ยังโหลดได้
+- unsupported: ข้อบ่งใช้ใน DRUG_DATABASE ที่ calculate_dose คำนวณไม่ได้ทั้งข้อ (เช่น regimen รายสัปดาห์,
+  เมนู "Other") → calculate_dose ตอบ "ยังไม่รองรับ" แทนการ error
+    python schema.py                  # ตรวจ formulary ใน app.py
+    python schema.py formulary.json   # ตรวจไฟล์ก่อนนำไปใช้
+"""
+import json
+import re
+import sys
+
+DAY_KEY = re.compile(r"Day\s*(\d+)\s*(?:-\s*(\d+)|(\+))?")
+MENU_ONLY = "INDICATION_OTHERS"  # ค่าของข้อบ่งใช้ที่เป็นแค่ปุ่มเมนู ไม่ได้คำนวณ
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _positive(value):
+    return _number(value) and value > 0
+
+
+def _text(value):
+    return isinstance(value, str)
+
+
+def _range(value):
+    """[ต่ำสุด, สูงสุด] ที่ต่ำสุด ≤ สูงสุด"""
+    return isinstance(value, list) and len(value) == 2 and all(_positive(v) for v in value) and value[0] <= value[1]
+
+
+def _number_or_range(value):
+    return _positive(value) or _range(value)
+
+
+def _positive_list(value):
+    return isinstance(value, list) and bool(value) and all(_positive(v) for v in value)
+
+
+def _count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _frequency(value):
+    """จำนวนครั้งต่อวัน: int > 0 หรือ list ของ int > 0"""
+    if isinstance(value, list):
+        return bool(value) and all(_count(v) for v in value)
+    return _count(value)
+
+
+def _frequency_or_text(value):
+    return _frequency(value) or _text(value)
+
+
+def _days_range(value):
+    # calculator ใช้ค่าแรก (น้อยสุด) ของช่วง
+    return _positive_list(value) and value == sorted(value)
+
+
+class Report:
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.unsupported = set()  # {(drug, indication)} ของ DRUG_DATABASE
+
+    def error(self, path, message):
+        self.errors.append(f"{path}: {message}")
+
+    def warn(self, path, message):
+        self.warnings.append(f"{path}: {message}")
+
+    def require(self, entry, path, key, check, expected):
+        if key not in entry:
+            self.error(path, f"ไม่มี {key}")
+        else:
+            self.optional(entry, path, key, check, expected)
+
+    def optional(self, entry, path, key, check, expected):
+        if key not in entry:
+            return
+        if entry[key] is None:
+            self.error(path, f"{key} เป็น None (ถ้าไม่มีค่าให้ลบ key ออก)")
+        elif not check(entry[key]):
+            self.error(path, f"{key} ต้องเป็น{expected} (ได้ {entry[key]!r})")
+
+    def exclusive(self, entry, path, keys):
+        present = [k for k in keys if k in entry]
+        if len(present) > 1:
+            self.error(path, f"มีทั้ง {' และ '.join(present)} (ต้องเลือกอย่างใดอย่างหนึ่ง)")
+        return present
+
+
+def _limits(r, entry, path):
+    r.optional(entry, path, "max_mg_per_day", _positive, "ตัวเลข > 0")
+    r.optional(entry, path, "max_mg_per_dose", _positive, "ตัวเลข > 0")
+    r.optional(entry, path, "note", _text, "ข้อความ")
+
+
+# ---------- DRUG_DATABASE (calculate_dose) ----------
+
+def indication_shape(indication_info):
+    """branch ที่ calculate_dose ใช้: nested (sub-indication) / phases (list) / single"""
+    if isinstance(indication_info, dict) and all(isinstance(v, dict) for v in indication_info.values()):
+        return "nested"
+    if isinstance(indication_info, list):
+        return "phases"
+    return "single"
+
+
+def _weight_based(r, entry, path):
+    r.require(entry, path, "dose_mg_per_kg_per_day", _number_or_range, "ตัวเลข > 0 หรือ [ต่ำสุด, สูงสุด]")
+    r.require(entry, path, "frequency", _frequency, "จำนวนครั้ง/วัน หรือ list")
+    r.require(entry, path, "duration_days", _positive, "ตัวเลข > 0")
+    _limits(r, entry, path)
+
+
+def _dose_by_day(r, phase, path):
+    days = phase["dose_by_day"]
+    if not isinstance(days, dict) or not days:
+        r.error(path, "dose_by_day ต้องเป็น object ของ 'Day ...' ที่ไม่ว่าง")
+        return
+    r.optional(phase, path, "frequency", _frequency, "จำนวนครั้ง/วัน หรือ list")
+    r.optional(phase, path, "duration_days", _number_or_range, "ตัวเลข > 0 หรือ [ต่ำสุด, สูงสุด]")
+    r.optional(phase, path, "duration_days_range", _days_range, "list ของจำนวนวัน")
+    for day_key, day in days.items():
+        day_path = f"{path}.dose_by_day[{day_key!r}]"
+        match = DAY_KEY.match(day_key)
+        if not match:
+            r.error(day_path, "key ต้องเป็นรูปแบบ 'Day 1', 'Day 2-5' หรือ 'Day 2+'")
+        elif match.group(3) and not (phase.get("duration_days") or phase.get("duration_days_range")):
+            r.error(day_path, "'Day N+' ต้องมี duration_days")
+        if not isinstance(day, dict):
+            r.error(day_path, "ต้องเป็น object")
+            continue
+        dose_keys = r.exclusive(day, day_path, ("dose_mg_per_kg_per_day", "dose_mg_per_kg", "dose_mg"))
+        if not dose_keys:
+            r.error(day_path, "ไม่มี dose_mg_per_kg_per_day / dose_mg_per_kg / dose_mg")
+        for key in dose_keys:
+            r.require(day, day_path, key, _positive, "ตัวเลข > 0")
+        r.optional(day, day_path, "max_mg_per_day", _positive, "ตัวเลข > 0")
+
+
+def _phase(r, phase, path):
+    """คืน False ถ้า calculate_dose ข้ามช่วงนี้"""
+    if not isinstance(phase, dict):
+        r.error(path, "ต้องเป็น object")
+        return True
+    dose_keys = r.exclusive(phase, path, ("dose_mg_per_kg_per_day", "dose_mg", "dose_by_day"))
+    if not dose_keys:
+        r.warn(path, "ไม่มี dose_mg_per_kg_per_day / dose_mg / dose_by_day (calculator ข้ามช่วงนี้)")
+        return False
+    if "dose_by_day" in dose_keys:
+        _dose_by_day(r, phase, path)
+        return True
+    r.optional(phase, path, "dose_mg_per_kg_per_day", _number_or_range, "ตัวเลข > 0 หรือ [ต่ำสุด, สูงสุด]")
+    r.optional(phase, path, "dose_mg", _number_or_range, "ตัวเลข > 0 หรือ [ต่ำสุด, สูงสุด]")
+    r.require(phase, path, "frequency", _frequency, "จำนวนครั้ง/วัน หรือ list")
+    if not r.exclusive(phase, path, ("duration_days", "duration_days_range")):
+        r.warn(path, "ไม่มี duration_days / duration_days_range (จำนวนขวดจะเป็น 0)")
+    r.optional(phase, path, "duration_days", _positive, "ตัวเลข > 0 (ถ้าเป็นช่วงให้ใช้ duration_days_range)")
+    r.optional(phase, path, "duration_days_range", _days_range, "list ของจำนวนวันเรียงจากน้อยไปมาก")
+    _limits(r, phase, path)
+    return True
+
+
+def _common(r, info, path):
+    if not isinstance(info, dict):
+        r.error(path, "ต้องเป็น object")
+        return False
+    r.require(info, path, "concentration_mg_per_ml", _positive, "ตัวเลข > 0")
+    r.require(
+        info, path, "pack_sizes_ml",
+        lambda v: isinstance(v, list) and bool(v) and all(_count(s) for s in v),
+        "list ของขนาดขวด (ml เต็มจำนวน)",
+    )
+    if "pack_prices" in info:
+        r.optional(info, path, "pack_prices", _positive_list, "list ของราคา > 0")
+        if isinstance(info["pack_prices"], list) and len(info["pack_prices"]) != len(info.get("pack_sizes_ml") or ()):
+            r.error(path, "pack_prices ต้องยาวเท่ากับ pack_sizes_ml")
+    indications = info.get("indications")
+    if not isinstance(indications, dict) or not indications:
+        r.error(path, "ไม่มี indications")
+        return False
+    for name in info.get("common_indications", ()):
+        if name not in indications:
+            r.error(path, f"common_indications มี {name!r} ที่ไม่อยู่ใน indications")
+    return True
+
+
+def check_drug_database(drugs, r):
+    for drug, info in drugs.items():
+        path = f"DRUG_DATABASE.{drug}"
+        if not _common(r, info, path):
+            continue
+        for name, indication_info in info["indications"].items():
+            ind_path = f"{path}[{name!r}]"
+            shape = indication_shape(indication_info)
+            if indication_info == MENU_ONLY:
+                r.unsupported.add((drug, name))
+            elif shape == "nested":
+                if not indication_info:
+                    r.error(ind_path, "ว่าง")
+                for sub, sub_info in indication_info.items():
+                    _weight_based(r, sub_info, f"{ind_path}[{sub!r}]")
+            elif shape == "phases":
+                if any(isinstance(phase, dict) and "frequency_per_week" in phase for phase in indication_info):
+                    r.warn(ind_path, "regimen รายสัปดาห์ (frequency_per_week) ยังไม่มี branch ใน calculate_dose")
+                    r.unsupported.add((drug, name))
+                    continue
+                reached = [_phase(r, phase, f"{ind_path}[{i}]") for i, phase in enumerate(indication_info)]
+                if not any(reached):
+                    r.warn(ind_path, "ไม่มีช่วงไหนที่ calculate_dose คำนวณได้")
+                    r.unsupported.add((drug, name))
+            elif isinstance(indication_info, dict):
+                _weight_based(r, indication_info, ind_path)
+            else:
+                r.error(ind_path, "ต้องเป็น object หรือ list")
+
+
+# ---------- SPECIAL_DRUGS: checker หนึ่งตัวต่อ branch ของ calculate_special_drug ----------
+# checker(r, data, path, indication) คืน False ถ้าไม่มี branch ไหนไปถึงข้อบ่งใช้นี้
+
+def _groups(r, groups, path, dose_keys, frequency=_frequency_or_text):
+    if not isinstance(groups, list) or not groups:
+        r.error(path, "ต้องเป็น list ของช่วงอายุ/น้ำหนัก")
+        return []
+    checked = []
+    for i, group in enumerate(groups):
+        group_path = f"{path}[{i}]"
+        if not isinstance(group, dict):
+            r.error(group_path, "ต้องเป็น object")
+            continue
+        for key in ("age_min", "age_max", "weight_min", "weight_max"):
+            r.optional(group, group_path, key, lambda v: _number(v) and v >= 0, "ตัวเลข ≥ 0")
+        if not r.exclusive(group, group_path, dose_keys):
+            r.error(group_path, f"ไม่มี {' / '.join(dose_keys)}")
+        r.require(group, group_path, "frequency", frequency, "จำนวนครั้ง/วัน")
+        r.optional(group, group_path, "max_mg_per_day", _positive, "ตัวเลข > 0")
+        r.optional(group, group_path, "note", _text, "ข้อความ")
+        checked.append((group, group_path))
+    return checked
+
+
+def _carbocysteine(r, data, path, indication):
+    if indication == "mucolytic (age-based)":
+        for group, group_path in _groups(r, data, path, ("dose_mg",), _frequency):
+            r.require(group, group_path, "age_min", _number, "ตัวเลข")
+            r.require(group, group_path, "dose_mg", lambda v: _positive(v) or _positive_list(v), "ตัวเลข > 0 หรือ list")
+            r.require(group, group_path, "max_mg_per_day", _positive, "ตัวเลข > 0")
+            r.require(group, group_path, "sub_indication", _text, "ข้อความ")
+        return True
+    if indication == "mucolytic (weight-based)":
+        r.require(data, path, "age_min", _number, "ตัวเลข")
+        r.require(data, path, "dose_mg_per_kg_per_day", _range, "[ต่ำสุด, สูงสุด]")
+        r.require(data, path, "frequency", lambda v: isinstance(v, list) and _frequency(v), "list ของจำนวนครั้ง/วัน")
+        r.require(data, path, "max_mg_per_day", _positive, "ตัวเลข > 0")
+        return True
+    return False
+
+
+def _object(r, data, path):
+    if not isinstance(data, dict):
+        r.error(path, "ต้องเป็น object")
+        return False
+    return True
+
+
+def _hydroxyzine(r, data, path, indication):
+    if not _object(r, data, path):
+        return True
+    if indication in ("Anxiety", "Pruritus (age-based)"):
+        profiles = (("under_6", "dose_mg", _positive), ("above_or_equal_6", "dose_mg_range", _positive_list))
+    elif indication == "Pruritus (weight_based)":
+        profiles = (("≤40kg", "dose_mg_per_kg_per_day", _positive),)
+        for key in data:
+            if key != "≤40kg":
+                r.warn(f"{path}.{key}", "calculator รองรับเฉพาะ ≤40kg")
+    else:
+        return False
+    for key, dose_key, check in profiles:
+        profile = data.get(key)
+        if not isinstance(profile, dict):
+            r.error(path, f"ไม่มี {key}")
+            continue
+        r.require(profile, f"{path}.{key}", dose_key, check, "ขนาดยา")
+        r.require(profile, f"{path}.{key}", "frequency", _frequency, "จำนวนครั้ง/วัน หรือ list")
+        if key != "under_6":
+            r.require(profile, f"{path}.{key}", "max_mg_per_dose", _positive, "ตัวเลข > 0")
+    if indication == "Pruritus (weight_based)" and isinstance(data.get("≤40kg"), dict):
+        r.require(data["≤40kg"], f"{path}.≤40kg", "frequency", lambda v: isinstance(v, list) and len(v) == 2, "list 2 ค่า")
+    return True
+
+
+CETIRIZINE_AGE_KEYS = ("6_to_11_months", "12_to_23_months", "2_to_5_years", "6_to_11_years", "above_or_equal_6", "above_or_equal_12")
+CETIRIZINE_ANAPHYLAXIS_AGE_KEYS = ("6_to_23_months", "2_to_5_years", "above_5")
+
+
+def _cetirizine(r, data, path, indication):
+    if not _object(r, data, path):
+        return True
+    known = CETIRIZINE_ANAPHYLAXIS_AGE_KEYS if indication == "Anaphylaxis (adjunctive only)" else CETIRIZINE_AGE_KEYS
+    for age_key, profile in data.items():
+        profile_path = f"{path}.{age_key}"
+        if age_key not in known:
+            r.warn(profile_path, "ไม่มีช่วงอายุนี้ใน calculator")
+        if not isinstance(profile, dict):
+            r.error(profile_path, "ต้องเป็น object")
+            continue
+        r.require(profile, profile_path, "frequency", _frequency, "จำนวนครั้ง/วัน หรือ list")
+        _limits(r, profile, profile_path)
+        if "dose_range_mg" in profile:
+            r.error(profile_path, "ใช้ชื่อ dose_range_mg (ต้องเป็น dose_mg_range)")
+        if "initial_dose_mg" in profile or "options" in profile:
+            r.require(profile, profile_path, "initial_dose_mg", _positive, "ตัวเลข > 0")
+            r.require(
+                profile, profile_path, "options",
+                lambda v: isinstance(v, list) and all(isinstance(o, dict) and _positive(o.get("dose_mg")) and _frequency(o.get("frequency")) for o in v),
+                "list ของ {dose_mg, frequency}",
+            )
+            continue
+        if not r.exclusive(profile, profile_path, ("dose_mg_range", "dose_mg")):
+            r.error(profile_path, "ไม่มี dose_mg_range / dose_mg / initial_dose_mg")
+        r.optional(profile, profile_path, "dose_mg_range", _positive_list, "list ของขนาดยา")
+        r.optional(profile, profile_path, "dose_mg", _positive, "ตัวเลข > 0")
+    if "6_to_11_years" in data and "above_or_equal_6" in data:
+        r.warn(f"{path}.above_or_equal_6", "ถูกบังด้วย 6_to_11_years")
+    return True
+
+
+def _ferrous(r, data, path, indication):
+    profile = data.get("all_ages") if _object(r, data, path) else {}
+    if not isinstance(profile, dict):
+        r.error(path, "ไม่มี all_ages")
+        return True
+    profile_path = f"{path}.all_ages"
+    r.require(profile, profile_path, "initial_dose_mg_per_kg_per_day", _positive, "ตัวเลข > 0")
+    r.require(profile, profile_path, "max_dose_range_mg_per_day", _range, "[ต่ำสุด, สูงสุด]")
+    r.optional(profile, profile_path, "usual_max_mg_per_day", _positive, "ตัวเลข > 0")
+    r.optional(profile, profile_path, "absolute_max_mg_per_day", _positive, "ตัวเลข > 0")
+    return True
+
+
+def _per_dose_groups(r, data, path, indication):
+    # Domperidone / Chlorpheniramine แสดง max_mg_per_day ทุกกลุ่ม
+    for group, group_path in _groups(r, data, path, ("dose_mg_per_kg_per_dose", "dose_mg")):
+        r.require(group, group_path, "max_mg_per_day", _positive, "ตัวเลข > 0")
+        r.optional(group, group_path, "max_mg_per_dose", _positive, "ตัวเลข > 0")
+        r.optional(group, group_path, "dose_mg_per_kg_per_dose", _positive, "ตัวเลข > 0")
+        r.optional(group, group_path, "dose_mg", _positive, "ตัวเลข > 0")
+    return True
+
+
+def _salbutamol(r, data, path, indication):
+    for group, group_path in _groups(r, data, path, ("dose_mg_per_kg_per_dose", "dose_mg", "dose_mg_range")):
+        if "dose_mg_per_kg_per_dose" in group:
+            r.require(group, group_path, "dose_mg_per_kg_per_dose", _positive_list, "list ของ mg/kg/dose")
+            limits = group.get("max_mg_per_dose")
+            doses = group["dose_mg_per_kg_per_dose"]
+            if limits is not None and (not _positive_list(limits) or len(limits) != len(doses)):
+                r.error(group_path, "max_mg_per_dose ต้องเป็น list ยาวเท่ากับ dose_mg_per_kg_per_dose")
+        elif "max_mg_per_dose" in group:
+            r.optional(group, group_path, "max_mg_per_dose", _positive, "ตัวเลข > 0")
+        r.optional(group, group_path, "dose_mg", _positive, "ตัวเลข > 0")
+        r.optional(group, group_path, "dose_mg_range", _positive_list, "list ของขนาดยา")
+        if "dose_mg_range" in group and not isinstance(group.get("frequency"), list):
+            r.error(group_path, "frequency ต้องเป็น list เมื่อใช้ dose_mg_range")
+    return True
+
+
+def _ibuprofen(r, data, path, indication):
+    if not isinstance(data, list) or not data:
+        r.error(path, "ต้องเป็น list")
+        return True
+    for i, item in enumerate(data):
+        item_path = f"{path}[{i}]"
+        if not isinstance(item, dict):
+            r.error(item_path, "ต้องเป็น object")
+            continue
+        if item.get("type") != "weight_based":
+            r.warn(item_path, "type ไม่ใช่ weight_based (calculator ข้าม)")
+            continue
+        if not r.exclusive(item, item_path, ("dose_mg_per_kg_per_dose", "dose_mg_per_kg_per_day")):
+            r.error(item_path, "ไม่มี dose_mg_per_kg_per_dose / dose_mg_per_kg_per_day")
+        r.optional(item, item_path, "dose_mg_per_kg_per_dose", _positive_list, "list ของ mg/kg/dose")
+        r.optional(item, item_path, "dose_mg_per_kg_per_day", _positive_list, "list ของ mg/kg/day")
+        if "dose_mg_per_kg_per_dose" in item:
+            r.require(item, item_path, "frequency", _text, "ข้อความ เช่น 'ทุก 6–8 ชม.'")
+        r.optional(item, item_path, "divided_doses", _count, "จำนวนครั้ง/วัน")
+        _limits(r, item, item_path)
+    return True
+
+
+def _paracetamol(r, data, path, indication):
+    if not _object(r, data, path):
+        return True
+    r.require(data, path, "dose_mg_per_kg_per_dose", _range, "[ต่ำสุด, สูงสุด]")
+    r.require(data, path, "frequency", _text, "ข้อความ")
+    _limits(r, data, path)
+    return True
+
+
+SPECIAL_CHECKERS = {
+    "Carbocysteine": _carbocysteine,
+    "Hydroxyzine": _hydroxyzine,
+    "Cetirizine": _cetirizine,
+    "Ferrous drop": _ferrous,
+    "Domperidone": _per_dose_groups,
+    "Chlorpheniramine": _per_dose_groups,
+    "Salbutamol": _salbutamol,
+    "Ibuprofen": _ibuprofen,
+    "Paracetamol": _paracetamol,
+    "Paracetamol drop": _paracetamol,
+}
+# calculate_special_drug ใช้ข้อบ่งใช้แรกของยาเหล่านี้เสมอ ไม่ว่าผู้ใช้เลือกข้อไหน
+FIRST_INDICATION_ONLY = {"Paracetamol", "Paracetamol drop"}
+
+
+def check_special_drugs(special_drugs, r):
+    for drug, info in special_drugs.items():
+        path = f"SPECIAL_DRUGS.{drug}"
+        if not _common(r, info, path):
+            continue
+        checker = SPECIAL_CHECKERS.get(drug)
+        if checker is None:
+            r.error(path, "ไม่มี branch ใน calculate_special_drug")
+            continue
+        for i, (name, data) in enumerate(info["indications"].items()):
+            ind_path = f"{path}[{name!r}]"
+            if drug in FIRST_INDICATION_ONLY and i > 0:
+                r.warn(ind_path, "calculator ใช้ข้อบ่งใช้แรกเสมอ")
+                continue
+            if not checker(r, data, ind_path, name):
+                r.warn(ind_path, "ไม่มี branch ใน calculate_special_drug (ผู้ใช้จะได้ 'ยังไม่รองรับ')")
+
+
+def validate(drugs, special_drugs):
+    r = Report()
+    if isinstance(drugs, dict):
+        check_drug_database(drugs, r)
+    if isinstance(special_drugs, dict):
+        check_special_drugs(special_drugs, r)
+    return r
+
+
+def check_schema(drugs, special_drugs):
+    """validator ของ FormularyStore: คืน error ทั้งหมด (ว่าง = ผ่าน)"""
+    return validate(drugs, special_drugs).errors
+
+
+def find_unreachable(drugs, special_drugs):
+    """linter ของ FormularyStore: คืน warning (ไม่บล็อกการโหลด)"""
+    return validate(drugs, special_drugs).warnings
+
+
+def unsupported_indications(drugs):
+    r = Report()
+    check_drug_database(drugs, r)
+    return frozenset(r.unsupported)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        with open(argv[0], encoding="utf-8") as f:
+            data = json.load(f)
+        drugs, special_drugs = data.get("DRUG_DATABASE"), data.get("SPECIAL_DRUGS")
+    else:
+        import app
+        drugs, special_drugs = app.formulary_store.current.drugs, app.formulary_store.current.special_drugs
+
+    report = validate(drugs, special_drugs)
+    for problem in report.errors:
+        sys.stdout.write(f"❌ {problem}\n")
+    for problem in report.warnings:
+        sys.stdout.write(f"⚠️ {problem}\n")
+    sys.stdout.write(f"{len(report.errors)} error, {len(report.warnings)} warning\n")
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
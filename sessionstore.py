@@ -0,0 +1,725 @@
+"""
+เก็บ session ของผู้ใช้และ cache ผลการคำนวณไว้ที่ server ที่พูด Redis protocol (RESP) เพื่อรันหลาย node ได้
+
+- RespClient: client RESP2 ขนาดเล็ก (ไม่ต้องติดตั้ง redis-py) มี connection pool และ pipeline
+  (ส่งหลายคำสั่งแล้วอ่านผลทีเดียว = 1 round-trip)
+- ค่าเก็บเป็น binary แบบ compact (pack/unpack: tag 1 byte + varint, ข้อความยาวบีบอัดด้วย zlib)
+  รองรับ None/bool/int/float/str/list/tuple/dict/date ตามที่ session ใช้จริง
+- SessionStore: session ของผู้ใช้ 1 key ต่อ namespace (sessions / drug_selection / ages / inr_followups)
+  ตอนเริ่ม event โหลดทุก namespace ของผู้ใช้ด้วย MGET ครั้งเดียว โค้ดเดิมแก้ dict ได้ตามปกติ
+  (session["step"] = ...) แล้วตอนจบ event เขียนเฉพาะ key ที่เปลี่ยนกลับใน pipeline เดียว พร้อม TTL ฝั่ง server
+  session อ่านจาก server ทุก event (node อื่นอาจเพิ่งเขียน) จึงไม่มี near-cache
+- ReplyCache: ผลการคำนวณ (ขึ้นกับ formulary version + input เท่านั้น ไม่มีวันเปลี่ยน) เก็บที่ server ร่วมกันทุก node
+  พร้อม near-cache LRU ในเครื่อง ซึ่งปลอดภัยเพราะค่าไม่เปลี่ยน
+- FakeRedisServer: server RESP ใน process (GET/SET/MGET/DEL/PEXPIRE/PTTL/SCAN ...) สำหรับทดสอบและ dev
+    python sessionstore.py selftest             # ทดสอบสอง node บน fake server (session ข้าม node, TTL, pipeline)
+    python sessionstore.py bench                # round-trip แบบ pipeline เทียบทีละคำสั่ง, ขนาด binary เทียบ JSON
+    python sessionstore.py serve --port 6380    # รัน fake server สำหรับลองหลาย node บนเครื่องเดียว
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import date
+from urllib.parse import urlparse
+
+# ---------- ค่าแบบ binary ----------
+
+_DOUBLE = struct.Struct(">d")
+COMPRESS_MIN = 128
+
+
+def _varint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _pack(value, out):
+    if value is None:
+        out.append(0x4E)  # N
+    elif value is True:
+        out.append(0x54)  # T
+    elif value is False:
+        out.append(0x46)  # F
+    elif isinstance(value, int):
+        if not -(1 << 63) <= value < (1 << 63):
+            raise ValueError(f"int เกิน 64 bit: {value}")
+        out.append(0x69)  # i (zigzag varint)
+        _varint((value << 1) ^ (value >> 63), out)
+    elif isinstance(value, float):
+        out.append(0x64)  # d
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        raw = value.encode("utf-8")
+        if len(raw) >= COMPRESS_MIN:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                out.append(0x7A)  # z
+                _varint(len(packed), out)
+                out += packed
+                return
+        out.append(0x73)  # s
+        _varint(len(raw), out)
+        out += raw
+    elif isinstance(value, date):
+        out.append(0x44)  # D
+        _varint(value.toordinal(), out)
+    elif isinstance(value, (list, tuple)):
+        out.append(0x6C if isinstance(value, list) else 0x75)  # l / u
+        _varint(len(value), out)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        out.append(0x6D)  # m
+        _varint(len(value), out)
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise TypeError(f"pack ไม่รองรับ {type(value).__name__}")
+
+
+def pack(value):
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _unpack(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == 0x4E:
+        return None, pos
+    if tag == 0x54:
+        return True, pos
+    if tag == 0x46:
+        return False, pos
+    if tag == 0x69:
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if tag == 0x64:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    if tag in (0x73, 0x7A):
+        size, pos = _read_varint(data, pos)
+        raw = bytes(data[pos:pos + size])
+        return (zlib.decompress(raw) if tag == 0x7A else raw).decode("utf-8"), pos + size
+    if tag == 0x44:
+        n, pos = _read_varint(data, pos)
+        return date.fromordinal(n), pos
+    if tag in (0x6C, 0x75):
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return (items if tag == 0x6C else tuple(items)), pos
+    if tag == 0x6D:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            key, pos = _unpack(data, pos)
+            result[key], pos = _unpack(data, pos)
+        return result, pos
+    raise ValueError(f"tag ไม่รู้จัก: {tag:#x}")
+
+
+def unpack(data):
+    value, pos = _unpack(memoryview(data), 0)
+    if pos != len(data):
+        raise ValueError("ข้อมูลเกินมา")
+    return value
+
+
+# ---------- RESP client ----------
+
+class RespError(Exception):
+    """error reply จาก server (-ERR ...)"""
+
+
+def _encode(args):
+    out = bytearray(b"*%d\r\n" % len(args))
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, (int, float)):
+            arg = str(arg).encode()
+        out += b"$%d\r\n%s\r\n" % (len(arg), arg)
+    return out
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("server ปิดการเชื่อมต่อ")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RespError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = reader.read(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [_read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"reply ไม่ถูกต้อง: {line!r}")
+
+
+class _Connection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RespClient:
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=2.0, pool_size=16):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.round_trips = 0
+        self._pool = queue.LifoQueue(pool_size)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """redis://[:password@]host[:port][/db]"""
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db=db, password=parsed.password, **kwargs)
+
+    def _connect(self):
+        conn = _Connection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for reply in self._send(conn, setup):
+            if isinstance(reply, RespError):
+                conn.close()
+                raise reply
+        return conn
+
+    def _send(self, conn, commands):
+        if not commands:
+            return []
+        conn.sock.sendall(b"".join(_encode(c) for c in commands))
+        return [_read_reply(conn.reader) for _ in commands]
+
+    def pipeline(self, commands):
+        """ส่งทุกคำสั่งใน round-trip เดียว คืน list ของผล (error reply เป็น RespError ในตำแหน่งนั้น)"""
+        if not commands:
+            return []
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            replies = self._send(conn, commands)
+        except BaseException:
+            conn.close()  # สถานะของ connection ไม่แน่นอนแล้ว ไม่คืนเข้า pool
+            raise
+        self.round_trips += 1
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return replies
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def scan(self, match, count=1000):
+        cursor = b"0"
+        while True:
+            cursor, keys = self.execute("SCAN", cursor, "MATCH", match, "COUNT", count)
+            yield from keys
+            if cursor in (b"0", 0):
+                return
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# ---------- session ----------
+
+_MISSING = object()
+
+
+class SessionStore:
+    def __init__(self, client, namespaces, ttl_sec=86400, ttls=None, prefix="linebot:"):
+        self.client = client
+        self.namespaces = tuple(namespaces)
+        self.ttl_ms = {ns: int((ttls or {}).get(ns, ttl_sec) * 1000) for ns in self.namespaces}
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def key(self, namespace, user_id):
+        return f"{self.prefix}{namespace}:{user_id}"
+
+    def view(self, namespace):
+        return SessionView(self, namespace)
+
+    # ---------- scope ต่อ event ----------
+
+    def _scope(self):
+        return getattr(self._local, "scope", None)
+
+    def begin(self, user_id):
+        keys = [self.key(ns, user_id) for ns in self.namespaces]
+        raw = self.client.execute("MGET", *keys)
+        self._local.scope = {
+            "user_id": user_id,
+            "loaded": dict(zip(self.namespaces, raw)),
+            "values": {ns: _MISSING if data is None else unpack(data) for ns, data in zip(self.namespaces, raw)},
+        }
+
+    def commit(self):
+        """เขียนเฉพาะ namespace ที่เปลี่ยน (เทียบ binary กับตอนโหลด) ใน pipeline เดียว"""
+        scope = self._local.scope
+        self._local.scope = None
+        commands = []
+        for ns in self.namespaces:
+            value = scope["values"][ns]
+            data = None if value is _MISSING else pack(value)
+            if data == scope["loaded"][ns]:
+                continue
+            key = self.key(ns, scope["user_id"])
+            if data is None:
+                commands.append(("DEL", key))
+            else:
+                commands.append(("SET", key, data, "PX", self.ttl_ms[ns]))
+        for reply in self.client.pipeline(commands):
+            if isinstance(reply, RespError):
+                raise reply
+
+    def scope(self, func):
+        """decorator ของ handler(event): โหลด session ของผู้ส่งก่อน แล้วเขียนกลับเมื่อจบ (แม้ handler จะ raise)"""
+        def wrapper(event, *args):
+            user_id = getattr(getattr(event, "source", None), "user_id", None)
+            if user_id is None or self._scope() is not None:
+                return func(event)
+            self.begin(user_id)
+            try:
+                return func(event)
+            finally:
+                self.commit()
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+
+
+class SessionView(MutableMapping):
+    """
+    dict ของ user_id → ค่า ใน namespace หนึ่ง
+    ผู้ใช้ของ event ปัจจุบันอ่าน/เขียนใน scope (แก้ค่าข้างในได้เหมือน dict ปกติ)
+    ผู้ใช้อื่นหรือเรียกนอก scope จะอ่าน/เขียนตรงไปที่ server (แก้ค่าข้างในแล้วต้อง assign กลับเอง)
+    """
+
+    def __init__(self, store, namespace):
+        self._store = store
+        self._ns = namespace
+
+    def _scoped(self, user_id):
+        scope = self._store._scope()
+        if scope is not None and scope["user_id"] == user_id:
+            return scope["values"]
+        return None
+
+    def __getitem__(self, user_id):
+        values = self._scoped(user_id)
+        if values is not None:
+            value = values[self._ns]
+        else:
+            data = self._store.client.execute("GET", self._store.key(self._ns, user_id))
+            value = _MISSING if data is None else unpack(data)
+        if value is _MISSING:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id, value):
+        values = self._scoped(user_id)
+        if values is not None:
+            values[self._ns] = value
+            return
+        self._store.client.execute(
+            "SET", self._store.key(self._ns, user_id), pack(value), "PX", self._store.ttl_ms[self._ns]
+        )
+
+    def __delitem__(self, user_id):
+        values = self._scoped(user_id)
+        if values is not None:
+            if values[self._ns] is _MISSING:
+                raise KeyError(user_id)
+            values[self._ns] = _MISSING
+            return
+        if not self._store.client.execute("DEL", self._store.key(self._ns, user_id)):
+            raise KeyError(user_id)
+
+    def __contains__(self, user_id):
+        values = self._scoped(user_id)
+        if values is not None:
+            return values[self._ns] is not _MISSING
+        return bool(self._store.client.execute("EXISTS", self._store.key(self._ns, user_id)))
+
+    def __iter__(self):
+        start = len(self._store.key(self._ns, ""))
+        for key in self._store.client.scan(self._store.key(self._ns, "*")):
+            yield key[start:].decode("utf-8")
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# ---------- reply cache ----------
+
+class ReplyCache:
+    """ผลการคำนวณที่ไม่เปลี่ยน (key รวม formulary version) ใช้ร่วมกันทุก node + near-cache ในเครื่อง"""
+
+    def __init__(self, client, ttl_sec=86400, near_size=4096, prefix="linebot:reply:"):
+        self.client = client
+        self.ttl_ms = int(ttl_sec * 1000)
+        self.near_size = near_size
+        self.prefix = prefix
+        self.hits = {"near": 0, "remote": 0}
+        self.misses = 0
+        self._near = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, parts):
+        digest = hashlib.blake2b(json.dumps(parts, ensure_ascii=False).encode("utf-8"), digest_size=16)
+        return self.prefix + digest.hexdigest()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._near[key] = value
+            self._near.move_to_end(key)
+            if len(self._near) > self.near_size:
+                self._near.popitem(last=False)
+
+    def get_or_compute(self, parts, compute):
+        key = self._key(parts)
+        with self._lock:
+            value = self._near.get(key)
+            if value is not None:
+                self._near.move_to_end(key)
+                self.hits["near"] += 1
+                return value
+        data = self.client.execute("GET", key)
+        if data is not None:
+            value = unpack(data)
+            self.hits["remote"] += 1
+        else:
+            value = compute()
+            self.misses += 1
+            self.client.execute("SET", key, pack(value), "PX", self.ttl_ms)
+        self._remember(key, value)
+        return value
+
+    def status(self):
+        return {"hits": dict(self.hits), "misses": self.misses, "near_size": len(self._near)}
+
+
+# ---------- fake server ----------
+
+class FakeRedisServer:
+    """server RESP2 ใน process (คำสั่งชุดเล็กที่ client นี้ใช้) ค่าหมดอายุแบบ lazy ตอนเข้าถึง"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                while True:
+                    try:
+                        args = _read_reply(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    out = bytearray()
+                    fake._respond(out, fake.run(args))
+                    self.wfile.write(bytes(out))
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server((host, port), Handler)
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    def _respond(self, out, value):
+        if isinstance(value, RespError):
+            out += b"-%s\r\n" % str(value).encode()
+        elif value is None:
+            out += b"$-1\r\n"
+        elif isinstance(value, bool):
+            out += b":%d\r\n" % int(value)
+        elif isinstance(value, int):
+            out += b":%d\r\n" % value
+        elif isinstance(value, str):
+            out += b"+%s\r\n" % value.encode()
+        elif isinstance(value, (bytes, bytearray)):
+            out += b"$%d\r\n%s\r\n" % (len(value), value)
+        else:
+            out += b"*%d\r\n" % len(value)
+            for item in value:
+                self._respond(out, item)
+
+    def _alive(self, key, now):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= now:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def run(self, args):
+        if not isinstance(args, list) or not args:
+            return RespError("ERR protocol error")
+        command = args[0].decode().upper()
+        args = args[1:]
+        now = time.monotonic()
+        with self._lock:
+            self.commands += 1
+            if command == "PING":
+                return "PONG"
+            if command in ("AUTH", "SELECT", "FLUSHDB"):
+                if command == "FLUSHDB":
+                    self.data.clear()
+                    self.expires.clear()
+                return "OK"
+            if command == "GET":
+                return self.data[args[0]] if self._alive(args[0], now) else None
+            if command == "MGET":
+                return [self.data[k] if self._alive(k, now) else None for k in args]
+            if command == "SET":
+                key, value, options = args[0], args[1], [a.decode().upper() for a in args[2:]]
+                ttl = None
+                if "PX" in options:
+                    ttl = int(options[options.index("PX") + 1]) / 1000
+                elif "EX" in options:
+                    ttl = int(options[options.index("EX") + 1])
+                if "NX" in options and self._alive(key, now):
+                    return None
+                self.data[key] = value
+                if ttl is None:
+                    self.expires.pop(key, None)
+                else:
+                    self.expires[key] = now + ttl
+                return "OK"
+            if command == "DEL":
+                count = 0
+                for key in args:
+                    if self._alive(key, now):
+                        del self.data[key]
+                        self.expires.pop(key, None)
+                        count += 1
+                return count
+            if command == "EXISTS":
+                return sum(1 for key in args if self._alive(key, now))
+            if command == "PEXPIRE":
+                if not self._alive(args[0], now):
+                    return 0
+                self.expires[args[0]] = now + int(args[1]) / 1000
+                return 1
+            if command == "PTTL":
+                if not self._alive(args[0], now):
+                    return -2
+                expires = self.expires.get(args[0])
+                return -1 if expires is None else int((expires - now) * 1000)
+            if command == "DBSIZE":
+                return sum(1 for key in list(self.data) if self._alive(key, now))
+            if command == "SCAN":
+                pattern = "*"
+                if b"MATCH" in [a.upper() for a in args]:
+                    pattern = args[[a.upper() for a in args].index(b"MATCH") + 1].decode()
+                keys = [k for k in list(self.data) if self._alive(k, now) and fnmatch.fnmatchcase(k.decode(), pattern)]
+                return [b"0", keys]
+        return RespError(f"ERR unknown command '{command}'")
+
+
+# ---------- selftest / bench ----------
+
+def selftest():
+    server = FakeRedisServer().start()
+    try:
+        namespaces = ("sessions", "drug_selection", "ages", "inr_followups")
+        nodes = [SessionStore(RespClient.from_url(server.url), namespaces, ttl_sec=0.3,
+                              ttls={"inr_followups": 60}) for _ in range(2)]
+        views = [{ns: node.view(ns) for ns in namespaces} for node in nodes]
+
+        class Event:
+            def __init__(self, user_id):
+                self.source = type("Source", (), {"user_id": user_id})()
+
+        @nodes[0].scope
+        def first(event):
+            views[0]["sessions"][event.source.user_id] = {"flow": "warfarin", "step": "ask_inr"}
+            views[0]["sessions"][event.source.user_id]["inr"] = 2.5  # แก้ค่าข้างใน dict เหมือนโค้ดเดิม
+            views[0]["inr_followups"][event.source.user_id] = date(2026, 1, 2)
+
+        @nodes[1].scope
+        def second(event):
+            session = views[1]["sessions"][event.source.user_id]
+            session["step"] = "ask_twd"
+            return dict(session)
+
+        first(Event("U1"))
+        before = nodes[1].client.round_trips
+        assert second(Event("U1")) == {"flow": "warfarin", "step": "ask_twd", "inr": 2.5}, "session ข้าม node"
+        assert nodes[1].client.round_trips - before == 2, "ต้องใช้ MGET 1 ครั้ง + pipeline เขียน 1 ครั้ง"
+        assert views[0]["sessions"]["U1"]["step"] == "ask_twd"
+        assert views[0]["inr_followups"]["U1"] == date(2026, 1, 2)
+        assert sorted(views[0]["sessions"]) == ["U1"] and len(views[1]["sessions"]) == 1
+
+        @nodes[0].scope
+        def read_only(event):
+            return views[0]["sessions"].get(event.source.user_id)
+
+        before = nodes[0].client.round_trips
+        read_only(Event("U1"))
+        assert nodes[0].client.round_trips - before == 1, "ไม่เปลี่ยนค่า → ไม่เขียนกลับ"
+
+        time.sleep(0.35)
+        assert "U1" not in views[0]["sessions"], "TTL ฝั่ง server"
+        assert "U1" in views[0]["inr_followups"], "TTL แยกต่อ namespace"
+
+        cache = ReplyCache(RespClient.from_url(server.url), near_size=2)
+        other = ReplyCache(RespClient.from_url(server.url))
+        assert cache.get_or_compute(["v1", "Amoxicillin", 10.0], lambda: "ผล") == "ผล"
+        assert other.get_or_compute(["v1", "Amoxicillin", 10.0], lambda: "ผิด") == "ผล", "ใช้ร่วมกันข้าม node"
+        assert cache.get_or_compute(["v1", "Amoxicillin", 10.0], lambda: "ผิด") == "ผล"
+        assert cache.hits["near"] == 1 and other.hits["remote"] == 1
+
+        for value in (None, True, 0, -1, 2 ** 62, 1.5, "", "ไทย" * 100, [1, (2, 3)], {"a": {1: None}},
+                      date(2026, 10, 19)):
+            assert unpack(pack(value)) == value and type(unpack(pack(value))) is type(value), value
+        sys.stdout.write("✅ selftest ผ่าน\n")
+        return 0
+    finally:
+        server.stop()
+
+
+def bench(users=2000):
+    server = FakeRedisServer().start()
+    try:
+        client = RespClient.from_url(server.url)
+        session = {"flow": "warfarin", "step": "choose_interaction", "inr": 2.4, "twd": 28.0,
+                   "bleeding": "no", "supplement": "กระเทียม, ขมิ้น"}
+        selection = {"drug": "Amoxicillin", "indication": "Acute Otitis Media (AOM)"}
+        sizes = (len(pack(session)) + len(pack(selection)), len(json.dumps(session)) + len(json.dumps(selection)))
+
+        keys = [[f"b:{ns}:U{i}" for ns in ("sessions", "drug_selection", "ages", "inr_followups")]
+                for i in range(users)]
+        for user_keys in keys:
+            client.pipeline([("SET", user_keys[0], pack(session)), ("SET", user_keys[1], pack(selection))])
+
+        started = time.perf_counter()
+        for user_keys in keys:
+            for key in user_keys:
+                client.execute("GET", key)
+        one_by_one = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for user_keys in keys:
+            client.execute("MGET", *user_keys)
+        pipelined = time.perf_counter() - started
+        return users, one_by_one, pipelined, sizes
+    finally:
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="session / reply cache บน Redis protocol")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("selftest")
+    sub.add_parser("bench")
+    p = sub.add_parser("serve")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args(argv)
+
+    if args.command == "selftest":
+        return selftest()
+    if args.command == "serve":
+        server = FakeRedisServer(args.host, args.port).start()
+        sys.stdout.write(f"fake redis: {server.url}\n")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+        return 0
+
+    users, one_by_one, pipelined, (binary, as_json) = bench()
+    sys.stdout.write(
+        f"{users} ผู้ใช้ × 4 namespace: GET ทีละ key {one_by_one / users * 1e6:.0f} µs/ผู้ใช้, "
+        f"MGET {pipelined / users * 1e6:.0f} µs/ผู้ใช้ ({one_by_one / pipelined:.1f}x)\n"
+        f"ขนาด session ตัวอย่าง: binary {binary} bytes, JSON {as_json} bytes\n"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
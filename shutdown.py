@@ -0,0 +1,275 @@
+"""
+ปิด process อย่างนุ่มนวลเมื่อได้ SIGTERM (Render / Cloud Run ส่งก่อน kill ตอน deploy หรือ scale down)
+
+- ShutdownCoordinator ทำตามลำดับ แล้วจับเวลาแต่ละ phase:
+  1. intake   หยุดรับ event ใหม่ (/callback ตอบ 503 ให้ LINE ส่งซ้ำไปยัง instance อื่น, /ready ตอบ 503)
+  2. drain    รอ event ที่กำลังประมวลผลให้เสร็จภายใน drain_sec (consumer ของคิวหยุด claim, handler ที่ tracked นับ in-flight)
+  3. flush    เรียก step ที่ลงทะเบียนไว้แบบเดียวกับ atexit (ลงทะเบียนทีหลัง → ทำก่อน) เช่น audit log, trace, outbox
+  4. sessions เขียน session ที่อยู่ในหน่วยความจำลงไฟล์ snapshot ให้ instance ถัดไปโหลดตอนเริ่ม
+- signal handler เดิม (เช่นของ gunicorn) ยังถูกเรียกต่อ ถ้าไม่มีจะรอให้ปิดเสร็จแล้ว exit
+- SessionSnapshot: ไฟล์ binary ขนาดเล็ก (pack ของ sessionstore + zlib) เขียนแบบ atomic และไม่โหลด snapshot ที่เก่าเกิน max_age_sec
+  แต่ละ worker เขียนไฟล์ของตัวเอง (<path>.<pid>) ตอนเริ่มจะ claim ทุกไฟล์ด้วย rename รวม session แล้วลบทิ้ง
+  (restart ซ้ำภายใน TTL จึงไม่โหลด session เก่ากลับมาอีก)
+    python shutdown.py inspect sessions.snap.12345    # ดูจำนวน session ในไฟล์ snapshot
+"""
+import argparse
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import zlib
+from functools import wraps
+
+from sessionstore import pack, unpack
+
+SNAPSHOT_MAGIC = b"LDBSESS1"
+
+
+class SessionSnapshot:
+    def __init__(self, path, max_age_sec=86400.0):
+        self.path = path
+        self.max_age_sec = max_age_sec
+
+    @property
+    def worker_path(self):
+        # gunicorn หลาย worker ปิดพร้อมกัน → แยกไฟล์ต่อ pid ไม่ให้เขียนทับกัน
+        return f"{self.path}.{os.getpid()}"
+
+    def save(self, namespaces):
+        """namespaces: {ชื่อ: dict ของ user_id → ค่า} คืนจำนวน session ที่เขียน"""
+        payload = {"saved_at": time.time(), "namespaces": {name: dict(data) for name, data in namespaces.items()}}
+        blob = SNAPSHOT_MAGIC + zlib.compress(pack(payload), 6)
+        tmp = f"{self.worker_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.worker_path)
+        return sum(len(data) for data in payload["namespaces"].values())
+
+    def read(self, path=None):
+        path = path or self.path
+        with open(path, "rb") as f:
+            blob = f.read()
+        if not blob.startswith(SNAPSHOT_MAGIC):
+            raise ValueError(f"{path}: ไม่ใช่ไฟล์ session snapshot")
+        return unpack(zlib.decompress(blob[len(SNAPSHOT_MAGIC):]))
+
+    def _files(self):
+        directory, base = os.path.split(self.path)
+        pattern = re.compile(re.escape(base) + r"(\.\d+)?")
+        try:
+            names = os.listdir(directory or ".")
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in names if pattern.fullmatch(name)]
+
+    def _claim(self, path):
+        """rename เป็นของ process นี้ก่อนอ่าน (worker อื่นที่เริ่มพร้อมกันจะไม่ได้ไฟล์เดียวกัน) อ่านแล้วลบทิ้ง"""
+        claimed = f"{path}.loading-{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        try:
+            return self.read(claimed)
+        finally:
+            os.remove(claimed)
+
+    def load(self):
+        """คืน {ชื่อ: dict} รวมจากทุกไฟล์ snapshot (ไม่มีไฟล์ / เสีย / เก่าเกินไป → {})"""
+        payloads = []
+        for path in self._files():
+            try:
+                payload = self._claim(path)
+            except Exception as e:
+                logging.info(f"⚠️ อ่าน session snapshot {path} ไม่ได้: {e}")
+                continue
+            if payload is None:
+                continue
+            age = time.time() - payload["saved_at"]
+            if age > self.max_age_sec:
+                logging.info(f"⚠️ session snapshot {path} เก่า {age / 3600:.1f} ชั่วโมง → ไม่โหลด")
+                continue
+            payloads.append(payload)
+        namespaces = {}
+        for payload in sorted(payloads, key=lambda p: p["saved_at"]):  # ไฟล์ใหม่กว่าทับ user เดียวกัน
+            for name, data in payload["namespaces"].items():
+                namespaces.setdefault(name, {}).update(data)
+        if payloads:
+            logging.info(f"♻️ โหลด session {sum(len(d) for d in namespaces.values())} รายการจาก snapshot {len(payloads)} ไฟล์")
+        return namespaces
+
+
+class ShutdownCoordinator:
+    def __init__(self, drain_sec=8.0, snapshot=None, sessions=None):
+        self.drain_sec = drain_sec
+        self.snapshot = snapshot
+        self.sessions = sessions or {}
+        self.reason = None
+        self.timings_ms = {}
+        self.flush_ms = {}
+        self.errors = {}
+        self.abandoned = 0
+        self._draining = threading.Event()
+        self._done = threading.Event()
+        self._inflight = 0
+        self._idle = threading.Condition()
+        self._drain_steps = []
+        self._flush_steps = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def draining(self):
+        return self._draining.is_set()
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def tracked(self, func):
+        """decorator: นับงานที่กำลังทำ (phase drain รอจนเหลือ 0)"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._idle:
+                self._inflight += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._idle:
+                    self._inflight -= 1
+                    if not self._inflight:
+                        self._idle.notify_all()
+        return wrapper
+
+    def on_drain(self, name, func):
+        """func(timeout) ถูกเรียกตอน drain ก่อนรอ in-flight เช่น หยุด consumer ของคิว"""
+        self._drain_steps.append((name, func))
+
+    def register(self, name, func, *args, **kwargs):
+        """step ของ phase flush ลำดับแบบ atexit (ลงทะเบียนทีหลังทำก่อน)"""
+        self._flush_steps.append((name, func, args, kwargs))
+
+    # ---------- การปิด ----------
+
+    def _phase(self, name, func):
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            self.errors[name] = f"{type(e).__name__}: {e}"
+            logging.info(f"❌ shutdown {name} ผิดพลาด: {e}")
+        self.timings_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _drain(self):
+        deadline = time.monotonic() + self.drain_sec
+        for name, func in self._drain_steps:
+            func(max(0.0, deadline - time.monotonic()))
+        with self._idle:
+            self._idle.wait_for(lambda: not self._inflight, max(0.0, deadline - time.monotonic()))
+            self.abandoned = self._inflight
+        if self.abandoned:
+            logging.info(f"⏱️ ครบ {self.drain_sec:g}s แล้วยังมี {self.abandoned} event ไม่เสร็จ")
+
+    def _flush(self):
+        for name, func, args, kwargs in reversed(self._flush_steps):
+            started = time.perf_counter()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.errors[f"flush:{name}"] = f"{type(e).__name__}: {e}"
+                logging.info(f"❌ flush {name} ไม่สำเร็จ: {e}")
+            self.flush_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _save_sessions(self):
+        if self.snapshot is None:
+            return
+        count = self.snapshot.save(self.sessions)
+        logging.info(f"💾 เขียน session {count} รายการลง {self.snapshot.worker_path}")
+
+    def _run(self):
+        started = time.perf_counter()
+        self._phase("intake", self._draining.set)
+        self._phase("drain", self._drain)
+        self._phase("flush", self._flush)
+        self._phase("sessions", self._save_sessions)
+        self.timings_ms["total"] = round((time.perf_counter() - started) * 1000, 1)
+        logging.info(f"👋 shutdown ({self.reason}) เสร็จใน {self.timings_ms['total']:.0f} ms "
+                     f"{self.timings_ms} flush {self.flush_ms}")
+        self._done.set()
+
+    def begin(self, reason="exit"):
+        """เริ่มปิดใน background thread (เรียกซ้ำได้) แล้วคืนทันที"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.reason = reason
+            self._draining.set()
+            self._thread = threading.Thread(target=self._run, name="shutdown")
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def shutdown(self, reason="exit"):
+        """ปิดแล้วรอจนเสร็จ (ใช้กับ atexit ซึ่งสร้าง thread ใหม่ไม่ได้ จึงทำใน thread ปัจจุบัน)"""
+        with self._lock:
+            inline = self._thread is None
+            if inline:
+                self.reason = reason
+                self._draining.set()
+                self._thread = threading.current_thread()
+        if inline:
+            self._run()
+        self.wait()
+
+    def install(self, signals=(signal.SIGTERM,)):
+        """ติดตั้ง signal handler (ทำได้เฉพาะ main thread) โดยเรียก handler เดิมต่อ"""
+        if threading.current_thread() is not threading.main_thread():
+            return self
+        for signum in signals:
+            previous = signal.getsignal(signum)
+
+            def handle(received, frame, previous=previous):
+                self.begin(signal.Signals(received).name)
+                if callable(previous):
+                    previous(received, frame)
+                elif previous != signal.SIG_IGN:
+                    self.wait()
+                    raise SystemExit(0)
+            signal.signal(signum, handle)
+        return self
+
+    def status(self):
+        return {
+            "draining": self.draining,
+            "inflight": self._inflight,
+            "reason": self.reason,
+            "phases_ms": dict(self.timings_ms),
+            "flush_ms": dict(self.flush_ms),
+            "abandoned": self.abandoned,
+            "errors": dict(self.errors),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="เครื่องมือ session snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    inspect = sub.add_parser("inspect", help="ดูเนื้อหาไฟล์ snapshot")
+    inspect.add_argument("path")
+    args = parser.parse_args(argv)
+
+    payload = SessionSnapshot(args.path).read()
+    age = time.time() - payload["saved_at"]
+    print(f"{args.path}: {os.path.getsize(args.path):,} bytes, เขียนเมื่อ {age:.0f}s ก่อน")
+    for name, data in payload["namespaces"].items():
+        print(f"  {name}: {len(data):,} session")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
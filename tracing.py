@@ -0,0 +1,411 @@
+"""
+Tracing แบบเบา ๆ สำหรับดูว่าเวลาของแต่ละ webhook หมดไปกับขั้นไหน
+(parse → dispatch → compute → build → reply)
+
+- 1 request = 1 trace, trace id ได้จาก webhookEventId ตัวแรก (ULID 128 bit → hex 32 ตัวตรง ๆ)
+  และเก็บ webhookEventId ทุกตัวไว้ใน trace เพื่อค้นย้อนกลับได้
+- head sampling: สุ่มตัดสินใจตอนเริ่ม trace (TRACE_SAMPLE_RATE)
+  tail sampling: บันทึกทุก trace แต่ส่งออกเฉพาะที่ช้ากว่า threshold หรือมี error (TRACE_TAIL_MS)
+- span ที่ไม่ได้ถูก sample เป็น object no-op ตัวเดียวกันทั้งหมด จึงแทบไม่มี overhead
+- exporter ทำงานใน background thread เขียนเป็น JSONL หรือ OTLP/JSON (ExportTraceServiceRequest ต่อบรรทัด)
+    python tracing.py bench    # วัด overhead ต่อ span
+"""
+import hashlib
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+
+_CROCKFORD = {c: i for i, c in enumerate("0123456789ABCDEFGHJKMNPQRSTVWXYZ")}
+
+
+def trace_id_for(webhook_event_id):
+    digits = [_CROCKFORD.get(c) for c in webhook_event_id.upper()]
+    if len(digits) != 26 or None in digits:
+        return hashlib.sha256(webhook_event_id.encode()).hexdigest()[:32]
+    value = 0
+    for digit in digits:
+        value = value * 32 + digit
+    return f"{value & ((1 << 128) - 1):032x}"
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "stack", "sampled", "event_ids", "wall_offset_ns", "root")
+
+    def __init__(self, sampled):
+        self.trace_id = None
+        self.spans = []
+        self.stack = []
+        self.sampled = sampled
+        self.event_ids = []
+        # แปลง perf_counter_ns เป็นเวลา unix ตอน export
+        self.wall_offset_ns = time.time_ns() - time.perf_counter_ns()
+        self.root = self
+
+    def branch(self):
+        """มุมมองของ trace เดียวกันสำหรับ thread อื่น: ใช้ spans ร่วมกันแต่มี stack ของตัวเอง"""
+        branch = Trace.__new__(Trace)
+        branch.root = self.root
+        branch.trace_id = None
+        branch.spans = self.spans
+        branch.stack = self.stack[-1:]
+        branch.sampled = self.sampled
+        branch.event_ids = self.event_ids
+        branch.wall_offset_ns = self.wall_offset_ns
+        return branch
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = random.getrandbits(64) or 1
+        self.attributes = attributes
+        self.error = None
+
+    def __enter__(self):
+        stack = self.trace.stack
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        trace = self.trace
+        trace.stack.pop()
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        trace.spans.append(self)
+        return False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class _RootSpan(Span):
+    __slots__ = ("tracer",)
+
+    def __exit__(self, exc_type, exc, tb):
+        Span.__exit__(self, exc_type, exc, tb)
+        self.tracer._finish(self.trace, self)
+        return False
+
+
+class _TraceLocal(threading.local):
+    trace = None  # ค่าเริ่มต้นระดับ class: thread ใหม่ไม่ต้องผ่าน AttributeError
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_rate=1.0, tail_threshold_ms=None):
+        self.exporter = exporter
+        self.sample_rate = sample_rate if exporter is not None else 0.0
+        self.tail_threshold_ns = None
+        if exporter is not None and tail_threshold_ms is not None:
+            self.tail_threshold_ns = int(tail_threshold_ms * 1_000_000)
+        self._local = _TraceLocal()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.tail_threshold_ns is not None
+
+    def trace(self, name, **attributes):
+        """เริ่ม trace ใหม่ (root span) ใน thread นี้"""
+        if self.exporter is None:
+            return NOOP_SPAN
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        if not sampled and self.tail_threshold_ns is None:
+            self._local.trace = None
+            return NOOP_SPAN
+        trace = Trace(sampled)
+        self._local.trace = trace
+        root = _RootSpan(trace, name, attributes)
+        root.tracer = self
+        return root
+
+    def span(self, name, **attributes):
+        trace = self._local.trace
+        if trace is None:
+            return NOOP_SPAN
+        return Span(trace, name, attributes)
+
+    def tag_event(self, webhook_event_id):
+        trace = self._local.trace
+        if trace is None or not webhook_event_id:
+            return
+        root = trace.root
+        if root.trace_id is None:
+            root.trace_id = trace_id_for(webhook_event_id)
+        trace.event_ids.append(webhook_event_id)
+
+    def _finish(self, trace, root):
+        self._local.trace = None
+        keep = trace.sampled
+        if not keep and self.tail_threshold_ns is not None:
+            keep = (root.end_ns - root.start_ns >= self.tail_threshold_ns
+                    or any(span.error for span in trace.spans))
+        if keep:
+            if trace.trace_id is None:
+                trace.trace_id = f"{random.getrandbits(128):032x}"
+            self.exporter.export(trace)
+
+    def current(self):
+        return self._local.trace
+
+    def attach(self, trace, func):
+        """คืน func ที่เมื่อรันใน thread อื่นจะบันทึก span ต่อเข้า trace เดิม (ใช้กับ worker pool)"""
+        if trace is None:
+            return func
+        local = self._local
+
+        def run(*args, **kwargs):
+            previous = local.trace
+            local.trace = trace.branch()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                local.trace = previous
+        return run
+
+    # ---------- helper สำหรับ instrument ส่วนต่าง ๆ ของ bot ----------
+
+    def event_handler(self, name):
+        """decorator สำหรับ handler ของ WebhookHandler: span ต่อ event ผูกกับ webhookEventId"""
+        def decorate(func):
+            def wrapper(event, *args):
+                event_id = getattr(event, "webhook_event_id", None)
+                self.tag_event(event_id)
+                with self.span(name, webhook_event_id=event_id):
+                    return func(event)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            wrapper.__wrapped__ = func
+            return wrapper
+        return decorate
+
+
+class TracedParser:
+    """ครอบ WebhookParser ของ handler ให้มี span 'parse' (ตรวจ signature + แปลง JSON เป็น model)"""
+
+    def __init__(self, parser, tracer):
+        self._parser = parser
+        self._tracer = tracer
+
+    def parse(self, body, signature, as_payload=False):
+        with self._tracer.span("parse", body_bytes=len(body)):
+            return self._parser.parse(body, signature, as_payload=as_payload)
+
+
+class TracedApi:
+    """ครอบ MessagingApi ให้ทุกการเรียก LINE API มี span ของตัวเอง"""
+
+    def __init__(self, api, tracer):
+        self._api = api
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        tracer = self._tracer
+        span_name = f"line.{name}"
+
+        def call(*args, **kwargs):
+            with tracer.span(span_name):
+                return attr(*args, **kwargs)
+        return call
+
+
+# ---------- exporter ----------
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileExporter:
+    def __init__(self, path, fmt="jsonl", service_name="line-drug-bot",
+                 batch_size=128, flush_interval=1.0, max_queue=10000):
+        if fmt not in ("jsonl", "otlp"):
+            raise ValueError(f"unknown trace format: {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.exported = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def encode(self, trace):
+        offset = trace.wall_offset_ns
+        spans = sorted(trace.spans, key=lambda s: s.start_ns)
+        if self.fmt == "jsonl":
+            return {
+                "trace_id": trace.trace_id,
+                "webhook_event_ids": trace.event_ids,
+                "start": (spans[0].start_ns + offset) / 1e9,
+                "spans": [
+                    {
+                        "name": s.name,
+                        "id": f"{s.span_id:016x}",
+                        "parent": f"{s.parent_id:016x}" if s.parent_id else None,
+                        "offset_us": (s.start_ns - spans[0].start_ns) // 1000,
+                        "duration_us": (s.end_ns - s.start_ns) // 1000,
+                        **({"attributes": s.attributes} if s.attributes else {}),
+                        **({"error": s.error} if s.error else {}),
+                    }
+                    for s in spans
+                ],
+            }
+
+        otlp_spans = []
+        for s in spans:
+            attributes = dict(s.attributes)
+            if s.parent_id is None and trace.event_ids:
+                attributes["line.webhook_event_ids"] = ",".join(trace.event_ids)
+            otlp_span = {
+                "traceId": trace.trace_id,
+                "spanId": f"{s.span_id:016x}",
+                "name": s.name,
+                "kind": 2 if s.parent_id is None else 1,  # SERVER / INTERNAL
+                "startTimeUnixNano": str(s.start_ns + offset),
+                "endTimeUnixNano": str(s.end_ns + offset),
+                "attributes": [
+                    {"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None
+                ],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id is not None:
+                otlp_span["parentSpanId"] = f"{s.parent_id:016x}"
+            otlp_spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+            }]
+        }
+
+    def _write(self, batch):
+        data = "".join(json.dumps(self.encode(t), ensure_ascii=False, default=str) + "\n" for t in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+        self.exported += len(batch)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed.is_set():
+                    break
+                continue
+            if first is None:
+                break
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    trace = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if trace is None:
+                    stop = True
+                    break
+                batch.append(trace)
+            try:
+                self._write(batch)
+            except Exception as e:
+                logging.info(f"❌ เขียน trace ไม่สำเร็จ ({len(batch)} รายการ): {e}")
+            if stop:
+                break
+
+    def close(self, timeout=5):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+
+# ---------- benchmark ----------
+
+class _NullExporter:
+    def export(self, trace):
+        pass
+
+
+def bench(iterations=200000, spans_per_trace=5):
+    """วัด overhead ต่อ span (ns) ในแต่ละโหมด เทียบกับ loop เปล่า"""
+    def run(tracer):
+        traces = iterations // spans_per_trace
+        started = time.perf_counter_ns()
+        for _ in range(traces):
+            with tracer.trace("root"):
+                for _ in range(spans_per_trace - 1):
+                    with tracer.span("child", k=1):
+                        pass
+        return (time.perf_counter_ns() - started) / (traces * spans_per_trace)
+
+    def baseline():
+        traces = iterations // spans_per_trace
+        started = time.perf_counter_ns()
+        for _ in range(traces):
+            for _ in range(spans_per_trace):
+                pass
+        return (time.perf_counter_ns() - started) / (traces * spans_per_trace)
+
+    base = baseline()
+    results = {
+        "disabled": run(Tracer()),
+        "head 1%": run(Tracer(_NullExporter(), sample_rate=0.01)),
+        "head 100%": run(Tracer(_NullExporter(), sample_rate=1.0)),
+        "tail only": run(Tracer(_NullExporter(), sample_rate=0.0, tail_threshold_ms=1000)),
+    }
+    return {name: round(ns - base, 1) for name, ns in results.items()}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["bench"]:
+        for name, ns in bench().items():
+            sys.stdout.write(f"{name:>10}: {ns:8.1f} ns/span\n")
+    else:
+        sys.stdout.write("usage: python tracing.py bench\n")
@@ -0,0 +1,285 @@
+"""
+บันทึก webhook traffic จริง (ปิดตัวตนแล้ว) และ replay เพื่อวางแผน capacity
+
+- callback() เรียก TrafficRecorder.record() หลังตรวจ signature ผ่าน → enqueue แบบไม่ block
+  แล้วเขียนเป็น JSONL บีบอัด gzip แบบ append-only (ใช้ writer เดียวกับ audit log)
+- userId/groupId/roomId ถูกแทนด้วย pseudonym คงที่ (HMAC ด้วย salt) ตัด replyToken, message id
+  และ quoteToken ทิ้ง เก็บเฉพาะข้อความและเวลาที่ได้รับ
+- replay: เซ็น body ใหม่แล้วยิงเข้า instance ในเครื่องตามจังหวะเวลาเดิม เร็วขึ้น 1×/10×/100×
+  โดยใช้ MessagingApi ปลอม แล้วสรุป latency percentile, error rate และการเติบโตของ session
+    python traffic.py replay TRAFFIC_DIR --speed 10
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from audit import AuditLog, iter_records
+
+FILE_PREFIX = "traffic-"
+SOURCE_ID_KEYS = ("userId", "groupId", "roomId")
+
+
+def pseudonymize(source_id, salt):
+    # คงรูปแบบ U + hex 32 ตัวแบบ LINE user id เพื่อให้ replay ผ่าน parser ได้
+    digest = hmac.new(salt.encode(), source_id.encode(), hashlib.sha256).hexdigest()
+    return source_id[:1] + digest[:32]
+
+
+def anonymize_event(event, salt):
+    event = dict(event)
+    event.pop("replyToken", None)
+    source = event.get("source")
+    if source:
+        event["source"] = {
+            k: pseudonymize(v, salt) if k in SOURCE_ID_KEYS and v else v
+            for k, v in source.items()
+        }
+    message = event.get("message")
+    if message:
+        kept = {"type": message.get("type")}
+        if message.get("type") == "text":
+            kept["text"] = message.get("text", "")
+        event["message"] = kept
+    return event
+
+
+class TrafficRecorder:
+    def __init__(self, directory, salt=""):
+        self.salt = salt
+        self._log = AuditLog(directory, prefix=FILE_PREFIX)
+
+    def record(self, body, received_at=None):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return
+        events = [anonymize_event(e, self.salt) for e in payload.get("events", [])]
+        if not events:
+            return  # webhook verify ที่ไม่มี event ไม่ต้องเก็บ
+        self._log.record({"ts": received_at or time.time(), "events": events})
+
+    def close(self):
+        self._log.close()
+
+
+# ---------- replay ----------
+
+class StubMessagingApi:
+    """MessagingApi ปลอม: นับจำนวนการเรียก และหน่วงเวลาเลียนแบบ LINE API ได้"""
+
+    def __init__(self, latency_sec=0.0):
+        self.latency_sec = latency_sec
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reply_message(self, *args, **kwargs):
+        self._call("reply_message")
+
+    def push_message(self, *args, **kwargs):
+        self._call("push_message")
+
+    def multicast(self, *args, **kwargs):
+        self._call("multicast")
+
+
+def sign_body(body, channel_secret):
+    digest = hmac.new(channel_secret.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def build_body(record, sequence):
+    events = []
+    for i, event in enumerate(record["events"]):
+        event = dict(event)
+        if event.get("type") in ("message", "postback", "follow", "join"):
+            event["replyToken"] = f"replay{sequence:010d}{i:02d}"
+        message = event.get("message")
+        if message:
+            event["message"] = {"id": f"{sequence}{i:02d}", "quoteToken": "replay", **message}
+        events.append(event)
+    return json.dumps({"destination": "Ureplay", "events": events}, ensure_ascii=False)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Replayer:
+    def __init__(self, url, channel_secret, speed=1.0, workers=32, timeout=10,
+                 probe=None, probe_interval=1.0):
+        self.url = url
+        self.channel_secret = channel_secret
+        self.speed = speed
+        self.workers = workers
+        self.timeout = timeout
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.max_lag = 0.0
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def _send(self, body):
+        request = urllib.request.Request(
+            self.url,
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Line-Signature": sign_body(body, self.channel_secret)},
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status != 200:
+                self.errors += 1
+
+    def _sample(self, stop):
+        started = time.monotonic()
+        while True:
+            self.samples.append((time.monotonic() - started, self.probe()))
+            if stop.wait(self.probe_interval):
+                break
+        self.samples.append((time.monotonic() - started, self.probe()))
+
+    def run(self, records):
+        stop = threading.Event()
+        sampler = None
+        if self.probe is not None:
+            sampler = threading.Thread(target=self._sample, args=(stop,), daemon=True)
+            sampler.start()
+
+        started = time.monotonic()
+        first_ts = None
+        sent = 0
+        with ThreadPoolExecutor(self.workers) as pool:
+            for record in records:
+                if first_ts is None:
+                    first_ts = record["ts"]
+                due = started + (record["ts"] - first_ts) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                pool.submit(self._send, build_body(record, sent))
+                sent += 1
+        self.duration = time.monotonic() - started
+
+        if sampler is not None:
+            stop.set()
+            sampler.join()
+        return self.report(sent)
+
+    def report(self, sent):
+        latencies = sorted(self.latencies)
+        report = {
+            "requests": sent,
+            "duration_sec": round(self.duration, 3),
+            "throughput_rps": round(sent / self.duration, 1) if self.duration else 0.0,
+            "error_rate": round(self.errors / sent, 4) if sent else 0.0,
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+            "latency_ms": {
+                f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 90, 95, 99)
+            },
+            "max_schedule_lag_ms": round(self.max_lag * 1000, 2),
+        }
+        if latencies:
+            report["latency_ms"]["max"] = round(latencies[-1] * 1000, 2)
+        if self.samples:
+            first, last = self.samples[0][1], self.samples[-1][1]
+            report["sessions"] = {
+                name: {
+                    "start": first[name],
+                    "end": last[name],
+                    "peak": max(sample[name] for _, sample in self.samples),
+                }
+                for name in first
+            }
+        return report
+
+
+def start_local_instance(api_latency_sec):
+    """เปิด app.py ใน process นี้ (MessagingApi ปลอม) บน port ว่าง คืน (url, probe, stub)"""
+    from werkzeug.serving import make_server
+    import app as bot
+
+    stub = StubMessagingApi(api_latency_sec)
+    bot.messaging_api = stub
+    server = make_server("127.0.0.1", 0, bot.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="replay-server", daemon=True).start()
+
+    def probe():
+        return {
+            "user_sessions": len(bot.user_sessions),
+            "user_drug_selection": len(bot.user_drug_selection),
+            "user_ages": len(bot.user_ages),
+            "user_inr_followups": len(bot.user_inr_followups),
+        }
+
+    return f"http://127.0.0.1:{server.server_port}/callback", probe, stub
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="replay webhook traffic ที่บันทึกไว้")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("replay")
+    r.add_argument("directory")
+    r.add_argument("--speed", type=float, default=1.0, help="ตัวคูณความเร็ว เช่น 1, 10, 100")
+    r.add_argument("--since", help="ISO date/time เช่น 2026-01-01")
+    r.add_argument("--until", help="ISO date/time (ไม่รวม)")
+    r.add_argument("--url", help="ยิงไปที่ instance ที่รันอยู่แล้ว (ค่าเริ่มต้น: เปิด app.py ใน process นี้)")
+    r.add_argument("--secret", help="channel secret สำหรับเซ็น body (ค่าเริ่มต้น: LINE_CHANNEL_SECRET)")
+    r.add_argument("--workers", type=int, default=32)
+    r.add_argument("--api-latency-ms", type=float, default=0.0, help="หน่วงเวลาของ MessagingApi ปลอม")
+    r.add_argument("--no-rate-limit", action="store_true", help="ปิด rate limit ของ instance ในเครื่อง")
+    args = parser.parse_args(argv)
+
+    secret = args.secret or os.environ.get("LINE_CHANNEL_SECRET") or "replay-secret"
+    probe = None
+    stub = None
+    url = args.url
+    if url is None:
+        os.environ["LINE_CHANNEL_SECRET"] = secret
+        os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "replay")
+        if args.no_rate_limit:
+            os.environ["RATE_LIMIT_ENABLED"] = "0"
+        url, probe, stub = start_local_instance(args.api_latency_ms / 1000)
+
+    replayer = Replayer(url, secret, speed=args.speed, workers=args.workers, probe=probe)
+    records = iter_records(args.directory, args.since, args.until, prefix=FILE_PREFIX)
+    report = replayer.run(records)
+    if stub is not None:
+        report["api_calls"] = stub.calls
+    sys.stdout.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
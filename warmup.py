@@ -0,0 +1,113 @@
+"""
+warm-up ตอนเริ่ม process และ readiness probe (/ready) ให้ load balancer ส่ง traffic มาเมื่อพร้อมจริงเท่านั้น
+
+- Warmup รันแต่ละ phase ตามลำดับ (คำนวณทุกยา/ข้อบ่งใช้, สร้างทุกเมนู, เปิด connection ไป LINE, เทียบ golden)
+  จับเวลาแต่ละ phase และรวม phase ใดล้มเหลว → state = failed และ /ready ตอบ 503 ต่อไป
+- phase ที่ทำเครื่องหมาย required=False (เช่น เปิด connection ไป LINE) ล้มเหลวได้โดยไม่ทำให้ไม่พร้อม แต่บันทึก error ไว้
+- CaptureApi ครอบ messaging_api: ระหว่าง capture() ข้อความที่ reply/push ใน thread นั้นถูกเก็บไว้
+  (และ serialize เป็น JSON เหมือนตอนส่งจริง) แทนการส่งไป LINE จึงเรียกฟังก์ชันสร้างเมนูตัวจริงได้ตอน warm-up
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+
+class CaptureApi:
+    def __init__(self, api):
+        self._api = api
+        self._local = threading.local()
+
+    @contextmanager
+    def capture(self):
+        sent = []
+        self._local.sent = sent
+        try:
+            yield sent
+        finally:
+            self._local.sent = None
+
+    def _record(self, name, request, *args, **kwargs):
+        sent = getattr(self._local, "sent", None)
+        if sent is None:
+            return getattr(self._api, name)(request, *args, **kwargs)
+        request.to_json()  # serialize แบบเดียวกับตอนส่งจริง (ตรวจ model และ warm-up pydantic)
+        sent.append(request)
+
+    def reply_message(self, request, *args, **kwargs):
+        return self._record("reply_message", request, *args, **kwargs)
+
+    def push_message(self, request, *args, **kwargs):
+        return self._record("push_message", request, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+
+class Warmup:
+    def __init__(self):
+        self.phases = []
+        self.state = PENDING
+        self.timings_ms = {}
+        self.counts = {}
+        self.errors = {}
+        self.total_ms = None
+        self.started_at = None
+        self._thread = None
+
+    def phase(self, name, required=True):
+        """decorator: ลงทะเบียน phase (ฟังก์ชันคืนจำนวนงานที่ทำ หรือ None)"""
+        def register(func):
+            self.phases.append((name, func, required))
+            return func
+        return register
+
+    def run(self):
+        self.state = RUNNING
+        self.started_at = time.time()
+        started = time.perf_counter()
+        failed = False
+        for name, func, required in self.phases:
+            phase_started = time.perf_counter()
+            try:
+                self.counts[name] = func()
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                failed = failed or required
+                logging.info(f"❌ warm-up {name} ล้มเหลว: {e}")
+            self.timings_ms[name] = round((time.perf_counter() - phase_started) * 1000, 1)
+        self.total_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.state = FAILED if failed else READY
+        logging.info(f"🔥 warm-up {self.state} ใน {self.total_ms:.0f} ms {self.timings_ms}")
+        return self.state == READY
+
+    def start(self):
+        """รันใน background thread (process รับ /ready และ health check ได้ระหว่างนั้น)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state == READY
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def status(self):
+        return {
+            "state": self.state,
+            "started_at": self.started_at,
+            "total_ms": self.total_ms,
+            "phases_ms": dict(self.timings_ms),
+            "counts": dict(self.counts),
+            "errors": dict(self.errors),
+        }